@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# encoding: UTF-8
+
+"""Measures the time taken for a program to generate and check the proof
+that repeats eg/example.maxixe many times over (see `proofs.example_proof`)
+in two ways: by writing out its text and parsing it with a Checker, and by
+building it with a ProofBuilder, which checks each step as it is added.
+
+    python bench/builder.py [number-of-copies]
+
+"""
+
+from os.path import realpath, dirname, join
+import sys
+import time
+
+sys.path.insert(0, join(dirname(realpath(sys.argv[0])), '..', 'src'))
+
+from maxixe.builder import ProofBuilder
+from maxixe.checker import Checker
+from maxixe.parser import Parser
+from maxixe.terms import Term, Var
+
+from proofs import example_proof
+
+
+def by_text(copies):
+    Parser(example_proof(copies)).proof(checker=Checker())
+
+
+def by_builder(copies):
+    (P, Q) = (Var('P'), Var('Q'))
+    b = ProofBuilder()
+    b.rule('Modus_Ponens', [Term('impl', [P, Q]), P], Q)
+    b.rule('Simplification', [Term('and', [P, Q])], Q)
+    b.rule('Conjunction', [P, Q], Term('and', [P, Q]))
+    b.rule('Commutativity_of_Conjunction', [Term('and', [P, Q])], Term('and', [Q, P]))
+    for n in range(copies):
+        (p, q) = (Term('p%d' % n), Term('q%d' % n))
+        b.rule('Premise_%d' % n, [], Term('and', [p, Term('impl', [p, q])]))
+    b.show(Term('q%d' % (copies - 1)))
+    for n in range(copies):
+        (p, q) = (Term('p%d' % n), Term('q%d' % n))
+        impl = Term('impl', [p, q])
+        s = 'Step_%d_' % n
+        b.add_step(s + '1', Term('and', [p, impl]), 'Premise_%d' % n)
+        b.add_step(s + '2', Term('and', [impl, p]), 'Commutativity_of_Conjunction', [s + '1'])
+        b.add_step(s + '3', impl, 'Simplification', [s + '1'])
+        b.add_step(s + '4', p, 'Simplification', [s + '2'])
+        b.add_step(s + '5', q, 'Modus_Ponens', [s + '3', s + '4'])
+    b.qed()
+
+
+def best_of(runs, f):
+    best = None
+    for run in range(runs):
+        started = time.time()
+        f()
+        elapsed = time.time() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(args):
+    copies = int(args[0]) if args else 20000
+    steps = copies * 5
+    for (name, f) in (("writing and parsing text", by_text), ("ProofBuilder", by_builder)):
+        elapsed = best_of(3, lambda: f(copies))
+        print("%d steps, %s: %.3fs (%.0f steps/sec)" % (steps, name, elapsed, steps / elapsed))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
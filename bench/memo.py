@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# encoding: UTF-8
+
+"""Measures the time taken to check a batch of mechanically generated proofs
+in one process, with and without an InstanceCache shared by all of them.
+Each proof cites a rule with a substitution in its conclusion, with the
+same arguments, several times, as a batch of proofs which all use the same
+lemma of a library on the same premises would.
+
+    python bench/memo.py [number-of-proofs [uses-per-proof [term-depth]]]
+
+"""
+
+from os.path import realpath, dirname, join
+import sys
+import time
+
+sys.path.insert(0, join(dirname(realpath(sys.argv[0])), '..', 'src'))
+
+from maxixe.cache import InstanceCache
+from maxixe.checker import Checker
+from maxixe.parser import Parser
+
+
+def tree(depth, leaf):
+    term = leaf
+    for n in range(depth):
+        term = 'f(%s, g(%s))' % (term, leaf)
+    return term
+
+
+def memo_proof(n, uses, depth):
+    lines = [
+        "given",
+        "    Instantiate = all(X, P) ; T{term} |- P[X -> T]",
+        "    Premise     = |- all(x, %s)" % tree(depth, 'x'),
+        "show",
+        "    %s" % tree(depth, 'c'),
+        "proof",
+        "    S0 = all(x, %s) by Premise" % tree(depth, 'x'),
+    ]
+    for i in range(1, uses + 1):
+        lines.append("    S%d = %s by Instantiate with S0, c" % (i, tree(depth, 'c')))
+    lines.append("qed")
+    return '\n'.join(lines) + '\n'
+
+
+def check_all(proofs, instances):
+    started = time.time()
+    for proof in proofs:
+        Checker(proof, instances=instances).check()
+    return time.time() - started
+
+
+def main(args):
+    count = int(args[0]) if len(args) > 0 else 200
+    uses = int(args[1]) if len(args) > 1 else 20
+    depth = int(args[2]) if len(args) > 2 else 200
+    proofs = [Parser(memo_proof(n, uses, depth)).proof() for n in range(count)]
+    without = min([check_all(proofs, None) for run in range(3)])
+    print("%d proofs, %d uses each, without an instance cache: %.3fs" % (count, uses, without))
+    for run in range(3):
+        instances = InstanceCache()
+        elapsed = check_all(proofs, instances)
+    print("%d proofs, %d uses each, with a shared instance cache: %.3fs" % (count, uses, elapsed))
+    instances.report(sys.stdout)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
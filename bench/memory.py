@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+# encoding: UTF-8
+
+"""Measures how many bytes the parsed AST of a large, mechanically generated
+proof occupies per step.  Requires Python 3 (for `tracemalloc`).
+
+    python bench/memory.py [number-of-steps]
+
+"""
+
+from os.path import realpath, dirname, join
+import sys
+import tracemalloc
+
+sys.path.insert(0, join(dirname(realpath(sys.argv[0])), '..', 'src'))
+
+from maxixe.parser import Parser
+
+from proofs import chain_proof
+
+
+def main(args):
+    steps = int(args[0]) if args else 100000
+    text = chain_proof(steps)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    proof = Parser(text).proof()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    size = after - before
+    print("%d steps: %d bytes, %.1f bytes/step" % (len(proof.step_map), size, float(size) / len(proof.step_map)))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# encoding: UTF-8
+
+"""Measures how the time taken to parse terms written with infix operators
+changes with the number of operators which have been declared, on
+mechanically generated proofs.  Each proof has the same number of steps,
+each with a term of the same size, written with as many of the declared
+operators as it has room for; the operators are all of different
+precedences, and alternately left- and right-associative.
+
+    python bench/operators.py [number-of-steps]
+
+"""
+
+from os.path import realpath, dirname, join
+import sys
+import time
+
+sys.path.insert(0, join(dirname(realpath(sys.argv[0])), '..', 'src'))
+
+from maxixe.parser import Parser
+from maxixe.scanner import Scanner
+
+
+COUNTS = (1, 4, 16, 64, 256)
+OPERANDS = 32
+
+
+def operator_proof(operators, steps):
+    lines = ['given']
+    for i in range(operators):
+        lines.append('    operator "@%d" op%d %d %s' % (i, i, i + 1, 'left' if i % 2 == 0 else 'right'))
+    terms = []
+    for n in range(steps):
+        parts = ['a0']
+        for j in range(1, OPERANDS):
+            parts.append('@%d' % (j % operators))
+            parts.append('a%d' % j)
+        parts.append('@0')
+        parts.append('b%d' % n)
+        terms.append(' '.join(parts))
+    for (n, term) in enumerate(terms):
+        lines.append('    P%d = |- %s' % (n, term))
+    lines.append('show')
+    lines.append('    ' + terms[-1])
+    lines.append('proof')
+    for (n, term) in enumerate(terms):
+        lines.append('    S%d = %s by P%d' % (n, term, n))
+    lines.append('qed')
+    return '\n'.join(lines) + '\n'
+
+
+def count_tokens(text, operators):
+    scanner = Scanner(text)
+    for i in range(operators):
+        scanner.symbols.declare('@%d' % i)
+    count = 0
+    while scanner.type != 'EOF':
+        scanner.scan()
+        count += 1
+    return count
+
+
+def best_time(text, runs=3):
+    best = None
+    for run in range(runs):
+        started = time.time()
+        Parser(text).proof()
+        elapsed = time.time() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(args):
+    steps = int(args[0]) if args else 2000
+    best_time(operator_proof(1, steps))
+    for operators in COUNTS:
+        text = operator_proof(operators, steps)
+        # the time taken to read the declarations themselves (which each
+        # build a new regular expression for the scanner) is measured apart
+        declaring = best_time(operator_proof(operators, 1))
+        count = count_tokens(text, operators)
+        parsing = best_time(text) - declaring
+        print("%4d operators: declared in %.3fs; %d tokens in %.3fs: %.2f usec/token" % (
+            operators, declaring, count, parsing, parsing * 1e6 / count
+        ))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,229 @@
+# encoding: UTF-8
+
+"""Mechanically generated proofs, for benchmarking."""
+
+
+def chain_proof(steps):
+    """Returns the text of a valid proof with the given number of steps
+    (plus one premise), each one citing the step before it.
+
+    """
+    lines = [
+        "given",
+        "    Premise      =              |- and(p, impl(p, q))",
+        "    Commutative  = and(P, Q)    |- and(Q, P)",
+        "show",
+        "    %s" % ("and(p, impl(p, q))" if steps % 2 == 0 else "and(impl(p, q), p)"),
+        "proof",
+        "    Step_0 = and(p, impl(p, q))   by Premise",
+    ]
+    for n in range(1, steps + 1):
+        term = "and(p, impl(p, q))" if n % 2 == 0 else "and(impl(p, q), p)"
+        lines.append("    // step %d" % n)
+        lines.append("    Step_%d = %s   by Commutative with Step_%d" % (n, term, n - 1))
+    lines.append("qed")
+    return '\n'.join(lines) + '\n'
+
+
+def example_proof(copies):
+    """Returns the text of a proof which repeats the proof in
+    eg/example.maxixe the given number of times, each time with its own
+    atoms (and with a premise of its own), so that it consists mostly of
+    rule applications with two hypotheses.
+
+    """
+    lines = [
+        "given",
+        "    Modus_Ponens                 = impl(P, Q)    ; P           |- Q",
+        "    Simplification               = and(P, Q)                   |- Q",
+        "    Conjunction                  = P             ; Q           |- and(P, Q)",
+        "    Commutativity_of_Conjunction = and(P, Q)                   |- and(Q, P)",
+    ]
+    for n in range(copies):
+        lines.append("    Premise_%d = |- and(p%d, impl(p%d, q%d))" % (n, n, n, n))
+    lines.append("show")
+    lines.append("    q%d" % (copies - 1))
+    lines.append("proof")
+    for n in range(copies):
+        lines.extend([
+            "    Step_%d_1 = and(p%d, impl(p%d, q%d))  by Premise_%d" % (n, n, n, n, n),
+            "    Step_%d_2 = and(impl(p%d, q%d), p%d)  by Commutativity_of_Conjunction with Step_%d_1" % (n, n, n, n, n),
+            "    Step_%d_3 = impl(p%d, q%d)            by Simplification with Step_%d_1" % (n, n, n, n),
+            "    Step_%d_4 = p%d                       by Simplification with Step_%d_2" % (n, n, n),
+            "    Step_%d_5 = q%d                       by Modus_Ponens with Step_%d_3, Step_%d_4" % (n, n, n, n),
+        ])
+    lines.append("qed")
+    return '\n'.join(lines) + '\n'
+
+
+class ProofGenerator(object):
+    """Generates the text of a valid proof whose shape is given by parameters:
+
+    *   `chain`: the number of steps in each chain of steps (rounded up to an
+        even number, as each rule application is followed by one undoing it);
+    *   `depth` and `width`: the depth of the premise's term, and the number
+        of subterms each of its non-atomic subterms has;
+    *   `nesting` and `cases`: the depth to which blocks are nested, and the
+        number of cases each block has (each case contains either a chain,
+        or, if not at the innermost level, a block);
+    *   `repeat`: the number of times all this is repeated;
+    *   `rules`: the number of pairs of (otherwise equivalent) rules that
+        wrap and unwrap terms, which the chains cycle through;
+    *   `attributes`: whether the chains also apply rules with `{term}`,
+        `{atom}`, `{nonlocal}` and `{unique}` hypotheses (blocks always
+        introduce `{local}` atoms);
+    *   `substs`: whether the chains also apply a rule whose conclusion
+        has a substitution, `P[X -> Y]`;
+    *   `sugar`: whether the premise's term uses `and` and `or` (written
+        infix, for SugaredParser) instead of `f`.
+
+    """
+    def __init__(self, chain=100, depth=2, width=2, nesting=0, cases=1, repeat=1,
+                 rules=2, attributes=True, substs=True, sugar=False):
+        self.chain = chain
+        self.depth = depth
+        self.width = 2 if sugar else width
+        self.nesting = nesting
+        self.cases = cases
+        self.repeat = repeat
+        self.rules = rules
+        self.sugar = sugar
+        self.ops = [('wrap', n) for n in range(rules)]
+        if attributes:
+            self.ops.extend([('pair', None), ('tag', None), ('fresh', None)])
+        if substs:
+            self.ops.append(('rename', None))
+        if not self.ops:
+            raise ValueError("there must be at least one rule to apply in a chain")
+        self.lines = []
+        self.counter = 0
+
+    def fresh(self, prefix):
+        self.counter += 1
+        return '%s%d' % (prefix, self.counter)
+
+    def premise_term(self):
+        leaves = []
+
+        def build(depth, level):
+            if depth == 0:
+                leaves.append(None)
+                return ('a%d' % len(leaves),)
+            if self.sugar:
+                constructor = 'and' if level % 2 == 0 else 'or'
+            else:
+                constructor = 'f'
+            return (constructor,) + tuple(build(depth - 1, level + 1) for n in range(self.width))
+
+        return build(self.depth, 0)
+
+    def render(self, term):
+        if len(term) == 1:
+            return term[0]
+        if self.sugar and len(term) == 3 and term[0] in ('and', 'or'):
+            (left_ops, right_ops, symbol) = {
+                'and': (('and',), (), u'∧'),
+                'or': (('or', 'and'), ('and',), u'∨'),
+            }[term[0]]
+            return u'%s %s %s' % (
+                self.render_operand(term[1], left_ops), symbol, self.render_operand(term[2], right_ops)
+            )
+        return u'%s(%s)' % (term[0], u', '.join([self.render(t) for t in term[1:]]))
+
+    def render_operand(self, term, allowed):
+        if len(term) == 3 and term[0] in ('and', 'or') and term[0] not in allowed:
+            return u'%s(%s, %s)' % (term[0], self.render(term[1]), self.render(term[2]))
+        return self.render(term)
+
+    def replace(self, term, old, new):
+        if term == old:
+            return new
+        return (term[0],) + tuple(self.replace(t, old, new) for t in term[1:])
+
+    def step(self, indent, term, rule, with_=()):
+        name = self.fresh('S')
+        line = u'%s%s = %s   by %s' % ('    ' * indent, name, self.render(term), rule)
+        if with_:
+            line += u' with %s' % u', '.join(with_)
+        self.lines.append(line)
+        return name
+
+    def given(self):
+        lines = [u'given', u'    Premise    = |- %s' % self.render(self.premise_term())]
+        for n in range(self.rules):
+            lines.append(u'    Wrap_%d     = P |- w%d(P)' % (n, n))
+            lines.append(u'    Unwrap_%d   = w%d(P) |- P' % (n, n))
+        lines.extend([
+            u'    Pair       = P ; X{nonlocal term} |- pair(P, X)',
+            u'    Fst        = pair(P, X) |- P',
+            u'    Tag        = P ; X{atom} |- tag(P, X)',
+            u'    Fresh      = P ; X{atom unique} |- tag(P, X)',
+            u'    Untag      = tag(P, X) |- P',
+            u'    Rename     = P ; X{atom} ; Y{atom} |- P[X -> Y]',
+            u'    Conclude   = P |- P',
+            u'    block Cases',
+        ])
+        for n in range(self.cases):
+            lines.extend([
+                u'        case',
+                u'            Enter_%d = P ; X{local atom} |- in(P, X)' % n,
+                u'            Leave_%d = in(P, X) |- P' % n,
+                u'        end',
+            ])
+        lines.append(u'    end')
+        return lines
+
+    def chain_segment(self, indent, prev, term):
+        for n in range((self.chain + 1) // 2):
+            (op, arg) = self.ops[n % len(self.ops)]
+            if op == 'wrap':
+                s = self.step(indent, ('w%d' % arg, term), 'Wrap_%d' % arg, [prev])
+                prev = self.step(indent, term, 'Unwrap_%d' % arg, [s])
+            elif op == 'pair':
+                s = self.step(indent, ('pair', term, ('k',)), 'Pair', [prev, 'k'])
+                prev = self.step(indent, term, 'Fst', [s])
+            elif op == 'tag':
+                s = self.step(indent, ('tag', term, ('x',)), 'Tag', [prev, 'x'])
+                prev = self.step(indent, term, 'Untag', [s])
+            elif op == 'fresh':
+                atom = self.fresh('u')
+                s = self.step(indent, ('tag', term, (atom,)), 'Fresh', [prev, atom])
+                prev = self.step(indent, term, 'Untag', [s])
+            elif op == 'rename':
+                atom = self.fresh('z')
+                s = self.step(indent, self.replace(term, ('a1',), (atom,)), 'Rename', [prev, 'a1', atom])
+                prev = self.step(indent, term, 'Rename', [s, atom, 'a1'])
+        return prev
+
+    def segment(self, indent, nesting, prev, term):
+        if nesting == 0:
+            return self.chain_segment(indent, prev, term)
+        self.lines.append(u'%sblock Cases' % ('    ' * indent))
+        for n in range(self.cases):
+            self.lines.append(u'%s    case' % ('    ' * indent))
+            local = self.fresh('l')
+            inner = ('in', term, (local,))
+            s = self.step(indent + 2, inner, 'Enter_%d' % n, [prev, local])
+            s = self.segment(indent + 2, nesting - 1, s, inner)
+            last = self.step(indent + 2, term, 'Leave_%d' % n, [s])
+            self.lines.append(u'%s    end' % ('    ' * indent))
+        self.lines.append(u'%send' % ('    ' * indent))
+        return last
+
+    def text(self):
+        term = self.premise_term()
+        lines = self.given()
+        lines.extend([u'show', u'    %s' % self.render(term), u'proof'])
+        self.lines = lines
+        prev = self.step(1, term, 'Premise')
+        for n in range(self.repeat):
+            prev = self.segment(1, self.nesting, prev, term)
+        if self.nesting > 0:
+            # a proof cannot end with a block, only with a step
+            self.step(1, term, 'Conclude', [prev])
+        self.lines.append(u'qed')
+        return u'\n'.join(self.lines) + u'\n'
+
+
+def generate_proof(**kwargs):
+    return ProofGenerator(**kwargs).text()
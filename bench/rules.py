@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+# encoding: UTF-8
+
+"""Measures how many steps per second `Checker` can check, on a proof that
+repeats eg/example.maxixe many times over.  Parsing is not included.
+
+    python bench/rules.py [number-of-copies]
+
+"""
+
+from os.path import realpath, dirname, join
+import sys
+import time
+
+sys.path.insert(0, join(dirname(realpath(sys.argv[0])), '..', 'src'))
+
+from maxixe.parser import Parser
+from maxixe.checker import Checker
+
+from proofs import example_proof
+
+
+def main(args):
+    copies = int(args[0]) if args else 20000
+    proof = Parser(example_proof(copies)).proof()
+    started = time.time()
+    Checker(proof).check()
+    elapsed = time.time() - started
+    steps = len(proof.step_map)
+    print("%d steps in %.3fs: %.0f steps/sec" % (steps, elapsed, steps / elapsed))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
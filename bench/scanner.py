@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# encoding: UTF-8
+
+"""Measures how many tokens per second `Scanner` can deliver on a large,
+mechanically generated proof, and, for comparison, how many the scanner it
+replaced (kept below, as `OldScanner`) can deliver on the same proof.
+
+    python bench/scanner.py [number-of-steps]
+
+"""
+
+from os.path import realpath, dirname, join
+import re
+import sys
+import time
+
+sys.path.insert(0, join(dirname(realpath(sys.argv[0])), '..', 'src'))
+
+from maxixe.scanner import Scanner
+
+from proofs import chain_proof
+
+
+class OldScanner(object):
+    """The scanning loop of the scanner which `Scanner` replaced, which
+    compiled each pattern it tried, for every token.
+
+    """
+    def __init__(self, text):
+        self.text = text
+        self.token = None
+        self.type = None
+        self.pos = 0
+        self.scan()
+
+    def scan_pattern(self, pattern, type, token_group=1, rest_group=2):
+        pattern = r'(' + pattern + r')'
+        regexp = re.compile(pattern, flags=re.DOTALL)
+        match = regexp.match(self.text, pos=self.pos)
+        if not match:
+            return False
+        else:
+            self.type = type
+            self.token = match.group(token_group)
+            self.pos += len(self.token)
+            return True
+
+    def scan(self):
+        self.scan_pattern(r'[ \t\n\r]*', 'whitespace')
+        while self.scan_pattern(r'\/\/.*?[\n\r]', 'comment'):
+            self.scan_pattern(r'[ \t\n\r]*', 'whitespace')
+        if self.pos >= len(self.text):
+            self.token = None
+            self.type = 'EOF'
+            return
+        if self.scan_pattern(r'\=|\;|\|-|\,|\(|\)|\{|\}|\[|\]|\-\>', 'operator'):
+            return
+        if self.scan_pattern(r'[A-Z][a-zA-Z0-9_]*', 'variable'):
+            return
+        if self.scan_pattern(r'[a-z0-9][a-zA-Z0-9_]*', 'atom'):
+            return
+        if self.scan_pattern(r'.', 'unknown character'):
+            return
+
+
+def rate(scanner_cls, text):
+    started = time.time()
+    scanner = scanner_cls(text)
+    count = 0
+    while scanner.type != 'EOF':
+        scanner.scan()
+        count += 1
+    return (count, time.time() - started)
+
+
+def main(args):
+    steps = int(args[0]) if args else 100000
+    text = chain_proof(steps)
+    results = []
+    for (name, scanner_cls) in (('before', OldScanner), ('after', Scanner)):
+        (count, elapsed) = rate(scanner_cls, text)
+        results.append(count / elapsed)
+        print("%-6s %d tokens in %.3fs: %.0f tokens/sec" % (name, count, elapsed, count / elapsed))
+    print("after/before: %.2fx" % (results[1] / results[0]))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
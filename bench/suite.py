@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# encoding: UTF-8
+
+"""Measures how scanning, parsing and checking scale with the size and shape
+of proofs, using proofs from ProofGenerator, and compares the results with a
+stored baseline.  Requires Python 3 (for `tracemalloc`).
+
+    python3 bench/suite.py [--quick] [--only SCENARIO] [--save]
+
+For each phase, the time is the best of several runs, and the memory is the
+peak amount allocated (as traced by `tracemalloc`) during the phase.  A phase
+which takes more time or memory than the baseline by more than the tolerance
+is flagged as a regression, and the exit code is then 1.  `--save` writes the
+results as the new baseline.  Timings are only comparable on the same
+machine, so the stored baseline should be re-saved on the machine where the
+suite is going to be used.
+
+Each size of each scenario is measured in a fresh worker process, so that
+which scenarios were measured before it (which depends on `--quick` and
+`--only`) does not change its results: terms are interned in a table shared
+by the whole process, which grows, and is rebuilt, at times which depend on
+every term made in the process so far.
+
+"""
+
+from argparse import ArgumentParser
+import json
+import multiprocessing
+from os.path import realpath, dirname, join, exists
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, join(dirname(realpath(sys.argv[0])), '..', 'src'))
+
+from maxixe.scanner import Scanner
+from maxixe.parser import Parser, SugaredParser
+from maxixe.checker import Checker
+
+from proofs import generate_proof
+
+
+BASELINE = join(dirname(realpath(__file__)), 'baseline.json')
+
+# (name, parameter that varies, its values, other parameters)
+SCENARIOS = [
+    ('chain',      'chain',   [1000, 4000, 16000], {}),
+    ('term-depth', 'depth',   [2, 5, 8],           {'chain': 200}),
+    ('term-width', 'width',   [2, 8, 32],          {'chain': 200, 'depth': 2}),
+    ('nesting',    'nesting', [2, 4, 6],           {'chain': 20, 'cases': 2}),
+    ('cases',      'cases',   [2, 8, 32],          {'chain': 50, 'nesting': 1, 'repeat': 10}),
+    ('rules',      'rules',   [2, 32, 256],        {'chain': 2000, 'attributes': False, 'substs': False}),
+    ('substs',     'chain',   [1000, 4000],        {'rules': 0, 'attributes': False}),
+    ('sugar',      'chain',   [1000, 4000],        {'sugar': True, 'depth': 4}),
+]
+
+PHASES = ('scan', 'parse', 'check')
+
+
+def scan(text, parser_cls):
+    scanner = Scanner(text)
+    while scanner.type != 'EOF':
+        scanner.scan()
+
+
+def parse(text, parser_cls):
+    return parser_cls(text).proof()
+
+
+def check(proof):
+    Checker(proof).check()
+
+
+def traced_peak(action):
+    tracemalloc.start()
+    result = action()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return (peak, result)
+
+
+def best_time(action, runs):
+    times = []
+    for n in range(runs):
+        started = time.perf_counter()
+        action()
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+
+def measure(params, runs):
+    text = generate_proof(**params)
+    parser_cls = SugaredParser if params.get('sugar') else Parser
+    results = dict([(phase, {}) for phase in PHASES])
+
+    # The proof is first parsed and checked once, untraced, so that what is
+    # only done once in a process (such as compiling the code for rules,
+    # and importing what is imported on first use) is not counted in the
+    # first traced run.  Its copy of the proof is let go before tracing.
+    check(parse(text, parser_cls))
+
+    # Memory is measured on runs of their own, as tracing slows everything
+    # down.  Parsing is traced first, as it allocates fewer new terms when
+    # there is already a parsed copy of the proof around.
+    (results['scan']['memory'], dummy) = traced_peak(lambda: scan(text, parser_cls))
+    (results['parse']['memory'], proof) = traced_peak(lambda: parse(text, parser_cls))
+    (results['check']['memory'], dummy) = traced_peak(lambda: check(proof))
+
+    results['scan']['time'] = best_time(lambda: scan(text, parser_cls), runs)
+    results['parse']['time'] = best_time(lambda: parse(text, parser_cls), runs)
+    results['check']['time'] = best_time(lambda: check(proof), runs)
+    results['steps'] = len(proof.step_map)
+    return results
+
+
+def regressions(result, base, tolerance, slack, memory_slack):
+    flags = []
+    for phase in PHASES:
+        if phase not in base:
+            continue
+        (t, b) = (result[phase]['time'], base[phase]['time'])
+        if t > b * (1 + tolerance) and t - b > slack:
+            flags.append('%s time +%.0f%%' % (phase, (t / b - 1) * 100))
+        (m, b) = (result[phase]['memory'], base[phase]['memory'])
+        if m > b * (1 + tolerance) and m - b > memory_slack:
+            flags.append('%s memory +%.0f%%' % (phase, (float(m) / b - 1) * 100))
+    return flags
+
+
+def main(args):
+    argparser = ArgumentParser()
+    argparser.add_argument('--quick', action='store_true',
+        help="Only measure the smaller sizes of each scenario"
+    )
+    argparser.add_argument('--only', metavar='SCENARIO', action='append',
+        help="Only run the named scenario (may be given more than once)"
+    )
+    argparser.add_argument('--runs', type=int, default=3,
+        help="Number of runs to take the best time of (default: 3)"
+    )
+    argparser.add_argument('--tolerance', type=float, default=0.5,
+        help="Fraction by which a measurement may exceed the baseline (default: 0.5)"
+    )
+    argparser.add_argument('--slack', type=float, default=0.01,
+        help="Seconds by which a time must exceed the baseline to count (default: 0.01)"
+    )
+    argparser.add_argument('--memory-slack', type=int, default=65536,
+        help="Bytes by which a peak must exceed the baseline to count (default: 65536)"
+    )
+    argparser.add_argument('--save', action='store_true',
+        help="Save the results as the new baseline"
+    )
+    options = argparser.parse_args(args)
+
+    baseline = {}
+    if exists(BASELINE):
+        with open(BASELINE) as f:
+            baseline = json.load(f)
+
+    print('%-11s %-12s %7s  ' % ('scenario', 'size', 'steps') +
+          '  '.join(['%16s' % ('%s s/MB' % phase) for phase in PHASES]))
+    results = {}
+    flagged = 0
+    for (name, param, sizes, fixed) in SCENARIOS:
+        if options.only and name not in options.only:
+            continue
+        if options.quick:
+            sizes = sizes[:2]
+        for size in sizes:
+            params = dict(fixed)
+            params[param] = size
+            key = '%s=%s' % (param, size)
+            pool = multiprocessing.Pool(1)
+            try:
+                result = pool.apply(measure, (params, options.runs))
+            finally:
+                pool.close()
+                pool.join()
+            results.setdefault(name, {})[key] = result
+            flags = regressions(result, baseline.get(name, {}).get(key, {}), options.tolerance, options.slack, options.memory_slack)
+            flagged += len(flags)
+            print('%-11s %-12s %7d  ' % (name, key, result['steps']) + '  '.join(
+                ['%8.3f/%7.1f' % (result[phase]['time'], result[phase]['memory'] / 1048576.0) for phase in PHASES]
+            ) + ('  REGRESSION: ' + ', '.join(flags) if flags else ''))
+            sys.stdout.flush()
+
+    if options.save:
+        for (name, sizes) in results.items():
+            baseline.setdefault(name, {}).update(sizes)
+        with open(BASELINE, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    return 1 if flagged else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# encoding: UTF-8
+
+"""Measures the time taken to check proofs in which `and` is declared
+associative and commutative (see `maxixe.theory`):
+
+*   the proof that repeats eg/example.maxixe many times over (see
+    `proofs.example_proof`), as it is, and without its steps which use
+    Commutativity_of_Conjunction, which are not needed when `and` is
+    declared so;
+*   proofs in which each step takes one conjunct away from a conjunction
+    of many, by a rule `and(P, Q) |- P` which matches it in as many ways as
+    there are subsets of the conjuncts.  The time taken for each step
+    should grow with the number of conjuncts, but no faster.
+
+    python bench/theory.py [number-of-copies]
+
+"""
+
+from os.path import realpath, dirname, join
+import re
+import sys
+import time
+
+sys.path.insert(0, join(dirname(realpath(sys.argv[0])), '..', 'src'))
+
+from maxixe.checker import Checker
+from maxixe.parser import Parser
+
+from proofs import example_proof
+
+
+WIDTHS = (8, 64, 512)
+STEPS = 500
+
+
+def declared(text):
+    return text.replace("given\n", "given\n    constructor and {associative commutative}\n", 1)
+
+
+def without_commutativity(text):
+    # the steps which cited the commuted step cite the original one instead
+    lines = []
+    for line in text.split('\n'):
+        if 'by Commutativity_of_Conjunction' not in line:
+            lines.append(re.sub(r'(by Simplification with Step_\d+)_2$', r'\1_1', line))
+    return '\n'.join(lines)
+
+
+def conjuncts_proof(width, steps):
+    lines = [
+        "given",
+        "    constructor and {associative commutative}",
+        "    Simplification = and(P, Q) |- P",
+        "    Premise        =           |- and(%s)" % ', '.join(['a%d' % i for i in range(width)]),
+        "show",
+        "    a0",
+        "proof",
+    ]
+    # the conjuncts are written in a different order from the premise
+    conjuncts = ['a%d' % i for i in reversed(range(width))]
+    lines.append("    S0 = and(%s) by Premise" % ', '.join(conjuncts))
+    for n in range(1, steps + 1):
+        # the conjunct taken away is in the middle, and alternately the
+        # whole conjunction is restored, so that every step is as wide
+        if n % 2 == 1:
+            term = "and(%s)" % ', '.join(conjuncts[:width // 2] + conjuncts[width // 2 + 1:])
+        else:
+            term = "and(%s)" % ', '.join(conjuncts)
+            lines.append("    S%d = %s by Premise" % (n, term))
+            continue
+        lines.append("    S%d = %s by Simplification with S%d" % (n, term, n - 1))
+    lines.append("    S%d = a0 by Simplification with S%d" % (steps + 1, steps))
+    lines.append("qed")
+    return '\n'.join(lines) + '\n'
+
+
+def best_time(text, runs=3):
+    best = None
+    for run in range(runs):
+        proof = Parser(text).proof()
+        started = time.time()
+        Checker(proof).check()
+        elapsed = time.time() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(args):
+    copies = int(args[0]) if args else 2000
+    text = example_proof(copies)
+    for (name, variant) in (
+        ("as it is", text),
+        ("with and declared", declared(text)),
+        ("with and declared, without commutativity", declared(without_commutativity(text))),
+    ):
+        steps = len([line for line in variant.split('\n') if ' by ' in line])
+        elapsed = best_time(variant)
+        print("example proof %s: %d steps checked in %.3fs (%.0f steps/sec)" % (
+            name, steps, elapsed, steps / elapsed
+        ))
+    for width in WIDTHS:
+        elapsed = best_time(conjuncts_proof(width, STEPS))
+        print("%4d conjuncts: %d steps checked in %.3fs: %.1f usec/step, %.2f usec/step/conjunct" % (
+            width, STEPS + 2, elapsed, elapsed * 1e6 / (STEPS + 2), elapsed * 1e6 / (STEPS + 2) / width
+        ))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
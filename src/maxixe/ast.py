@@ -1,28 +1,36 @@
 # encoding: UTF-8
 
 class AST(object):
+    __slots__ = ()
+
     def __init__(self, **kwargs):
-        self.attrs = kwargs
+        for name in self.__slots__:
+            setattr(self, name, kwargs.pop(name, None))
+        if kwargs:
+            raise TypeError("%s has no field(s) %s" % (self.__class__.__name__, ', '.join(sorted(kwargs))))
+
+    def __getstate__(self):
+        return dict([(k, getattr(self, k)) for k in self.__slots__ if not k.startswith('_')])
+
+    def __setstate__(self, state):
+        self.__init__(**state)
 
     def __repr__(self):
         return "%s(%s)" % (
             self.__class__.__name__,
-            ', '.join(['%s=%r' % (k, v) for k, v in self.attrs.items()])
+            ', '.join(['%s=%r' % (k, getattr(self, k)) for k in self.__slots__ if not k.startswith('_')])
         )
 
-    def __getattr__(self, name):
-        if name in self.attrs:
-            return self.attrs[name]
-        raise AttributeError(name)
-
 
 class Proof(AST):
+    __slots__ = ('imports', 'rules', 'goal', 'block', 'rule_map', 'block_rule_map', 'step_map', 'theory')
+
     def get_rule(self, rule_name):
         return self.rule_map[rule_name]
 
     def get_block_rule(self, var):
         if var is None:
-            return BlockRule(cases=[BlockRuleCase(initial=None, final=None)])
+            return TOP_LEVEL_BLOCK_RULE
         return self.block_rule_map[var.name]
 
     def find_step_and_block(self, step_name):
@@ -30,27 +38,38 @@ class Proof(AST):
 
 
 class Rule(AST):
-    pass
+    __slots__ = ('var', 'hypotheses', 'conclusion', '_compiled', '_signature')
 
 
 class BlockRule(AST):
-    pass
+    __slots__ = ('name', 'cases')
 
 
 class BlockRuleCase(AST):
-    pass
+    __slots__ = ('initial', 'final')
+
+
+TOP_LEVEL_BLOCK_RULE = BlockRule(cases=[BlockRuleCase(initial=None, final=None)])
 
 
 class Hyp(AST):
+    __slots__ = ('term', 'attributes', '_attribute_set')
+
+    def __init__(self, **kwargs):
+        super(Hyp, self).__init__(**kwargs)
+        self._attribute_set = frozenset(self.attributes or ())
+
     def has_attribute(self, attribute):
-        return attribute in self.attributes
+        return attribute in self._attribute_set
 
 
 class Subst(AST):
-    pass
+    __slots__ = ('lhs', 'rhs')
 
 
 class Block(AST):
+    __slots__ = ('name', 'cases', 'level')
+
     def has_as_last_step(self, step):
         for case in self.cases:
             if case.has_as_last_step(step):
@@ -59,9 +78,11 @@ class Block(AST):
 
 
 class BlockCase(AST):
+    __slots__ = ('steps',)
+
     def has_as_last_step(self, step):
         return step == self.steps[-1]
 
 
 class Step(AST):
-    pass
+    __slots__ = ('var', 'term', 'by', 'with_')
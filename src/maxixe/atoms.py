@@ -0,0 +1,49 @@
+# encoding: UTF-8
+
+
+class AtomEnvironment(object):
+    """Keeps track of the atoms that matter to the checks on `local`,
+    `nonlocal` and `unique` hypotheses: the atoms that are local to each of
+    the blocks currently being checked, and every atom that has been used in
+    a step so far.
+
+    The local atoms of a block are only visible within that block itself
+    (not within the blocks nested in it), so they are kept in a stack of
+    sets, one per block, which is pushed when a block begins and popped when
+    it ends.  Each check is made by looking up the atoms of a term (which are
+    computed once for each term, and kept on it) in these sets, so it takes
+    time proportional to the term, not to the number of atoms in the proof.
+
+    """
+    def __init__(self):
+        self.frames = []
+        self.local = set()
+        self.used = set()
+
+    def push(self):
+        self.frames.append(self.local)
+        self.local = set()
+
+    def pop(self):
+        self.local = self.frames.pop()
+
+    def add_local(self, atom):
+        self.local.add(atom)
+
+    def find_local(self, term):
+        """Returns the first local atom that occurs in the term, or None if
+        there is no such atom.
+
+        """
+        local = self.local
+        if local:
+            for atom in term.atoms():
+                if atom in local:
+                    return atom
+        return None
+
+    def use(self, term):
+        self.used.update(term.atoms())
+
+    def is_used(self, atom):
+        return atom in self.used
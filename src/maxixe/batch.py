@@ -0,0 +1,107 @@
+# encoding: UTF-8
+
+import json
+import multiprocessing
+import os
+import time
+
+from maxixe.parser import Parser
+from maxixe.checker import Checker
+from maxixe.binary import load_proof
+from maxixe.budget import Budget, BudgetExceeded
+from maxixe.cache import InstanceCache
+
+
+# The InstanceCache shared by the proofs checked in this process, if any.
+_instances = None
+
+
+def find_proof_files(paths, extension='.maxixe'):
+    """Expands the given paths into a list of filenames.  Files are taken
+    as given; directories are searched recursively for files with the given
+    extension.
+
+    """
+    filenames = []
+    for path in paths:
+        if os.path.isdir(path):
+            for (dirpath, dirnames, files) in os.walk(path):
+                dirnames.sort()
+                for name in sorted(files):
+                    if name.endswith(extension):
+                        filenames.append(os.path.join(dirpath, name))
+        else:
+            filenames.append(path)
+    return filenames
+
+
+def check_file(filename, parser_cls=Parser, instances=None, limits=None):
+    hooks = Budget(**limits) if limits else None
+    proof = load_proof(filename, parser_cls, hooks=hooks)
+    c = Checker(proof, hooks=hooks, instances=instances)
+    c.check()
+
+
+def check_file_result(args):
+    """Checks a single proof file and returns a dict describing the outcome,
+    rather than raising an exception if the proof is not valid.
+
+    """
+    global _instances
+    (filename, parser_cls, memo, limits) = args
+    if memo and _instances is None:
+        _instances = InstanceCache(memo)
+    result = {'file': filename}
+    started = time.time()
+    try:
+        check_file(filename, parser_cls, _instances, limits)
+        result['status'] = 'ok'
+    except Exception as e:
+        result['status'] = 'error'
+        result['error_class'] = e.__class__.__name__
+        message = str(e)
+        if not isinstance(message, type(u'')):
+            message = message.decode('utf-8', 'replace')
+        result['message'] = message
+        if isinstance(e, BudgetExceeded):
+            result['progress'] = e.progress
+    result['time'] = round(time.time() - started, 6)
+    return result
+
+
+def run_batch(paths, parser_cls=Parser, jobs=None, out=None, memo=0, limits=None):
+    """Checks every proof file named by (or found under) the given paths,
+    using a pool of `jobs` worker processes (by default, one per CPU), and
+    writes the outcome for each file to `out` as a line of JSON.  If `memo`
+    is given, each worker process remembers the outcomes of that many of the
+    most recent instantiations of rules, across all the proofs it checks.
+    If `limits` is given, it is a dict of the limits of a Budget (see
+    `maxixe.budget`) which each proof is checked within.
+
+    Returns a process exit code: 0 if every proof was valid, 1 otherwise.
+
+    """
+    work = [(filename, parser_cls, memo, limits) for filename in find_proof_files(paths)]
+    if jobs is None:
+        jobs = multiprocessing.cpu_count()
+    if jobs > 1 and len(work) > 1:
+        pool = multiprocessing.Pool(min(jobs, len(work)))
+        results = pool.imap(check_file_result, work, chunksize=max(1, len(work) // (jobs * 8)))
+    else:
+        pool = None
+        results = (check_file_result(w) for w in work)
+
+    failures = 0
+    try:
+        for result in results:
+            if result['status'] != 'ok':
+                failures += 1
+            if out is not None:
+                out.write(json.dumps(result, sort_keys=True) + '\n')
+                out.flush()
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return 0 if failures == 0 else 1
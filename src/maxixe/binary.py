@@ -0,0 +1,462 @@
+# encoding: UTF-8
+
+import mmap
+import os
+import struct
+
+from maxixe.ast import Proof, Rule, BlockRule, BlockRuleCase, Hyp, Block, BlockCase, Step
+from maxixe.terms import Term, Var, Substor
+from maxixe.theory import Theory
+from maxixe.library import LazyMap, import_library
+
+
+# A compiled proof (a `.maxixec` file) holds the Proof AST in a form which
+# can be loaded without scanning or parsing any text.  It consists of:
+#
+# *   a header: the MAGIC string, then (as little-endian 32-bit integers)
+#     the name of the parser which parsed the source (an index into the
+#     symbol table), and the number of symbols, terms, and AST words;
+# *   the symbol table: the byte offset at which each symbol ends, then
+#     the UTF-8 text of all the symbols;
+# *   the term table: the word offset at which each term starts, then the
+#     terms, each of which is a kind (TERM, VAR or SUBSTOR), a symbol, a
+#     number of subterms, and the indices of the subterms.  Terms are
+#     shared, so each distinct term is stored once, after its subterms;
+# *   the AST: the imports, declared constructors (each a symbol and a set
+#     of ASSOCIATIVE and COMMUTATIVE flags), rules, goal and block of the
+#     proof, in prefix order, as a sequence of words, with terms and names
+#     given by index.  Imported libraries are not included; they are
+#     imported again when the proof is loaded.  Terms are stored in the
+#     normal form of the declared constructors, so need not be normalized
+#     again.
+#
+# The file is memory-mapped when it is loaded, and the whole proof is
+# decoded from it at once.  Loading it is faster than parsing the source
+# because nothing need be scanned, and each term, however many times it
+# occurs, is decoded from its words only once.
+
+MAGIC = b'maxixec\x03'
+
+TERM, VAR, SUBSTOR = 0, 1, 2
+RULE, BLOCK_RULE = 0, 1
+ASSOCIATIVE, COMMUTATIVE = 1, 2
+STEP, BLOCK = 0, 1
+NONE = -1
+
+
+def compiled_filename(filename):
+    if filename.endswith('.maxixe'):
+        return filename + 'c'
+    return filename + '.maxixec'
+
+
+def is_fresh(filename, compiled):
+    """Returns True if the compiled file exists and is no older than the
+    file it was compiled from.
+
+    """
+    try:
+        return os.stat(compiled).st_mtime >= os.stat(filename).st_mtime
+    except OSError:
+        return False
+
+
+class ProofWriter(object):
+    def __init__(self):
+        self.symbols = []
+        self.symbol_index = {}
+        self.terms = []
+        self.term_index = {}
+        self.words = []
+
+    def symbol(self, name):
+        index = self.symbol_index.get(name)
+        if index is None:
+            index = len(self.symbols)
+            self.symbols.append(name)
+            self.symbol_index[name] = index
+        return index
+
+    def term(self, term):
+        """Returns the index of the term, adding it (after any of its
+        subterms which are not yet in the table) if it is not yet in the
+        table.
+
+        """
+        index = self.term_index.get(term)
+        if index is not None:
+            return index
+        stack = [term]
+        while stack:
+            term = stack[-1]
+            if term in self.term_index:
+                stack.pop()
+                continue
+            children = term_children(term)
+            pending = [child for child in children if child not in self.term_index]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            if isinstance(term, Term):
+                kind, symbol = TERM, self.symbol(term.constructor)
+            elif isinstance(term, Var):
+                kind, symbol = VAR, self.symbol(term.name)
+            else:
+                kind, symbol = SUBSTOR, NONE
+            self.term_index[term] = len(self.terms)
+            self.terms.append([kind, symbol, len(children)] + [self.term_index[child] for child in children])
+        return self.term_index[term]
+
+    def emit(self, *words):
+        self.words.extend(words)
+
+    def name(self, var):
+        if var is None:
+            return NONE
+        return self.symbol(var.name)
+
+    def proof(self, proof):
+        self.emit(len(proof.imports))
+        for filename in proof.imports:
+            self.emit(self.symbol(filename))
+        signature = proof.theory.signature if proof.theory is not None else ()
+        self.emit(len(signature))
+        for (constructor, (associative, commutative)) in signature:
+            self.emit(
+                self.symbol(constructor), (ASSOCIATIVE if associative else 0) | (COMMUTATIVE if commutative else 0)
+            )
+        self.emit(len(proof.rules))
+        for rule in proof.rules:
+            if isinstance(rule, BlockRule):
+                self.emit(BLOCK_RULE, self.name(rule.name), len(rule.cases))
+                for case in rule.cases:
+                    self.rule(case.initial)
+                    if case.final is None:
+                        self.emit(NONE)
+                    else:
+                        self.emit(RULE)
+                        self.rule(case.final)
+            else:
+                self.emit(RULE)
+                self.rule(rule)
+        self.emit(self.term(proof.goal))
+        self.block(proof.block)
+
+    def rule(self, rule):
+        self.emit(self.name(rule.var), len(rule.hypotheses))
+        for hypothesis in rule.hypotheses:
+            self.emit(self.term(hypothesis.term), len(hypothesis.attributes))
+            for attribute in hypothesis.attributes:
+                self.emit(self.symbol(attribute))
+        self.emit(self.term(rule.conclusion))
+
+    def block(self, block):
+        # blocks are written depth-first, using an explicit stack of the
+        # blocks, cases and steps still to be written
+        stack = []
+        self.open_block(block, stack)
+        while stack:
+            item = stack.pop()
+            if isinstance(item, BlockCase):
+                self.emit(len(item.steps))
+            elif isinstance(item, Block):
+                self.emit(BLOCK)
+                self.open_block(item, stack)
+            else:
+                self.emit(STEP, self.name(item.var), self.term(item.term), self.name(item.by), len(item.with_))
+                for with_ in item.with_:
+                    self.emit(self.term(with_))
+
+    def open_block(self, block, stack):
+        self.emit(self.name(block.name), len(block.cases))
+        for case in reversed(block.cases):
+            stack.extend(reversed(case.steps))
+            stack.append(case)
+
+    def write(self, f, parser_name):
+        parser_symbol = self.symbol(parser_name)
+        encoded = [encode(symbol) for symbol in self.symbols]
+        ends = []
+        end = 0
+        for text in encoded:
+            end += len(text)
+            ends.append(end)
+        starts = []
+        start = 0
+        for term in self.terms:
+            starts.append(start)
+            start += len(term)
+        f.write(MAGIC)
+        f.write(pack([parser_symbol, len(self.symbols), len(self.terms), len(self.words)]))
+        f.write(pack(ends))
+        f.write(b''.join(encoded))
+        f.write(pack(starts))
+        f.write(pack([start]))
+        f.write(pack([word for term in self.terms for word in term]))
+        f.write(pack(self.words))
+
+
+def term_children(term):
+    if isinstance(term, Term):
+        return list(term.subterms)
+    elif isinstance(term, Substor):
+        children = [term.subterm]
+        for (lhs, rhs) in term.substs:
+            children.extend([lhs, rhs])
+        return children
+    else:
+        return []
+
+
+def pack(words):
+    return struct.pack('<%di' % len(words), *words)
+
+
+def encode(symbol):
+    if isinstance(symbol, bytes):
+        return symbol
+    return symbol.encode('utf-8')
+
+
+def decode(data):
+    if str is bytes:
+        return data
+    return data.decode('utf-8')
+
+
+def write_proof(proof, filename, parser_name):
+    """Writes the proof to the named file in compiled form.  The file is
+    replaced all at once, so that a compiled proof which is being loaded at
+    the same time is never seen half-written.
+
+    """
+    writer = ProofWriter()
+    writer.proof(proof)
+    temporary = filename + '.tmp'
+    with open(temporary, 'wb') as f:
+        writer.write(f, parser_name)
+    if os.name == 'nt' and os.path.exists(filename):
+        os.remove(filename)
+    os.rename(temporary, filename)
+
+
+class ProofReader(object):
+    """Reads a compiled proof from a buffer (such as a memory-mapped file).
+    `proof` decodes all of it; each symbol and term is decoded the first
+    time the AST refers to it, and remembered for the next time.
+
+    """
+    def __init__(self, data):
+        self.data = data
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError("not a compiled Maxixe proof")
+        offset = len(MAGIC)
+        (parser_symbol, num_symbols, num_terms, num_words) = struct.unpack_from('<4i', data, offset)
+        offset += 16
+        self.symbol_ends = struct.unpack_from('<%di' % num_symbols, data, offset)
+        offset += 4 * num_symbols
+        self.symbol_offset = offset
+        if num_symbols:
+            offset += self.symbol_ends[-1]
+        self.term_starts = struct.unpack_from('<%di' % (num_terms + 1), data, offset)
+        offset += 4 * (num_terms + 1)
+        self.term_offset = offset
+        offset += 4 * self.term_starts[-1]
+        self.words = struct.unpack_from('<%di' % num_words, data, offset)
+        self.pos = 0
+        self.symbols = [None] * num_symbols
+        self.terms = [None] * num_terms
+        self.parser_name = self.symbol(parser_symbol)
+
+    def symbol(self, index):
+        symbol = self.symbols[index]
+        if symbol is None:
+            start = self.symbol_ends[index - 1] if index > 0 else 0
+            start += self.symbol_offset
+            end = self.symbol_offset + self.symbol_ends[index]
+            symbol = decode(self.data[start:end])
+            self.symbols[index] = symbol
+        return symbol
+
+    def term_words(self, index):
+        offset = self.term_offset + 4 * self.term_starts[index]
+        (kind, symbol, arity) = struct.unpack_from('<3i', self.data, offset)
+        children = struct.unpack_from('<%di' % arity, self.data, offset + 12)
+        return (kind, symbol, children)
+
+    def term(self, index):
+        term = self.terms[index]
+        if term is not None:
+            return term
+        stack = [index]
+        while stack:
+            index = stack[-1]
+            if self.terms[index] is not None:
+                stack.pop()
+                continue
+            (kind, symbol, children) = self.term_words(index)
+            pending = [child for child in children if self.terms[child] is None]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            children = [self.terms[child] for child in children]
+            if kind == TERM:
+                term = Term(self.symbol(symbol), children)
+            elif kind == VAR:
+                term = Var(self.symbol(symbol))
+            else:
+                term = Substor(children[0], zip(children[1::2], children[2::2]))
+            self.terms[index] = term
+        return term
+
+    def next(self):
+        word = self.words[self.pos]
+        self.pos += 1
+        return word
+
+    def name(self):
+        index = self.next()
+        if index == NONE:
+            return None
+        return Var(self.symbol(index))
+
+    def proof(self, parser_cls):
+        self.rule_map = LazyMap()
+        self.block_rule_map = LazyMap()
+        self.step_map = {}
+        imports = [self.symbol(self.next()) for n in range(self.next())]
+        imported = []
+        for filename in imports:
+            import_library(filename, parser_cls, self.rule_map, self.block_rule_map, imported)
+        theory = Theory()
+        for n in range(self.next()):
+            constructor = self.symbol(self.next())
+            flags = self.next()
+            theory.declare(constructor, bool(flags & ASSOCIATIVE), bool(flags & COMMUTATIVE))
+        rules = []
+        for n in range(self.next()):
+            if self.next() == BLOCK_RULE:
+                name = self.name()
+                cases = []
+                for m in range(self.next()):
+                    initial = self.rule()
+                    final = None
+                    if self.next() != NONE:
+                        final = self.rule()
+                    cases.append(BlockRuleCase(initial=initial, final=final))
+                block_rule = BlockRule(name=name, cases=cases)
+                self.block_rule_map[name.name] = block_rule
+                rules.append(block_rule)
+            else:
+                rules.append(self.rule())
+        goal = self.term(self.next())
+        block = self.block(0)
+        return Proof(
+            imports=imports, rules=rules, goal=goal, block=block,
+            rule_map=self.rule_map, block_rule_map=self.block_rule_map, step_map=self.step_map,
+            theory=theory
+        )
+
+    def rule(self):
+        var = self.name()
+        hypotheses = []
+        for n in range(self.next()):
+            term = self.term(self.next())
+            attributes = [self.symbol(self.next()) for m in range(self.next())]
+            hypotheses.append(Hyp(term=term, attributes=attributes))
+        conclusion = self.term(self.next())
+        rule = Rule(var=var, hypotheses=hypotheses, conclusion=conclusion)
+        self.rule_map[var.name] = rule
+        return rule
+
+    def block(self, level):
+        # nested blocks are read using an explicit stack of the blocks being
+        # read, each as [block, cases left to read, steps of the case being
+        # read, steps of it left to read]
+        stack = [self.open_block(level)]
+        while True:
+            frame = stack[-1]
+            block = frame[0]
+            if frame[3] == 0:
+                if frame[2] is not None:
+                    block.cases.append(BlockCase(steps=frame[2]))
+                    frame[2] = None
+                if frame[1] == 0:
+                    stack.pop()
+                    if not stack:
+                        return block
+                    stack[-1][2].append(block)
+                    continue
+                frame[1] -= 1
+                frame[2] = []
+                frame[3] = self.next()
+                continue
+            frame[3] -= 1
+            if self.next() == BLOCK:
+                stack.append(self.open_block(block.level + 1))
+                continue
+            var = self.name()
+            term = self.term(self.next())
+            by = self.name()
+            with_ = [self.term(self.next()) for k in range(self.next())]
+            step = Step(var=var, term=term, by=by, with_=with_)
+            self.step_map[var.name] = (step, block)
+            frame[2].append(step)
+
+    def open_block(self, level):
+        name = self.name()
+        return [Block(name=name, cases=[], level=level), self.next(), None, 0]
+
+
+def read_proof(filename, parser_cls):
+    """Loads a compiled proof from the named file.  If the proof was compiled
+    by a different kind of parser, returns None.  Any libraries the proof
+    imports are parsed with the given parser.
+
+    """
+    with open(filename, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        reader = ProofReader(data)
+        if reader.parser_name != parser_cls.__name__:
+            return None
+        return reader.proof(parser_cls)
+    finally:
+        data.close()
+
+
+def compile_proof(filename, parser_cls):
+    """Parses the named proof file and writes it in compiled form, returning
+    the name of the compiled file.
+
+    """
+    with open(filename, 'r') as f:
+        proof = parser_cls(f.read(), filename=filename).proof()
+    compiled = compiled_filename(filename)
+    write_proof(proof, compiled, parser_cls.__name__)
+    return compiled
+
+
+def load_proof(filename, parser_cls, hooks=None):
+    """Returns the proof in the named file.  If there is a compiled form of
+    it which is fresher than the file, and which was compiled by the same
+    kind of parser, that is loaded instead of parsing the file.
+
+    """
+    compiled = compiled_filename(filename)
+    if is_fresh(filename, compiled):
+        if hooks is not None:
+            hooks.begin_phase('load')
+        try:
+            proof = read_proof(compiled, parser_cls)
+        except (ValueError, struct.error, EnvironmentError):
+            proof = None
+        if hooks is not None:
+            hooks.end_phase('load')
+        if proof is not None:
+            return proof
+    with open(filename, 'r') as f:
+        p = parser_cls(f.read(), hooks=hooks, filename=filename)
+    return p.proof()
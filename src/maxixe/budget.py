@@ -0,0 +1,131 @@
+# encoding: UTF-8
+
+from maxixe.stats import Hooks, clock
+from maxixe.terms import set_meter, term_count
+
+
+class BudgetExceeded(Exception):
+    """Raised when parsing or checking a proof has used up its budget.
+    `progress` is a dict describing how far it got.
+
+    """
+    def __init__(self, message, progress):
+        super(BudgetExceeded, self).__init__(message)
+        self.progress = progress
+
+
+class Budget(Hooks):
+    """Hooks which limit the resources that parsing and checking a proof may
+    use, so that a proof from an untrusted source cannot tie up the process
+    checking it.  Any of the limits may be None, meaning no limit:
+
+    *   `time`: the number of seconds since the Budget was made;
+    *   `nodes`: the number of nodes of terms built, both by the parser and
+        while instantiating rules (substituting into terms, and resolving
+        the substitutions in them), each way tried of matching terms in a
+        Theory counting as one more (see `maxixe.theory`);
+    *   `steps`: the number of steps checked;
+    *   `memory`: the number of bytes taken up by the terms which have come
+        into existence since the Budget was made, estimated at NODE_BYTES
+        for each term.  Terms are shared by everything in the process, so
+        when other proofs are being checked at the same time in the same
+        process, this counts their new terms as well.
+
+    The limits are checked cooperatively, as tokens are scanned (every
+    CHECK_INTERVAL tokens), as each step is begun, and as terms are rebuilt
+    (every `maxixe.terms.METER_INTERVAL` nodes).  When one is exceeded,
+    BudgetExceeded is raised.
+
+    If `hooks` is given, the Budget passes everything on to it as well, so
+    that it can be used along with other hooks.
+
+    """
+    NODE_BYTES = 384
+    CHECK_INTERVAL = 256
+
+    def __init__(self, time=None, nodes=None, steps=None, memory=None, hooks=None):
+        self.max_time = time
+        self.max_nodes = nodes
+        self.max_steps = steps
+        self.max_memory = memory
+        self.hooks = hooks if hooks is not None else Hooks()
+        self.started = clock()
+        self.initial_terms = term_count()
+        self.nodes = 0
+        self.steps = 0
+        self.step = None
+        self.line = None
+
+    def tokens(self, tokens):
+        count = 0
+        for token in self.hooks.tokens(tokens):
+            if token[0] == 'atom' or token[0] == 'variable':
+                self.nodes += 1
+            count += 1
+            if count == self.CHECK_INTERVAL:
+                self.line = token[3]
+                self.check()
+                count = 0
+            yield token
+
+    def begin_phase(self, name):
+        self.hooks.begin_phase(name)
+
+    def end_phase(self, name):
+        self.hooks.end_phase(name)
+
+    def begin_step(self, step):
+        self.steps += 1
+        self.step = step.var.name
+        self.check()
+        self.hooks.begin_step(step)
+
+    def end_step(self, step):
+        self.hooks.end_step(step)
+
+    def instantiate(self, step, rule, with_terms, theory=None):
+        previous = set_meter(self)
+        try:
+            return self.hooks.instantiate(step, rule, with_terms, theory)
+        finally:
+            set_meter(previous)
+
+    def charge(self, nodes):
+        self.nodes += nodes
+        self.check()
+
+    def check(self):
+        if self.max_steps is not None and self.steps > self.max_steps:
+            self.exceeded('step', self.max_steps)
+        if self.max_nodes is not None and self.nodes > self.max_nodes:
+            self.exceeded('term node', self.max_nodes)
+        if self.max_memory is not None and self.memory() > self.max_memory:
+            self.exceeded('memory', '%d bytes' % self.max_memory)
+        if self.max_time is not None and clock() - self.started > self.max_time:
+            self.exceeded('time', '%ss' % self.max_time)
+
+    def memory(self):
+        return max(0, term_count() - self.initial_terms) * self.NODE_BYTES
+
+    def progress(self):
+        return {
+            'time': round(clock() - self.started, 6),
+            'nodes': self.nodes,
+            'memory': self.memory(),
+            'steps': self.steps,
+            'step': self.step,
+            'line': self.line,
+        }
+
+    def exceeded(self, what, limit):
+        progress = self.progress()
+        where = ''
+        if progress['step'] is not None:
+            where = " in step %s" % progress['step']
+        elif progress['line'] is not None:
+            where = " near line %s" % progress['line']
+        raise BudgetExceeded(
+            "%s budget of %s exceeded%s, after %.3fs: %d steps begun, %d term nodes built, about %d bytes of new terms" % (
+                what, limit, where, progress['time'], progress['steps'], progress['nodes'], progress['memory']
+            ), progress
+        )
@@ -0,0 +1,239 @@
+# encoding: UTF-8
+
+from maxixe.ast import Proof, Rule, BlockRule, BlockRuleCase, Hyp, Block, BlockCase, Step
+from maxixe.checker import Checker
+from maxixe.library import LazyMap, import_library, resolve_import
+from maxixe.parser import Parser
+from maxixe.scanner import STRING_TYPES
+from maxixe.terms import Var
+from maxixe.theory import Theory
+
+
+class ProofBuilder(object):
+    """Builds a proof out of `maxixe.ast` and `maxixe.terms` objects, for
+    programs which generate proofs, so that they need not write the proof
+    out as text only for a Parser to read it back in.  The parts of the
+    proof are added in the order they would be written in:
+
+        b = ProofBuilder()
+        b.rule('Premise', [], Term('p'))
+        b.rule('Double', [Var('P')], Term('and', [Var('P'), Var('P')]))
+        b.show(Term('and', [Term('p'), Term('p')]))
+        b.add_step('S1', Term('p'), 'Premise')
+        b.add_step('S2', Term('and', [Term('p'), Term('p')]), 'Double', ['S1'])
+        proof = b.qed()
+
+    Names of rules, block rules and steps may be given as strings or Vars.
+    Terms need not be in the normal form of the constructors declared with
+    `constructor`; they are normalized as they are added.
+
+    If `check` is true, each part of the proof is checked as soon as it is
+    added, by a Checker made with the given `cache`, `hooks` and `instances`
+    (see `maxixe.checker`), in the same way as a proof which is checked
+    while it is parsed; so `add_step` raises the error for an invalid step
+    as soon as that step is added, and a program can stop generating the
+    proof there.  Once an error has been raised, the builder should not be
+    used any further.  If `check` is false, the proof is only built, and may
+    be checked afterwards by a Checker.
+
+    `parser_cls` is the kind of Parser that imported libraries are read by.
+
+    """
+    def __init__(self, check=True, cache=None, hooks=None, instances=None, parser_cls=Parser):
+        self.checker = None
+        if check:
+            self.checker = Checker(cache=cache, hooks=hooks, instances=instances)
+        self.hooks = hooks
+        self.parser_cls = parser_cls
+        self.theory = Theory()
+        self.imports = []
+        self.imported = []
+        self.rules = []
+        self.rule_map = LazyMap()
+        self.block_rule_map = LazyMap()
+        self.step_map = {}
+        self.proof = None
+        # the blocks being built, innermost last, each with its current case
+        self.stack = []
+
+    def import_(self, filename):
+        """Adds the rules of the library in the named file, as `import` does
+        in the `given` section of a proof.  A relative filename is found
+        relative to the current directory.
+
+        """
+        self.expect_given()
+        filename = resolve_import(filename)
+        self.imports.append(filename)
+        import_library(filename, self.parser_cls, self.rule_map, self.block_rule_map, self.imported)
+
+    def constructor(self, name, associative=False, commutative=False):
+        """Declares the named constructor to be associative, commutative, or
+        both, as `constructor` does in the `given` section of a proof.
+
+        """
+        self.expect_given()
+        self.theory.declare(name, associative, commutative)
+
+    def rule(self, name, hypotheses, conclusion):
+        """Adds a rule of inference, and returns it.  Each of the hypotheses
+        is a term, a (term, attributes) pair, where the attributes are a list
+        of strings such as 'term' or 'atom', or a Hyp.
+
+        """
+        self.expect_given()
+        var = as_var(name)
+        hyps = []
+        for hypothesis in hypotheses:
+            if isinstance(hypothesis, tuple):
+                hypothesis = Hyp(term=hypothesis[0], attributes=list(hypothesis[1]))
+            elif not isinstance(hypothesis, Hyp):
+                hypothesis = Hyp(term=hypothesis, attributes=[])
+            hyps.append(hypothesis)
+        rule = Rule(var=var, hypotheses=hyps, conclusion=conclusion)
+        if var.name in self.rule_map:
+            raise ValueError("name has already been used for a rule of inference")
+        self.rule_map[var.name] = rule
+        self.rules.append(rule)
+        return rule
+
+    def block_rule(self, name, cases):
+        """Adds a block rule, and returns it.  Each of the cases is a pair of
+        the rule the first step of the case must use and the rule the last
+        step of the case must use (which may be None), each of which was
+        added by `rule`.
+
+        """
+        self.expect_given()
+        block_rule = BlockRule(
+            name=as_var(name), cases=[BlockRuleCase(initial=initial, final=final) for (initial, final) in cases]
+        )
+        self.block_rule_map[block_rule.name.name] = block_rule
+        self.rules.append(block_rule)
+        return block_rule
+
+    def show(self, goal):
+        """Sets the goal of the proof, after which steps may be added."""
+        self.expect_given()
+        self.proof = Proof(
+            imports=self.imports, rules=self.rules, goal=self.normalize(goal), block=None,
+            rule_map=self.rule_map, block_rule_map=self.block_rule_map, step_map=self.step_map,
+            theory=self.theory
+        )
+        if self.hooks is not None:
+            self.hooks.begin_phase('check')
+        if self.checker is not None:
+            self.checker.begin_proof(self.proof)
+        self.open_block(None)
+
+    def add_step(self, name, term, by, with_=()):
+        """Adds a step to the current case of the current block, checks it,
+        and returns it.  `by` is the name of the rule it uses; each of the
+        arguments in `with_` is a term, or the name of a preceding step.
+
+        """
+        self.expect_proof()
+        var = as_var(name)
+        with_ = [self.normalize(as_var(w)) for w in with_]
+        step = Step(var=var, term=self.normalize(term), by=as_var(by), with_=with_)
+        if var.name in self.rule_map:
+            raise ValueError("name has already been used for a rule of inference")
+        if var.name in self.step_map:
+            raise ValueError("name has already been used for a step")
+        for with_var in with_:
+            if not isinstance(with_var, Var):
+                continue
+            if with_var.name not in self.step_map:
+                raise ValueError("In step '%s': Step name '%s' in with is not the name of a preceding step" %
+                    (var.name, with_var.name)
+                )
+        (block, case) = self.stack[-1]
+        self.step_map[var.name] = (step, block)
+        if self.checker is not None:
+            self.checker.check_step(step)
+        case.steps.append(step)
+        return step
+
+    def begin_block(self, name):
+        """Begins a block which uses the named block rule, in the current
+        case, and begins its first case.  Steps are added to the block until
+        `next_case` or `end_block` is called.
+
+        """
+        self.expect_proof()
+        self.open_block(as_var(name))
+
+    def next_case(self):
+        """Ends the current case of the current block and begins the next."""
+        self.expect_proof()
+        if len(self.stack) == 1:
+            raise ValueError("the proof itself has only one case")
+        (block, case) = self.stack[-1]
+        self.close_case(block, case)
+        self.stack[-1] = (block, self.open_case())
+
+    def end_block(self):
+        """Ends the current block, after which steps are added to the case
+        the block is in.  Returns the block.
+
+        """
+        self.expect_proof()
+        if len(self.stack) == 1:
+            raise ValueError("no block has been begun")
+        return self.close_block()
+
+    def qed(self):
+        """Ends the proof, checking that it reaches its goal, and returns it."""
+        self.expect_proof()
+        if len(self.stack) != 1:
+            raise ValueError("block %s has not been ended" % self.stack[-1][0].name)
+        self.proof.block = self.close_block()
+        if self.checker is not None:
+            self.checker.end_proof()
+        if self.hooks is not None:
+            self.hooks.end_phase('check')
+        proof = self.proof
+        self.proof = None
+        self.stack = None
+        return proof
+
+    def open_block(self, name):
+        block = Block(name=name, cases=[], level=len(self.stack))
+        if self.checker is not None:
+            self.checker.begin_block(block)
+        self.stack.append((block, self.open_case()))
+
+    def open_case(self):
+        case = BlockCase(steps=[])
+        if self.checker is not None:
+            self.checker.begin_case(case)
+        return case
+
+    def close_case(self, block, case):
+        if self.checker is not None:
+            self.checker.end_case(case)
+        block.cases.append(case)
+
+    def close_block(self):
+        (block, case) = self.stack.pop()
+        self.close_case(block, case)
+        if self.checker is not None:
+            self.checker.end_block(block)
+        if self.stack:
+            self.stack[-1][1].steps.append(block)
+        return block
+
+    def normalize(self, term):
+        return self.theory.normalize(term) if self.theory else term
+
+    def expect_given(self):
+        if self.proof is not None or self.stack is None:
+            raise ValueError("rules can only be added before the goal is shown")
+
+    def expect_proof(self):
+        if self.proof is None:
+            raise ValueError("steps can only be added after the goal is shown, and before qed")
+
+
+def as_var(name):
+    return Var(name) if isinstance(name, STRING_TYPES) else name
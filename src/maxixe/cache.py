@@ -0,0 +1,180 @@
+# encoding: UTF-8
+
+from collections import OrderedDict
+import hashlib
+import os
+import threading
+
+from maxixe.checker import ProofStructureError, ReasoningError, instantiate
+from maxixe.terms import digest
+
+
+class VerificationCache(object):
+    """Remembers which steps have been verified to follow from the rule and
+    arguments given in their justification, so that re-checking an edited
+    proof need only re-verify the steps that were affected by the edit.
+
+    Each verified step is recorded by a key, which is a digest of the rule's
+    hypotheses and conclusion, the terms of the step's arguments, and the
+    step's own term.  Changing any of these changes the key; in particular,
+    changing the term of a step changes the key of every step that cites it.
+    The checks that depend on the position of a step in the proof (local,
+    nonlocal and unique atoms, and references into inner blocks) are cheap,
+    and are always made, so they need not be part of the key.
+
+    """
+    HEADER = 'maxixe verification cache 1'
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.keys = set()
+        self.used = set()
+        self.digests = {}
+        self.hits = 0
+        self.misses = 0
+        if filename is not None and os.path.exists(filename):
+            self.load()
+
+    def load(self):
+        with open(self.filename, 'r') as f:
+            lines = f.read().split('\n')
+        if lines[0] == self.HEADER:
+            self.keys = set(line for line in lines[1:] if line)
+
+    def save(self, complete=True):
+        """Writes the cache to its file.  If `complete` is true, the last
+        check ran to completion, so only the keys it used are kept; otherwise
+        the keys it did not reach are kept as well.
+
+        """
+        keys = self.used if complete else self.keys | self.used
+        with open(self.filename, 'w') as f:
+            f.write('\n'.join([self.HEADER] + sorted(keys)) + '\n')
+        self.keys = set(keys)
+
+    def prune(self, complete=True):
+        """Forgets what the last check did not use, in the same way as
+        `save`, but without writing the cache to a file, so that a cache
+        which is kept in memory across many checks (as the server's are)
+        does not grow without bound.  The digests of terms are forgotten
+        too, as they would otherwise keep every term ever digested alive.
+
+        """
+        self.keys = self.used if complete else self.keys | self.used
+        self.used = set()
+        self.digests = {}
+
+    def reset_stats(self):
+        self.used = set()
+        self.hits = 0
+        self.misses = 0
+
+    def digest(self, term):
+        return digest(term, self.digests)
+
+    def key(self, rule, with_terms, term, theory=None):
+        h = hashlib.sha1()
+        h.update(('%d:%d:' % (len(rule.hypotheses), len(with_terms))).encode('utf-8'))
+        if theory:
+            # the same step may be valid in one theory and not in another
+            for (constructor, (associative, commutative)) in theory.signature:
+                h.update(('C%s:%d%d:' % (constructor, associative, commutative)).encode('utf-8'))
+        for hypothesis in rule.hypotheses:
+            h.update(self.digest(hypothesis.term))
+        h.update(self.digest(rule.conclusion))
+        for with_term in with_terms:
+            h.update(self.digest(with_term))
+        h.update(self.digest(term))
+        return h.hexdigest()
+
+    def verified(self, key):
+        if key in self.keys:
+            self.used.add(key)
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def add(self, key):
+        self.keys.add(key)
+        self.used.add(key)
+
+
+class InstanceCache(object):
+    """Remembers the outcomes of the most recent instantiations of rules:
+    the instance, or the error, that instantiating a rule with given
+    argument terms produced, so that instantiating the same rule with the
+    same arguments again (as a proof which uses the same lemma on the same
+    premises many times does) need not redo the work.
+
+    The outcome depends on nothing but the terms of the rule's hypotheses
+    and conclusion and the argument terms (and, in a proof which declares
+    constructors, on its theory and the term of the step), and terms are
+    hash-consed, so these terms themselves are the key.  So the cache may
+    be shared by any number of Checkers, of any number of proofs, in the
+    same process, even from different threads; a rule imported from a
+    library by many proofs has the same key in all of them.  At most
+    `size` outcomes are kept; the least recently used are forgotten first.
+
+    """
+    def __init__(self, size=65536):
+        self.size = size
+        self.outcomes = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, rule, with_terms, theory=None, term=None):
+        signature = rule._signature
+        if signature is None:
+            signature = (tuple([hypothesis.term for hypothesis in rule.hypotheses]), rule.conclusion)
+            rule._signature = signature
+        if theory:
+            # in a theory, which instance is chosen depends on the step's term
+            return (signature, tuple(with_terms), theory.signature, term)
+        return (signature, tuple(with_terms))
+
+    def instantiate(self, rule, with_terms, compute=instantiate, theory=None, term=None):
+        """Returns the instance of the rule with the given argument terms,
+        or raises the error that instantiating it does, remembering which.
+        `compute` is called, with the same arguments, to instantiate the
+        rule when the outcome is not already known.
+
+        """
+        key = self.key(rule, with_terms, theory, term)
+        with self.lock:
+            outcome = self.outcomes.pop(key, None)
+            if outcome is None:
+                self.misses += 1
+            else:
+                self.outcomes[key] = outcome
+                self.hits += 1
+        if outcome is None:
+            try:
+                outcome = compute(rule, with_terms, theory, term)
+            except (ProofStructureError, ReasoningError) as e:
+                # only the class and the message are kept, as the exception
+                # itself would keep the frames of its traceback alive
+                outcome = (e.__class__, str(e))
+            self.remember(key, outcome)
+        if isinstance(outcome, tuple):
+            (class_, message) = outcome
+            raise class_(message)
+        return outcome
+
+    def remember(self, key, outcome):
+        with self.lock:
+            self.outcomes[key] = outcome
+            while len(self.outcomes) > self.size:
+                self.outcomes.popitem(last=False)
+                self.evictions += 1
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return float(self.hits) / total if total else 0.0
+
+    def report(self, out):
+        out.write("instance cache: %d hits, %d misses (%.1f%% hit rate), %d evictions, %d of %d entries used\n" % (
+            self.hits, self.misses, self.hit_rate() * 100.0, self.evictions, len(self.outcomes), self.size
+        ))
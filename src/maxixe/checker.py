@@ -1,4 +1,8 @@
-from maxixe.ast import Block
+from maxixe.ast import Block, Step
+from maxixe.atoms import AtomEnvironment
+from maxixe.compiler import compile_rule
+from maxixe.inference import Inference
+from maxixe.relevance import Relevance
 
 
 class ProofStructureError(ValueError):
@@ -10,124 +14,326 @@ class ReasoningError(ValueError):
 
 
 class Checker(object):
-    def __init__(self, proof):
+    """Checks a proof.  `check()` checks an entire, already-parsed proof;
+    alternately, a Parser may be given a Checker, in which case it calls the
+    Checker's `begin_proof`, `begin_block`, `begin_case`, `check_step`,
+    `end_case`, `end_block` and `end_proof` methods as soon as it recognizes
+    each part of the proof, so that the proof is checked while it is parsed.
+
+    If `hooks` is given, it is a Hooks object (see `maxixe.stats`) which is
+    told about each step as it is checked, and which instantiates the rules.
+
+    If `instances` is given, it is an InstanceCache (see `maxixe.cache`)
+    which remembers the outcomes of instantiating rules, and which may be
+    shared with other Checkers.
+
+    If `goal_directed` is true, `check()` only verifies that the steps which
+    the goal depends on (see `maxixe.relevance`) follow from their rules;
+    the checks of the structure of the proof are still made for every step.
+    The Relevance found is kept in `relevance`.
+
+    If `infer` is true, steps which do not give a justification (see
+    `Parser.allow_inference`) are given one, if one can be found, by looking
+    for a rule and preceding steps that the step follows from.  Those steps
+    are listed in `inferred`.
+
+    """
+    def __init__(self, proof=None, cache=None, hooks=None, infer=False, instances=None, goal_directed=False):
         self.proof = proof
+        self.cache = cache
+        self.hooks = hooks
+        self.instances = instances
         self.current_block = None
-        self.local_atoms = set()
-        self.used_atoms = set()
+        self.atoms = AtomEnvironment()
         self.current_step = None
+        self.block_rule = None
+        self.case_num = 0
+        self.first_in_case = False
+        self.last_term = None
+        self.saved_blocks = []
+        self.infer = infer
+        self.inference = None
+        self.inferred = []
+        self.goal_directed = goal_directed
+        self.relevance = None
 
     def check(self):
+        if self.hooks is not None:
+            self.hooks.begin_phase('check')
+        if self.goal_directed:
+            self.relevance = Relevance(self.proof)
+        self.begin_proof(self.proof)
+        self.check_block(self.proof.block)
+        self.end_proof()
+        if self.hooks is not None:
+            self.hooks.end_phase('check')
+
+    def check_block(self, block):
+        """Checks the block and the blocks nested in it, keeping an explicit
+        stack of the blocks being checked (each with the position of the
+        case and the step in it which is next), so that blocks may be nested
+        to any depth.
+
+        """
+        self.begin_block(block)
+        stack = [[block, 0, None]]
+        while stack:
+            entry = stack[-1]
+            (block, case_num, step_num) = entry
+            if case_num == len(block.cases):
+                self.end_block(block)
+                stack.pop()
+                continue
+            case = block.cases[case_num]
+            if step_num is None:
+                self.begin_case(case)
+                entry[2] = 0
+            elif step_num == len(case.steps):
+                self.end_case(case)
+                entry[1] += 1
+                entry[2] = None
+            else:
+                step = case.steps[step_num]
+                entry[2] += 1
+                if isinstance(step, Block):
+                    self.begin_block(step)
+                    stack.append([step, 0, None])
+                else:
+                    self.check_step(step)
+
+    def begin_proof(self, proof):
+        self.proof = proof
         if not self.proof.goal.is_ground():
             raise ProofStructureError("goal is not ground")
+        if self.infer:
+            self.inference = Inference(proof)
 
-        self.check_block(self.proof.block)
-
+    def end_proof(self):
         if self.current_step.term != self.proof.goal:
             raise ProofStructureError("proof does not reach goal")
 
-    def check_block(self, block):
-        prev_block, prev_local_atoms = self.current_block, self.local_atoms
-        self.current_block, self.local_atoms = block, set()
+    def begin_block(self, block):
+        if self.first_in_case:
+            self.check_initial_step(block)
+        self.saved_blocks.append(
+            (self.current_block, self.block_rule, self.case_num, self.last_term)
+        )
+        self.current_block = block
+        self.atoms.push()
+        self.block_rule = self.proof.get_block_rule(block.name)
+        self.case_num = 0
+        self.last_term = None
 
-        block_rule = self.proof.get_block_rule(self.current_block.name)
-        if len(block_rule.cases) != len(block.cases):
+    def end_block(self, block):
+        if self.case_num != len(self.block_rule.cases):
             raise ProofStructureError("block must have same number of cases as block rule")
-        last_term = None
-        for (case_num, (block_rule_case, case)) in enumerate(zip(block_rule.cases, block.cases)):
-            self.check_case(case_num + 1, block_rule_case, case)
-            if last_term is None:
-                last_term = case.steps[-1].term
-            elif last_term != case.steps[-1].term:
-                raise ProofStructureError("cases do not finish with same term")
-
-        self.current_block, self.local_atoms = prev_block, prev_local_atoms
-
-    def check_case(self, case_num, block_rule_case, case):
-        if block_rule_case.initial is not None and case.steps[0].by.name != block_rule_case.initial.var.name:
-            raise ProofStructureError("initial step of case %s of %s must use rule %s" %
-                (case_num, self.current_block.name, block_rule_case.initial.var.name)
-            )
-        if block_rule_case.final is not None and case.steps[-1].by.name != block_rule_case.final.var.name:
+        (self.current_block, self.block_rule, self.case_num, self.last_term) = (
+            self.saved_blocks.pop()
+        )
+        self.atoms.pop()
+
+    def begin_case(self, case):
+        self.case_num += 1
+        if self.case_num > len(self.block_rule.cases):
+            raise ProofStructureError("block must have same number of cases as block rule")
+        self.first_in_case = True
+        if self.inference is not None:
+            self.inference.begin_case()
+
+    def end_case(self, case):
+        if not case.steps:
+            raise ProofStructureError("case %s of %s has no steps" % (self.case_num, self.current_block.name))
+        block_rule_case = self.block_rule.cases[self.case_num - 1]
+        final_step = case.steps[-1]
+        if block_rule_case.final is not None and not uses_rule(final_step, block_rule_case.final):
             raise ProofStructureError("final step of case %s of %s must use rule %s" %
-                (case_num, self.current_block.name, block_rule_case.final.var.name)
+                (self.case_num, self.current_block.name, block_rule_case.final.var.name)
             )
 
-        for step in case.steps:
-            if isinstance(step, Block):
-                self.check_block(step)
-            else:
-                self.check_step(step)
+        atom = self.atoms.find_local(final_step.term)
+        if atom is not None:
+            raise ProofStructureError("Local atom '%s' cannot be used in final step of case" % atom)
+
+        if self.last_term is None:
+            self.last_term = final_step.term
+        elif self.last_term != final_step.term:
+            raise ProofStructureError("cases do not finish with same term")
+
+        if self.inference is not None:
+            self.inference.end_case(final_step)
 
-        final_atoms = set()
-        case.steps[-1].term.collect_atoms(final_atoms)
-        for atom in self.local_atoms:
-            if atom in final_atoms:
-                raise ProofStructureError("Local atom '%s' cannot be used in final step of case" % atom)
+    def check_initial_step(self, step):
+        self.first_in_case = False
+        block_rule_case = self.block_rule.cases[self.case_num - 1]
+        if block_rule_case.initial is not None and not uses_rule(step, block_rule_case.initial):
+            raise ProofStructureError("initial step of case %s of %s must use rule %s" %
+                (self.case_num, self.current_block.name, block_rule_case.initial.var.name)
+            )
 
     def check_step(self, step):
-        block = self.current_block
+        if self.hooks is not None:
+            self.hooks.begin_step(step)
         self.current_step = step
+        if step.by is None:
+            self.infer_justification(step)
+        if self.first_in_case:
+            self.check_initial_step(step)
+        block = self.current_block
         rule = self.proof.get_rule(step.by.name)
 
         if len(rule.hypotheses) != len(step.with_):
             self.step_error("Number of arguments provided (%s) does not match number of hypotheses (%s)" %
                 (len(step.with_), len(rule.hypotheses))
             )
-        unifier = {}
         with_terms = []
         for (hypothesis, with_) in zip(rule.hypotheses, step.with_):
             if hypothesis.has_attribute('atom'):
                 if not with_.is_atom():
                     self.step_error("argument '%s' to hypothesis '%s' is not an atom" % (with_, hypothesis))
-                hypothesis.term.match(with_, unifier)
                 with_term = with_
                 if hypothesis.has_attribute('local'):
-                    self.local_atoms.add(with_term)
+                    self.atoms.add_local(with_term)
             elif hypothesis.has_attribute('term'):
-                hypothesis.term.match(with_, unifier)
                 with_term = with_
                 if hypothesis.has_attribute('nonlocal'):
-                    atoms = set()
-                    with_term.collect_atoms(atoms)
-                    for atom in self.local_atoms:
-                        if atom in atoms:
-                            self.step_error("argument '%s' to hypothesis '%s' must not contain local atom '%s'" % (
-                                with_, hypothesis, atom
-                            ))
+                    atom = self.atoms.find_local(with_term)
+                    if atom is not None:
+                        self.step_error("argument '%s' to hypothesis '%s' must not contain local atom '%s'" % (
+                            with_, hypothesis, atom
+                        ))
             else:
                 with_step, from_block = self.proof.find_step_and_block(with_.name)
                 if from_block.level > block.level:
                     if not from_block.has_as_last_step(with_step):
                         self.step_error('%s is a non-final step in an inner block' % with_.name)
-                try:
-                    hypothesis.term.match(with_step.term, unifier)
-                except ValueError as e:
-                    unifier_str = ", ".join(["%s -> %s" % (k, v) for k, v in unifier.iteritems()])
-                    self.step_error(
-                        "could not match '%s' with '%s' with unifier '%s': %s" % (
-                            hypothesis.term, with_step.term, unifier_str, e
-                        ), class_=ReasoningError
-                    )
                 with_term = with_step.term
             with_terms.append(with_term)
             if hypothesis.has_attribute('unique'):
-                if with_term in self.used_atoms:
-                    self.step_error("'%s' has already been used as an atom in this proof" % (step.by.name, with_term))
+                if self.atoms.is_used(with_term):
+                    self.step_error("'%s' has already been used as an atom in this proof" % with_term)
+
+        if self.relevance is None or step in self.relevance.reachable:
+            self.check_instance(step, rule, with_terms)
+
+        self.atoms.use(step.term)
+        if self.inference is not None:
+            self.inference.add_step(step)
+        if self.hooks is not None:
+            self.hooks.end_step(step)
+
+    def infer_justification(self, step):
+        if self.inference is None:
+            self.step_error("no justification given")
+        # The first step of a case must use the initial rule of the block
+        # rule's case, if it has one, and the last step its final rule; as
+        # it is not known yet whether this is the last step, the final rule
+        # is tried before any other.
+        block_rule_case = self.block_rule.cases[self.case_num - 1]
+        attempts = [None]
+        if self.first_in_case and block_rule_case.initial is not None:
+            attempts = [(block_rule_case.initial.var.name,)]
+        elif block_rule_case.final is not None:
+            attempts = [(block_rule_case.final.var.name,), None]
+        for rule_names in attempts:
+            for (rule, with_, with_terms) in self.inference.candidates(step.term, rule_names):
+                try:
+                    instance = instantiate(rule, with_terms, self.proof.theory, step.term)
+                except (ProofStructureError, ReasoningError):
+                    continue
+                if instance == step.term:
+                    step.by = rule.var
+                    step.with_ = with_
+                    self.inferred.append(step)
+                    return
+        self.step_error("no rule and preceding steps could be found that %s follows from" % step.term,
+                        class_=ReasoningError)
 
-        instance = rule.conclusion.subst(unifier)
-        if not instance.is_ground():
-            self.step_error("Not all variables replaced during rule instantiation")
+    def check_instance(self, step, rule, with_terms):
+        theory = self.proof.theory
+        if self.cache is not None:
+            key = self.cache.key(rule, with_terms, step.term, theory)
+            if self.cache.verified(key):
+                return
+
+        try:
+            if self.instances is not None:
+                if self.hooks is None:
+                    instance = self.instances.instantiate(rule, with_terms, theory=theory, term=step.term)
+                else:
+                    instance = self.instances.instantiate(
+                        rule, with_terms,
+                        lambda rule, with_terms, theory, term: self.hooks.instantiate(step, rule, with_terms, theory),
+                        theory, step.term
+                    )
+            elif self.hooks is None:
+                instance = instantiate(rule, with_terms, theory, step.term)
+            else:
+                instance = self.hooks.instantiate(step, rule, with_terms, theory)
+        except (ProofStructureError, ReasoningError) as e:
+            self.step_error(str(e), class_=e.__class__)
 
-        instance = instance.resolve_substs(unifier)
-        
         if instance != step.term:
             self.step_error("%s does not follow from %s with %s - it would be %s." % (
                 step.term, step.by.name, ' ; '.join([str(t) for t in with_terms]), instance
             ), class_=ReasoningError)
 
-        step.term.collect_atoms(self.used_atoms)
+        if self.cache is not None:
+            self.cache.add(key)
 
     def step_error(self, message, class_=ProofStructureError):
         message = "In %s, %s" % (self.current_step.var.name, message)
         raise class_(message)
+
+
+def uses_rule(step, rule):
+    return isinstance(step, Step) and step.by.name == rule.var.name
+
+
+def instantiate(rule, with_terms, theory=None, term=None):
+    """Returns the term obtained by instantiating the rule with the given
+    terms as the arguments to its hypotheses.  This depends on nothing but
+    the rule and the terms, so it is the part of checking a step which may
+    be cached or done elsewhere.
+
+    If a Theory which declares any of the constructors in the rule is given
+    (see `maxixe.theory`), the hypotheses are matched in that theory, where
+    there may be more than one way to match them; then the instance which is
+    `term` (the term of the step being checked) is returned, if there is one.
+
+    """
+    if theory and theory.applies_to(rule):
+        return theory.instantiate(rule, with_terms, term)
+
+    instance = compile_rule(rule)(with_terms)
+    if instance is not None:
+        return instance
+
+    unifier = unify(rule, with_terms)
+    instance = rule.conclusion.subst(unifier)
+    if not instance.is_ground():
+        raise ProofStructureError("Not all variables replaced during rule instantiation")
+
+    return instance.resolve_substs(unifier)
+
+
+def unify(rule, with_terms, theory=None, term=None):
+    """Returns the unifier obtained by matching the hypotheses of the rule
+    against the given terms (in the given theory, if any; see `instantiate`.)
+
+    """
+    if theory and theory.applies_to(rule):
+        return theory.unify(rule, with_terms, term)[0]
+
+    unifier = {}
+    for (hypothesis, with_term) in zip(rule.hypotheses, with_terms):
+        try:
+            hypothesis.term.match(with_term, unifier)
+        except ValueError as e:
+            unifier_str = ", ".join(["%s -> %s" % (k, v) for k, v in unifier.items()])
+            raise ReasoningError(
+                "could not match '%s' with '%s' with unifier '%s': %s" % (
+                    hypothesis.term, with_term, unifier_str, e
+                )
+            )
+
+    return unifier
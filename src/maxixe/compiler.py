@@ -0,0 +1,170 @@
+# encoding: UTF-8
+
+from maxixe.terms import Term, Var, has_substs
+
+
+# A rule of inference is compiled into a Python function which takes the list
+# of argument terms and returns the instance of the rule's conclusion.  The
+# hypotheses become straight-line code which checks each argument against its
+# pattern, with each variable of the rule held in a local variable of its own,
+# and with ground parts of patterns compared by identity (terms are
+# hash-consed.)  The conclusion becomes a single expression which builds the
+# instance.
+#
+# The compiled function only handles the usual case, where every argument is
+# a ground term which matches its hypothesis.  In any other case it returns
+# None (as it also does until the rule is compiled), and the caller falls back
+# to interpreting the rule, which produces the same outcome as it always has
+# (including, for an argument which does not match, an informative error
+# message.)  Rules which cannot be compiled (because a hypothesis contains a
+# substitution, or the conclusion has a variable which is not in any
+# hypothesis) are always interpreted.
+
+
+class Uncompilable(Exception):
+    pass
+
+
+# A rule is only compiled once it has been used this many times; a rule which
+# is only used once (as is typical of a premise) is cheaper to interpret.
+COMPILE_THRESHOLD = 2
+
+# Compiled code, keyed by its source.  Rules with the same shape (such as
+# premises that differ only in their conclusions) compile to the same source,
+# differing only in the constants they refer to, so can share the same code.
+_code_cache = {}
+
+
+class CompiledRule(object):
+    def __init__(self, rule):
+        self.rule = rule
+        self.uses = 0
+        self.source = None
+        self.function = None
+        self.compilable = True
+
+    def compile(self):
+        compiler = RuleCompiler(self.rule)
+        try:
+            self.source = compiler.compile()
+        except Uncompilable:
+            self.compilable = False
+            return
+        code = _code_cache.get(self.source)
+        if code is None:
+            code = compile(self.source, '<compiled rule>', 'exec')
+            _code_cache[self.source] = code
+        namespace = dict(compiler.constants)
+        namespace['Term'] = Term
+        exec(code, namespace)
+        self.function = namespace['instantiate']
+
+    def __call__(self, with_terms):
+        if self.function is None:
+            if not self.compilable:
+                return None
+            self.uses += 1
+            if self.uses < COMPILE_THRESHOLD:
+                return None
+            self.compile()
+            if self.function is None:
+                return None
+        return self.function(with_terms)
+
+
+def compile_rule(rule):
+    """Returns the compiled form of the rule, which compiles the rule once
+    it has been used often enough to be worth compiling.
+
+    """
+    compiled = rule._compiled
+    if compiled is None:
+        compiled = CompiledRule(rule)
+        rule._compiled = compiled
+    return compiled
+
+
+class RuleCompiler(object):
+    def __init__(self, rule):
+        self.rule = rule
+        self.lines = []
+        self.bound = {}
+        self.constants = {}
+        self.counter = 0
+
+    def fresh(self, prefix):
+        self.counter += 1
+        return '%s%d' % (prefix, self.counter)
+
+    def constant(self, term):
+        name = self.fresh('k')
+        self.constants[name] = term
+        return name
+
+    def emit(self, line):
+        self.lines.append('    ' + line)
+
+    def compile(self):
+        rule = self.rule
+        args = [self.fresh('a') for hypothesis in rule.hypotheses]
+        self.emit('if len(with_terms) != %d:' % len(args))
+        self.emit('    return None')
+        if args:
+            self.emit('%s, = with_terms' % ', '.join(args))
+        for arg in args:
+            self.emit('if %s.__class__ is not Term or not %s._ground:' % (arg, arg))
+            self.emit('    return None')
+        for (hypothesis, arg) in zip(rule.hypotheses, args):
+            self.match(hypothesis.term, arg)
+        if has_substs(rule.conclusion):
+            self.build_with_substs(rule.conclusion)
+        else:
+            self.emit('return %s' % self.build(rule.conclusion))
+        return 'def instantiate(with_terms):\n' + '\n'.join(self.lines) + '\n'
+
+    def match(self, pattern, name):
+        if isinstance(pattern, Var):
+            if pattern.name in self.bound:
+                self.emit('if %s is not %s:' % (name, self.bound[pattern.name]))
+                self.emit('    return None')
+            else:
+                self.bound[pattern.name] = name
+        elif not isinstance(pattern, Term):
+            raise Uncompilable(pattern)
+        elif pattern.is_ground():
+            self.emit('if %s is not %s:' % (name, self.constant(pattern)))
+            self.emit('    return None')
+        else:
+            self.emit('if %s.__class__ is not Term or %s.constructor != %r or len(%s.subterms) != %d:' % (
+                name, name, pattern.constructor, name, len(pattern.subterms)
+            ))
+            self.emit('    return None')
+            names = [self.fresh('t') for subpattern in pattern.subterms]
+            self.emit('%s, = %s.subterms' % (', '.join(names), name))
+            for (subpattern, subname) in zip(pattern.subterms, names):
+                self.match(subpattern, subname)
+
+    def build(self, term):
+        if isinstance(term, Var):
+            if term.name not in self.bound:
+                raise Uncompilable(term)
+            return self.bound[term.name]
+        elif term.is_ground():
+            return self.constant(term)
+        else:
+            return 'Term(%r, (%s,))' % (
+                term.constructor, ', '.join([self.build(subterm) for subterm in term.subterms])
+            )
+
+    def build_with_substs(self, conclusion):
+        """A conclusion containing substitutions is instantiated in the usual
+        way, with a unifier made from the variables of the hypotheses.
+
+        """
+        self.emit('unifier = {%s}' % ', '.join(
+            ['%r: %s' % (k, v) for (k, v) in sorted(self.bound.items())]
+        ))
+        self.emit('instance = %s.subst(unifier)' % self.constant(conclusion))
+        self.emit('if not instance.is_ground():')
+        self.emit('    return None')
+        self.emit('return instance.resolve_substs(unifier)')
@@ -0,0 +1,461 @@
+# encoding: UTF-8
+
+from argparse import ArgumentParser
+import codecs
+import multiprocessing
+import os
+import re
+import shlex
+import subprocess
+import sys
+import tempfile
+import traceback
+
+try:
+    from shlex import quote as shell_quote
+except ImportError:
+    from pipes import quote as shell_quote
+
+from maxixe.budget import Budget
+from maxixe.cache import InstanceCache
+from maxixe.checker import Checker
+from maxixe.parser import Parser, SugaredParser
+from maxixe.report import check_report, search_report
+from maxixe.search import Search
+
+
+# Runs the tests in Falderal documents (such as doc/Maxixe.md) in the same
+# way as `falderal` does, but without starting a process for each one: when
+# the implementation of a functionality is a shell command which runs
+# `bin/maxixe` on the test body, the body is parsed and checked in this
+# process, with the options given in the command.  Any other implementation
+# is run as a shell command, as `falderal` would run it.  The tests can be
+# spread over a pool of worker processes.
+#
+# As with `falderal`, the expected output of a test must be the same as the
+# actual output (apart from newlines at the start and end), and the expected
+# error must be found in the actual error.  For a test run in this process,
+# the actual error is the last line of the traceback, giving the class and
+# message of the exception.
+#
+# Implementations which run `bin/maxixe` with the same options under
+# different versions of Python are taken to be the same implementation, and
+# run once, under whichever version of Python is running this; to test under
+# several versions, run this under each of them.
+
+
+class FalderalSyntaxError(ValueError):
+    pass
+
+
+FREESTYLE_PREFIXES = {
+    u'<= ': u'+ ', u'<== ': u'+ ', u'<=== ': u'+ ',
+    u'=> ': u'= ', u'==> ': u'= ', u'===> ': u'= ',
+    u'?> ': u'? ', u'??> ': u'? ', u'???> ': u'? ',
+}
+PREFIXES = list(FREESTYLE_PREFIXES.keys()) + [u'| ', u'+ ', u'? ', u'= ', u'->']
+VALID_PATTERNS = [
+    [u'->'],
+    [u'> '],
+    [u'| ', u'= '],
+    [u'| ', u'? '],
+    [u'| ', u'+ ', u'= '],
+    [u'| ', u'+ ', u'? '],
+    [u'+ ', u'= '],
+    [u'+ ', u'? '],
+]
+
+TESTS_FOR = re.compile(r'^\s*Tests\s+for\s+functionality\s*\"(.*?)\"\s*$')
+IMPLEMENTED_BY = re.compile(
+    r'^\s*Functionality\s*\"(.*?)\"\s*is\s+implemented\s+by\s+shell\s+command\s*\"(.*?)\"'
+    r'(?:\s*but\s+only\s+if\s+shell\s+command\s*\"(.*?)\"\s*succeeds)?\s*$'
+)
+
+
+class Test(object):
+    def __init__(self, location, functionality, body, input, expected, error):
+        self.location = location
+        self.functionality = functionality
+        self.body = body
+        self.input = input
+        self.expected = expected
+        self.error = error
+
+    def judge(self, outcome):
+        (error, text) = outcome
+        if error != self.error:
+            return False
+        if error:
+            return self.expected in text
+        return self.expected == text
+
+
+def read_blocks(filename):
+    """Splits the lines of a Falderal document into runs of indented lines
+    (with the indentation taken off) and runs of other lines, and returns
+    them as a list of (indented, line number, lines) tuples.
+
+    """
+    blocks = []
+    with codecs.open(filename, 'r', 'utf-8') as f:
+        for (line_num, line) in enumerate(f, 1):
+            line = line.rstrip(u'\r\n')
+            indented = line.startswith(u'    ')
+            if not blocks or blocks[-1][0] != indented:
+                blocks.append((indented, line_num, []))
+            blocks[-1][2].append(line[4:] if indented else line)
+    return blocks
+
+
+def deconstruct(lines):
+    """Returns the runs of lines with the same prefix in a block, as a list
+    of (prefix, lines) pairs, with the prefixes taken off the lines.
+
+    """
+    pattern = []
+    for line in lines:
+        prefix = u''
+        for candidate in PREFIXES:
+            if line.startswith(candidate):
+                prefix = candidate
+                break
+        if not pattern or pattern[-1][0] != prefix:
+            pattern.append((prefix, []))
+        pattern[-1][1].append(line[len(prefix):])
+    return pattern
+
+
+def classify(lines, line_num):
+    """Returns the (prefix, lines) pairs of a block which is a pragma or a
+    test, or None if it is just indented text.  A block which ends with a
+    freestyle expectation (such as `===>`) is a test whose body is all of
+    the lines before it which have no freestyle prefix.
+
+    """
+    pattern = deconstruct(lines)
+    if pattern[-1][0] in FREESTYLE_PREFIXES:
+        body = []
+        rest = []
+        for (prefix, prefixed) in pattern:
+            if prefix in FREESTYLE_PREFIXES:
+                rest.append((FREESTYLE_PREFIXES[prefix], prefixed))
+            else:
+                body.extend([prefix + line for line in prefixed])
+        pattern = [(u'| ', body)] + rest
+    prefixes = [prefix for (prefix, prefixed) in pattern]
+    if u'' in prefixes:
+        return None
+    if prefixes not in VALID_PATTERNS:
+        raise FalderalSyntaxError("line %d: incorrectly formatted test block" % line_num)
+    return pattern
+
+
+def load_tests(filenames):
+    """Reads the tests, and the implementations of the functionalities they
+    test, from the given Falderal documents.  Returns a list of Tests and a
+    dict mapping the name of each functionality to a list of (command,
+    gating command) pairs.
+
+    """
+    tests = []
+    functionalities = {}
+    for filename in filenames:
+        functionality = None
+        last_body = None
+        last_input = None
+        for (indented, line_num, lines) in read_blocks(filename):
+            if not indented:
+                continue
+            pattern = classify(lines, line_num)
+            if pattern is None:
+                continue
+            parts = dict(pattern)
+            if u'->' in parts:
+                text = u' '.join(parts[u'->'])
+                match = TESTS_FOR.match(text)
+                if match:
+                    functionality = match.group(1)
+                    functionalities.setdefault(functionality, [])
+                match = IMPLEMENTED_BY.match(text)
+                if match:
+                    functionalities.setdefault(match.group(1), []).append((match.group(2), match.group(3)))
+                continue
+            if functionality is None:
+                raise FalderalSyntaxError("line %d: functionality under test not specified" % line_num)
+            if u'| ' in parts:
+                last_body = u'\n'.join(parts[u'| '])
+            if u'+ ' in parts:
+                last_input = u'\n'.join(parts[u'+ '])
+            error = u'? ' in parts
+            expected = u'\n'.join(parts[u'? '] if error else parts[u'= '])
+            tests.append(Test(
+                "%s, line %d" % (filename, line_num), functionality, last_body, last_input, expected, error
+            ))
+    return (tests, functionalities)
+
+
+class OptionError(Exception):
+    pass
+
+
+class OptionParser(ArgumentParser):
+    def error(self, message):
+        raise OptionError(message)
+
+
+OPTIONS = OptionParser(add_help=False)
+OPTIONS.add_argument('--sugar', action='store_true')
+OPTIONS.add_argument('--stream', action='store_true')
+OPTIONS.add_argument('--infer', action='store_true')
+OPTIONS.add_argument('--goal-directed', action='store_true')
+OPTIONS.add_argument('--search', action='store_true')
+OPTIONS.add_argument('--depth', type=int, default=5)
+OPTIONS.add_argument('--timeout', type=float, default=10.0)
+OPTIONS.add_argument('--memo', type=int, default=0)
+OPTIONS.add_argument('--max-steps', type=int, default=None)
+OPTIONS.add_argument('--max-nodes', type=int, default=None)
+
+
+def maxixe_options(command):
+    """If the command runs `bin/maxixe` (directly, or with a Python
+    interpreter) on the test body, with only options that can be carried out
+    in this process, returns those options as a tuple of (name, value)
+    pairs.  Otherwise, returns None.
+
+    """
+    try:
+        words = shlex.split(command)
+    except ValueError:
+        return None
+    for (index, word) in enumerate(words):
+        if os.path.basename(word) == 'maxixe':
+            break
+    else:
+        return None
+    if index > 1 or (index == 1 and not os.path.basename(words[0]).startswith('python')):
+        return None
+    args = words[index + 1:]
+    if args.count('%(test-body-file)') != 1:
+        return None
+    args.remove('%(test-body-file)')
+    try:
+        options = OPTIONS.parse_args(args)
+    except OptionError:
+        return None
+    if options.goal_directed and (options.stream or options.infer):
+        return None
+    return tuple(sorted(vars(options).items()))
+
+
+def decode(text):
+    if not isinstance(text, type(u'')):
+        text = text.decode('utf-8', 'replace')
+    return text
+
+
+# The InstanceCaches used by the tests run in this process, by size.
+_instances = {}
+
+
+def run_maxixe(options, body):
+    """Does in this process what `bin/maxixe`, given the options, would do
+    with the test body, and returns the outcome, as an (error, text) pair.
+    The text is made by `maxixe.report`, as it is by `bin/maxixe`.
+
+    """
+    options = dict(options)
+    parser_cls = SugaredParser if options['sugar'] else Parser
+    instances = None
+    if options['memo'] > 0:
+        instances = _instances.setdefault(options['memo'], InstanceCache(options['memo']))
+    hooks = None
+    if options['max_steps'] is not None or options['max_nodes'] is not None:
+        hooks = Budget(steps=options['max_steps'], nodes=options['max_nodes'])
+    if str is bytes:
+        body = body.encode('utf-8')
+    lines = []
+    try:
+        if options['search']:
+            p = parser_cls(body)
+            p.allow_gaps = True
+            steps = Search(p.proof(), depth=options['depth'], timeout=options['timeout']).search()
+            lines.extend(search_report(steps))
+        else:
+            if options['stream']:
+                p = parser_cls(body.splitlines(True), hooks=hooks)
+                p.allow_inference = options['infer']
+                c = Checker(hooks=hooks, infer=options['infer'], instances=instances)
+                p.proof(checker=c)
+            else:
+                p = parser_cls(body, hooks=hooks)
+                p.allow_inference = options['infer']
+                c = Checker(p.proof(), hooks=hooks, infer=options['infer'], instances=instances,
+                            goal_directed=options['goal_directed'])
+                c.check()
+            lines.extend(check_report(c))
+    except Exception as e:
+        return (True, decode(''.join(traceback.format_exception_only(e.__class__, e))).strip(u'\r\n'))
+    return (False, u'\n'.join([decode(line) for line in lines]).strip(u'\r\n'))
+
+
+def run_shell(command, body, input):
+    """Runs the command in a shell, as `falderal` would, and returns the
+    outcome, as an (error, text) pair.
+
+    """
+    original = command
+    filenames = []
+    variables = (
+        ('%(test-body-file)', body, True), ('%(test-input-file)', input, True),
+        ('%(test-body-text)', body, False), ('%(test-input-text)', input, False),
+    )
+    for (variable, value, is_file) in variables:
+        if variable in command:
+            if is_file:
+                (fd, filename) = tempfile.mkstemp()
+                os.close(fd)
+                with codecs.open(filename, 'w', 'utf-8') as f:
+                    f.write(value or u'')
+                filenames.append(filename)
+                value = filename
+            command = command.replace(variable, shell_quote(value or u''))
+    stdin = None
+    if '%(test-input-file)' not in original and '%(test-input-text)' not in original:
+        stdin = input
+    if '%(test-body-file)' not in original and '%(test-body-text)' not in original:
+        stdin = body
+    try:
+        pipe = subprocess.Popen(command, shell=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE)
+        (out, err) = pipe.communicate(None if stdin is None else stdin.encode('utf-8'))
+    finally:
+        for filename in filenames:
+            os.unlink(filename)
+    out = out.decode('utf-8', 'ignore').replace(u'\r\n', u'\n').strip(u'\r\n')
+    if pipe.returncode == 0:
+        return (False, out)
+    err = err.decode('utf-8', 'ignore').replace(u'\r\n', u'\n').strip(u'\r\n')
+    return (True, err or out)
+
+
+def run_test(args):
+    (implementation, body, input) = args
+    (kind, how) = implementation
+    if kind == 'maxixe':
+        return run_maxixe(how, body)
+    return run_shell(how, body, input)
+
+
+def implementations_of(commands):
+    """Returns the distinct implementations among the given (command, gating
+    command) pairs, leaving out those whose gating command fails.  Each
+    implementation is a ('maxixe', options) pair if it can be run in this
+    process, or a ('shell', command) pair if not.
+
+    """
+    implementations = []
+    for (command, gating_command) in commands:
+        if gating_command:
+            with open(os.devnull, 'w') as devnull:
+                if subprocess.call(gating_command, shell=True, stdout=devnull, stderr=devnull) != 0:
+                    continue
+        options = maxixe_options(command)
+        implementation = ('shell', command) if options is None else ('maxixe', options)
+        if implementation not in implementations:
+            implementations.append(implementation)
+    return implementations
+
+
+def describe(implementation):
+    (kind, how) = implementation
+    if kind == 'maxixe':
+        flags = []
+        for (name, value) in how:
+            default = OPTIONS.get_default(name)
+            if value != default:
+                flag = '--' + name.replace('_', '-')
+                flags.append(flag if value is True else '%s %s' % (flag, value))
+        return ' '.join(['maxixe (in-process)'] + flags)
+    return 'shell command "%s"' % how
+
+
+def run_tests(filenames, jobs=None, out=sys.stdout):
+    """Runs the tests in the given Falderal documents against every
+    implementation of the functionalities they test, using a pool of `jobs`
+    worker processes (by default, one per CPU), and writes a report of the
+    failures, and a summary, to `out`, in the manner of `falderal`.
+
+    Returns a process exit code: 0 if every test passed, 1 otherwise.
+
+    """
+    try:
+        (tests, functionalities) = load_tests(filenames)
+        implementations = {}
+        for (name, commands) in functionalities.items():
+            implementations[name] = implementations_of(commands)
+            if not implementations[name]:
+                raise FalderalSyntaxError("No implementations were found for the functionality '%s'" % name)
+        if not tests:
+            raise FalderalSyntaxError("No tests were found in any of the test documents")
+    except FalderalSyntaxError as e:
+        sys.stderr.write('%s: %s\n' % (e.__class__.__name__, e))
+        return 1
+
+    runs = []
+    for test in tests:
+        for implementation in implementations[test.functionality]:
+            runs.append((test, implementation))
+    work = [(implementation, test.body, test.input) for (test, implementation) in runs]
+
+    if jobs is None:
+        jobs = multiprocessing.cpu_count()
+    if jobs > 1 and len(work) > 1:
+        pool = multiprocessing.Pool(min(jobs, len(work)))
+        outcomes = pool.imap(run_test, work, chunksize=max(1, len(work) // (jobs * 4)))
+    else:
+        pool = None
+        outcomes = (run_test(w) for w in work)
+
+    failures = 0
+    try:
+        for ((test, implementation), outcome) in zip(runs, outcomes):
+            if test.judge(outcome):
+                continue
+            failures += 1
+            for (field, text) in (
+                ("Location: ", test.location),
+                ("Function: ", test.functionality),
+                ("Impl    : ", describe(implementation)),
+                ("Body    : ", test.body),
+                ("Expected: ", ('error:\n' if test.error else 'output:\n') + test.expected),
+                ("Actual  : ", ('error:\n' if outcome[0] else 'output:\n') + outcome[1]),
+            ):
+                out.write(field + ('\n' if '\n' in text and not text.startswith(('output:', 'error:')) else ''))
+                out.write(text if str is not bytes else text.encode('utf-8'))
+                out.write('\n')
+            out.write('\n')
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    out.write('--------------------------------\n')
+    out.write('Total test runs: %d, failures: %d\n' % (len(runs), failures))
+    out.write('--------------------------------\n')
+    return 0 if failures == 0 else 1
+
+
+def main(args):
+    argparser = ArgumentParser(prog='python -m maxixe.falderal')
+    argparser.add_argument('filenames', metavar='FILENAME', nargs='+',
+        help="Falderal documents containing the tests, and the implementations of their functionalities"
+    )
+    argparser.add_argument('-j', '--jobs', metavar='N', type=int, default=None,
+        help="Number of worker processes to use (default: one per CPU)"
+    )
+    options = argparser.parse_args(args)
+    return run_tests(options.filenames, jobs=options.jobs)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,120 @@
+# encoding: UTF-8
+
+from maxixe.terms import Term
+
+
+# A discrimination tree indexes terms by the sequence of their symbols, in
+# prefix order, so that, given a term, the indexed terms which could match
+# it can be found without looking at any of the others.  Each symbol is a
+# (constructor, number of subterms) pair, and every variable is the same
+# symbol, STAR.  So a variable in an indexed term stands for any subterm of
+# the term being looked up, and vice versa.
+
+STAR = None
+
+
+def symbols(term):
+    """Returns the symbols of the term in prefix order.  Anything which is
+    not a Term (a variable, or a term with substitutions in it) is STAR.
+
+    """
+    result = []
+    stack = [term]
+    while stack:
+        term = stack.pop()
+        if isinstance(term, Term):
+            result.append((term.constructor, len(term.subterms)))
+            stack.extend(reversed(term.subterms))
+        else:
+            result.append(STAR)
+    return result
+
+
+def arity(symbol):
+    return 0 if symbol is STAR else symbol[1]
+
+
+class DiscriminationTree(object):
+    """Maps terms to values, and finds the values of the terms which may
+    unify with a given term.  Values are returned in the order in which they
+    were added.
+
+    """
+    def __init__(self):
+        self.root = ({}, [])
+        self.count = 0
+
+    def add(self, term, value):
+        node = self.root
+        for symbol in symbols(term):
+            child = node[0].get(symbol)
+            if child is None:
+                child = ({}, [])
+                node[0][symbol] = child
+            node = child
+        node[1].append((self.count, value))
+        self.count += 1
+
+    def unifiable(self, term):
+        """Returns the values of the terms which may unify with the given
+        term: those which it may be an instance of (such as the patterns of
+        rules, for a ground term), and those which may be instances of it
+        (such as ground terms, for a pattern.)  Only the symbols are
+        compared, so the terms found do not always unify with it; the terms
+        not found never do.
+
+        """
+        keys = symbols(term)
+        ends = subterm_ends(keys)
+        found = []
+        stack = [(self.root, 0)]
+        while stack:
+            (node, i) = stack.pop()
+            if i == len(keys):
+                found.extend(node[1])
+            elif keys[i] is STAR:
+                for child in skip_subterm(node):
+                    stack.append((child, i + 1))
+            else:
+                child = node[0].get(keys[i])
+                if child is not None:
+                    stack.append((child, i + 1))
+                child = node[0].get(STAR)
+                if child is not None:
+                    stack.append((child, ends[i]))
+        found.sort(key=lambda entry: entry[0])
+        return [value for (n, value) in found]
+
+
+def subterm_ends(keys):
+    """Returns a list giving, for each position in the list of symbols, the
+    position just after the subterm which starts there.
+
+    """
+    ends = [0] * len(keys)
+    stack = []
+    for i in range(len(keys) - 1, -1, -1):
+        end = i + 1
+        for n in range(arity(keys[i])):
+            end = stack.pop()
+        ends[i] = end
+        stack.append(end)
+    return ends
+
+
+def skip_subterm(node):
+    """Returns the nodes reached from the given node by following the
+    symbols of exactly one complete subterm.
+
+    """
+    reached = []
+    stack = [(node, 1)]
+    while stack:
+        (node, needed) = stack.pop()
+        for (symbol, child) in node[0].items():
+            remaining = needed - 1 + arity(symbol)
+            if remaining == 0:
+                reached.append(child)
+            else:
+                stack.append((child, remaining))
+    return reached
@@ -0,0 +1,185 @@
+# encoding: UTF-8
+
+from maxixe.ast import Rule, BlockRule
+from maxixe.index import DiscriminationTree
+from maxixe.terms import Term, Var, partial_subst
+
+
+class Inference(object):
+    """Finds justifications for the steps of a proof which do not give one.
+    The conclusions of the rules of the proof are kept in a discrimination
+    tree, and so are the terms of the steps which can be referred to from
+    the step being checked, so that the rules whose conclusion the step's
+    term could be an instance of, and the steps which could be the arguments
+    to their hypotheses, are found without trying every one.
+
+    `begin_case`, `end_case` and `add_step` must be called as the proof is
+    checked, to keep track of which steps can be referred to.
+
+    """
+    def __init__(self, proof):
+        self.rules = DiscriminationTree()
+        (rules, self.case_rule_names) = rules_of(proof)
+        for rule in rules:
+            self.rules.add(rule.conclusion, rule)
+        self.scopes = [DiscriminationTree()]
+
+    def begin_case(self):
+        self.scopes.append(DiscriminationTree())
+
+    def end_case(self, final_step):
+        """Leaves the case.  Of the steps in it, only its final step can be
+        referred to after it.
+
+        """
+        self.scopes.pop()
+        self.add_step(final_step)
+
+    def add_step(self, step):
+        self.scopes[-1].add(step.term, step)
+
+    def steps(self, pattern):
+        found = []
+        for scope in self.scopes:
+            found.extend(scope.unifiable(pattern))
+        return found
+
+    def candidates(self, term, rule_names=None):
+        """Yields (rule, arguments, argument terms) triples which may justify
+        a step with the given term, where the arguments are what would follow
+        `with` in the step, and the argument terms are the terms they stand
+        for.  If `rule_names` is given, only those rules are tried;
+        otherwise, all of them are, except the rules of block rules, which
+        can only justify the first and last steps of the cases of blocks.
+        Each candidate must still be checked by instantiating the rule.
+
+        """
+        for rule in self.rules.unifiable(term):
+            if rule_names is None:
+                if rule.var.name in self.case_rule_names:
+                    continue
+            elif rule.var.name not in rule_names:
+                continue
+            unifier = {}
+            if not match(rule.conclusion, term, unifier):
+                continue
+            for arguments in self.solve(rule.hypotheses, {}, unifier):
+                with_ = []
+                with_terms = []
+                for i in range(len(rule.hypotheses)):
+                    argument = arguments[i]
+                    if isinstance(argument, Term):
+                        with_.append(argument)
+                        with_terms.append(argument)
+                    else:
+                        with_.append(argument.var)
+                        with_terms.append(argument.term)
+                yield (rule, with_, with_terms)
+
+    def solve(self, hypotheses, arguments, unifier):
+        """Yields each assignment of arguments (a dict from the position of
+        each hypothesis to a step, or, for a hypothesis which takes a term,
+        to a term) which is consistent with the unifier.  The hypotheses
+        which are most constrained by the unifier are done first.
+
+        """
+        if len(arguments) == len(hypotheses):
+            yield arguments
+            return
+        (i, pattern) = choose(hypotheses, arguments, unifier)
+        hypothesis = hypotheses[i]
+        if hypothesis.has_attribute('term') or hypothesis.has_attribute('atom'):
+            if pattern.is_ground() and (pattern.is_atom() or not hypothesis.has_attribute('atom')):
+                arguments[i] = pattern
+                for result in self.solve(hypotheses, arguments, unifier):
+                    yield result
+                del arguments[i]
+            return
+        for step in self.steps(pattern):
+            extended = dict(unifier)
+            if match(pattern, step.term, extended):
+                arguments[i] = step
+                for result in self.solve(hypotheses, arguments, extended):
+                    yield result
+                del arguments[i]
+
+
+def rules_of(proof):
+    """Returns the rules of the proof (including those of the libraries it
+    imports) in the order they are given, and the set of the names of those
+    which are rules of block rules.
+
+    """
+    rule_map = proof.rule_map
+    block_rule_map = proof.block_rule_map
+    case_rule_names = set()
+    for name in all_names(block_rule_map):
+        for case in block_rule_map[name].cases:
+            for rule in (case.initial, case.final):
+                if rule is not None:
+                    case_rule_names.add(rule.var.name)
+    rules = []
+    for rule in proof.rules:
+        if isinstance(rule, Rule):
+            rules.append(rule)
+        elif isinstance(rule, BlockRule):
+            for case in rule.cases:
+                for case_rule in (case.initial, case.final):
+                    if case_rule is not None:
+                        rules.append(case_rule)
+    names = set(rule.var.name for rule in rules)
+    for name in sorted(all_names(rule_map)):
+        if name not in names:
+            rules.append(rule_map[name])
+    return (rules, case_rule_names)
+
+
+def all_names(lazy_map):
+    return list(lazy_map) + list(getattr(lazy_map, 'pending', ()))
+
+
+def choose(hypotheses, arguments, unifier):
+    """Returns the position of the hypothesis, of those not yet given an
+    argument, whose term is the most determined by the unifier, along with
+    its term with the unifier applied to it as far as it can be.  Hypotheses
+    which take terms come last unless they are already determined, as only
+    the other hypotheses can determine them.
+
+    """
+    best = None
+    for (i, hypothesis) in enumerate(hypotheses):
+        if i in arguments:
+            continue
+        pattern = partial_subst(hypothesis.term, unifier)
+        if pattern.is_ground():
+            rank = 0
+        elif hypothesis.has_attribute('term') or hypothesis.has_attribute('atom'):
+            rank = 3
+        else:
+            rank = 1 if isinstance(pattern, Term) else 2
+        if best is None or rank < best[0]:
+            best = (rank, i, pattern)
+    return best[1:]
+
+
+def match(pattern, term, unifier):
+    """Like `pattern.match(term, unifier)`, but returns whether they match
+    instead of raising an error, and a part of the pattern which has
+    substitutions in it matches anything (the match is only a filter; the
+    rule is still instantiated to see if the step follows from it.)
+
+    """
+    if isinstance(pattern, Var):
+        bound = unifier.get(pattern.name)
+        if bound is None:
+            unifier[pattern.name] = term
+            return True
+        return bound is term
+    if not isinstance(pattern, Term):
+        return True
+    if pattern.constructor != term.constructor or len(pattern.subterms) != len(term.subterms):
+        return False
+    for (subpattern, subterm) in zip(pattern.subterms, term.subterms):
+        if not match(subpattern, subterm, unifier):
+            return False
+    return True
@@ -0,0 +1,257 @@
+# encoding: UTF-8
+
+import hashlib
+import os
+import threading
+
+from maxixe.scanner import Symbols, tokenize
+
+
+# A library is a file of rules and block rules (and imports of other
+# libraries, and declarations of the operators its rules are written with),
+# which a proof can import into its `given` section.  Each library is read
+# once per process (for each parser class), and kept until its contents
+# change.
+#
+# When a library is first read, it is only skimmed: it is tokenized, and the
+# position of each rule and block rule is noted, but nothing is parsed.  A
+# rule is only parsed when a proof actually refers to it (and a block rule,
+# along with the rules in it, when a proof uses it or one of its rules.)
+# The operators a library declares are used to parse its own rules, but not
+# the proof which imports it.
+
+_libraries = {}
+_libraries_lock = threading.Lock()
+
+
+class LazyMap(dict):
+    """A dict in which some entries are deferred: they are only made, by
+    calling the function given for them, when they are first looked up.
+    Deferred entries count as being in the dict, but are not included when
+    iterating over it.
+
+    """
+    def __init__(self, *args, **kwargs):
+        super(LazyMap, self).__init__(*args, **kwargs)
+        self.pending = {}
+
+    def defer(self, name, load):
+        self.pending[name] = load
+
+    def __missing__(self, name):
+        load = self.pending[name]
+        value = load(name)
+        self[name] = value
+        self.pending.pop(name, None)
+        return value
+
+    def __contains__(self, name):
+        return dict.__contains__(self, name) or name in self.pending
+
+    def get(self, name, default=None):
+        if name in self:
+            return self[name]
+        return default
+
+
+class Library(object):
+    def __init__(self, filename, text, digest, parser_cls):
+        self.filename = filename
+        self.text = text
+        self.digest = digest
+        self.parser_cls = parser_cls
+        self.imports = []
+        self.operators = []
+        self.rule_starts = {}
+        self.block_rule_starts = {}
+        self.rules = {}
+        self.block_rules = {}
+        self.lock = threading.Lock()
+        self.skim()
+
+    def skim(self):
+        """Notes where each rule and block rule in the library begins.  The
+        rules of a block rule are noted as beginning where the block rule
+        does, as they are parsed along with it.  Operator declarations are
+        parsed as they are found, and the rest of the library is tokenized
+        again, so that their symbols are scanned as such.
+
+        """
+        symbols = Symbols()
+        for operator in self.parser_cls.OPERATORS:
+            symbols.declare(operator[0])
+        tokens = list(tokenize(self.text, symbols=symbols))
+        i = 0
+        while tokens[i][0] != 'EOF':
+            (type, token) = tokens[i][:2]
+            if token == 'operator':
+                parser = self.parser(token_start(tokens[i]))
+                self.operators.append(parser.operator())
+                symbols.declare(self.operators[-1][0])
+                end = parser.scanner.pos - len(parser.scanner.token or '')
+                tokens = tokens[:i] + list(tokenize(self.text, end, symbols))
+            elif token == 'import' and tokens[i + 1][0] == 'string':
+                self.imports.append(resolve_import(tokens[i + 1][1][1:-1], self.filename))
+                i += 2
+            elif token == 'block':
+                start = token_start(tokens[i])
+                self.block_rule_starts[tokens[i + 1][1]] = start
+                depth = 0
+                i += 2
+                while tokens[i][0] != 'EOF':
+                    if tokens[i][1] == 'case':
+                        depth += 1
+                    elif tokens[i][1] == 'end':
+                        if depth == 0:
+                            break
+                        depth -= 1
+                    elif tokens[i][1] == '=':
+                        self.rule_starts[rule_name(tokens, i)] = start
+                    i += 1
+                i += 1
+            elif type == 'variable':
+                self.rule_starts[token] = token_start(tokens[i])
+                while tokens[i][0] != 'EOF' and tokens[i][1] != '|-':
+                    i += 1
+                i = skip_term(tokens, i + 1)
+            elif token == 'constructor':
+                raise SyntaxError("Constructors can only be declared in a proof, not in a library (in %s, line %s, column %s)" %
+                                  (self.filename, tokens[i][3], tokens[i][4]))
+            else:
+                raise SyntaxError("Expected rule, block rule, import or operator, but found '%s' (in %s, line %s, column %s)" %
+                                  (token, self.filename, tokens[i][3], tokens[i][4]))
+
+    def rule(self, name):
+        rule = self.rules.get(name)
+        if rule is None:
+            with self.lock:
+                if name not in self.rules:
+                    self.parse(self.rule_starts[name])
+            rule = self.rules[name]
+        return rule
+
+    def block_rule(self, name):
+        block_rule = self.block_rules.get(name)
+        if block_rule is None:
+            with self.lock:
+                if name not in self.block_rules:
+                    self.parse(self.block_rule_starts[name])
+            block_rule = self.block_rules[name]
+        return block_rule
+
+    def parser(self, start):
+        """Returns a parser of the library's text from the given position,
+        which knows the operators that the library declares.
+
+        """
+        parser = self.parser_cls(self.text, filename=self.filename, start=start)
+        for operator in self.operators:
+            parser.declare_operator(*operator)
+        return parser
+
+    def parse(self, start):
+        parser = self.parser(start)
+        if parser.scanner.on('block'):
+            block_rule = parser.block_rule()
+            self.block_rules[block_rule.name.name] = block_rule
+        else:
+            parser.rule()
+        self.rules.update(parser.rule_map)
+
+
+def token_start(token):
+    return token[2] - len(token[1])
+
+
+def rule_name(tokens, i):
+    """Given the index of the `=` of a rule, returns the rule's name, which
+    is the variable before it (and before its attributes, if it has any.)
+
+    """
+    i -= 1
+    if tokens[i][1] == '}':
+        while tokens[i][1] != '{':
+            i -= 1
+        i -= 1
+    return tokens[i][1]
+
+
+def skip_term(tokens, i):
+    """Returns the index of the first token after the term which starts at
+    the given index.  Any infix operators (those of the parser class, and
+    those the library declares) are skipped along with the terms on either
+    side of them.
+
+    """
+    while True:
+        i += 1
+        for (opening, closing) in (('(', ')'), ('[', ']')):
+            if tokens[i][1] == opening:
+                depth = 0
+                while tokens[i][0] != 'EOF':
+                    if tokens[i][1] == opening:
+                        depth += 1
+                    elif tokens[i][1] == closing:
+                        depth -= 1
+                        if depth == 0:
+                            break
+                    i += 1
+                i += 1
+        if tokens[i][0] == 'symbol' and tokens[i + 1][0] in ('variable', 'atom'):
+            i += 1
+            continue
+        return i
+
+
+def resolve_import(path, filename=None):
+    """Returns the absolute path of an imported file.  It is found relative
+    to the directory of the file which imports it, or, failing that, the
+    current directory.
+
+    """
+    if filename is not None:
+        candidate = os.path.join(os.path.dirname(filename), path)
+        if os.path.exists(candidate):
+            return os.path.realpath(candidate)
+    return os.path.realpath(path)
+
+
+def load_library(filename, parser_cls):
+    """Returns the library in the named file.  The library is only skimmed
+    again if the file's contents have changed since it was last skimmed.
+
+    """
+    with open(filename, 'r') as f:
+        text = f.read()
+    data = text if isinstance(text, bytes) else text.encode('utf-8')
+    digest = hashlib.sha1(data).hexdigest()
+    key = (filename, parser_cls)
+    library = _libraries.get(key)
+    if library is None or library.digest != digest:
+        with _libraries_lock:
+            library = _libraries.get(key)
+            if library is None or library.digest != digest:
+                library = Library(filename, text, digest, parser_cls)
+                _libraries[key] = library
+    return library
+
+
+def import_library(filename, parser_cls, rule_map, block_rule_map, imported):
+    """Adds the rules and block rules of the library in the named file (and
+    of the libraries it imports) to the given LazyMaps, as deferred entries.
+    `imported` is the list of libraries already imported, which are not
+    imported again.
+
+    """
+    if filename in imported:
+        return
+    imported.append(filename)
+    library = load_library(filename, parser_cls)
+    for path in library.imports:
+        import_library(path, parser_cls, rule_map, block_rule_map, imported)
+    for name in library.rule_starts:
+        if name in rule_map:
+            raise ValueError("name has already been used for a rule of inference")
+        rule_map.defer(name, library.rule)
+    for name in library.block_rule_starts:
+        block_rule_map.defer(name, library.block_rule)
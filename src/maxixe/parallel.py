@@ -0,0 +1,146 @@
+# encoding: UTF-8
+
+import multiprocessing
+
+from maxixe.ast import Block
+from maxixe.budget import Budget
+from maxixe.checker import Checker, instantiate
+from maxixe.terms import Var
+
+
+class ParallelChecker(Checker):
+    """A Checker which first verifies, across a pool of worker processes,
+    that every step's term is the instance of its rule that its arguments
+    give, and then makes the usual sequential pass over the proof, which
+    now only needs to make the cheap checks that depend on the position of
+    each step (and on the atoms used before it.)
+
+    Instantiating a rule for a step needs nothing but the rule and the terms
+    of the steps it cites, and those are the terms as written in the proof,
+    not anything computed while checking it.  So the steps (and the cases
+    of blocks) are all independent of each other in this respect, and can
+    be verified in any order.  Any step that was not verified by the pool is
+    checked as usual in the sequential pass, which reports the error in
+    exactly the way the sequential checker would.
+
+    If there is a VerificationCache, the steps it already has are not sent
+    to the pool, and those which the pool verifies are added to it, just as
+    the sequential checker would add them.
+
+    If the hooks are a Budget, the pool is not used, as the work done in the
+    worker processes could not be charged to it; the proof is checked by
+    the sequential pass alone.
+
+    """
+    def __init__(self, proof, jobs=None, min_tasks=256, **kwargs):
+        super(ParallelChecker, self).__init__(proof, **kwargs)
+        self.jobs = jobs or multiprocessing.cpu_count()
+        self.min_tasks = min_tasks
+        self.verified = set()
+
+    def check(self):
+        tasks = collect_tasks(self.proof)
+        if self.cache is not None:
+            tasks = [task for task in tasks if self.task_key(task) not in self.cache.keys]
+        if self.jobs > 1 and len(tasks) >= self.min_tasks and not isinstance(self.hooks, Budget):
+            rule_map = dict([(task[0], self.proof.rule_map[task[0]]) for task in tasks])
+            self.verified = verify_tasks(rule_map, tasks, self.jobs, self.proof.theory)
+        super(ParallelChecker, self).check()
+
+    def task_key(self, task):
+        (rule_name, with_terms, term) = task
+        return self.cache.key(self.proof.rule_map[rule_name], with_terms, term, self.proof.theory)
+
+    def check_instance(self, step, rule, with_terms):
+        task = (rule.var.name, tuple(with_terms), step.term)
+        if task not in self.verified:
+            super(ParallelChecker, self).check_instance(step, rule, with_terms)
+        elif self.cache is not None:
+            key = self.task_key(task)
+            if not self.cache.verified(key):
+                self.cache.add(key)
+
+
+def collect_tasks(proof):
+    """Returns a list of the distinct (rule name, argument terms, term)
+    triples that need to be verified for the steps of the proof.  Steps with
+    structural problems are left out; the sequential pass will report them.
+
+    """
+    tasks = set()
+    blocks = [proof.block]
+    while blocks:
+        block = blocks.pop()
+        for case in block.cases:
+            for step in case.steps:
+                if isinstance(step, Block):
+                    blocks.append(step)
+                else:
+                    task = step_task(proof, step)
+                    if task is not None:
+                        tasks.add(task)
+    return list(tasks)
+
+
+def step_task(proof, step):
+    if step.by is None:
+        return None
+    rule = proof.rule_map.get(step.by.name)
+    if rule is None or len(rule.hypotheses) != len(step.with_):
+        return None
+    with_terms = []
+    for (hypothesis, with_) in zip(rule.hypotheses, step.with_):
+        if hypothesis.has_attribute('atom') or hypothesis.has_attribute('term'):
+            with_terms.append(with_)
+        elif isinstance(with_, Var) and with_.name in proof.step_map:
+            with_terms.append(proof.step_map[with_.name][0].term)
+        else:
+            return None
+    return (step.by.name, tuple(with_terms), step.term)
+
+
+def verify_tasks(rule_map, tasks, jobs, theory=None):
+    """Verifies the tasks in a pool of worker processes, and returns the
+    set of those which were found to be valid.  The rules and tasks are
+    handed to each worker once, when it starts (where processes are forked,
+    they are simply inherited), so only ranges of task indices and lists of
+    verdicts need to pass between the processes.  The rules are instantiated
+    in the given theory, if any (see `maxixe.theory`.)
+
+    """
+    chunk_size = max(1, len(tasks) // (jobs * 4))
+    ranges = [(i, min(i + chunk_size, len(tasks))) for i in range(0, len(tasks), chunk_size)]
+    pool = multiprocessing.Pool(jobs, initializer=_init_worker, initargs=(rule_map, tasks, theory))
+    try:
+        verified = set()
+        for ((start, stop), results) in zip(ranges, pool.imap(_verify_range, ranges)):
+            for (task, valid) in zip(tasks[start:stop], results):
+                if valid:
+                    verified.add(task)
+        return verified
+    finally:
+        pool.close()
+        pool.join()
+
+
+_rule_map = None
+_tasks = None
+_theory = None
+
+
+def _init_worker(rule_map, tasks, theory):
+    global _rule_map, _tasks, _theory
+    _rule_map = rule_map
+    _tasks = tasks
+    _theory = theory
+
+
+def _verify_range(range_):
+    results = []
+    for (rule_name, with_terms, term) in _tasks[range_[0]:range_[1]]:
+        try:
+            valid = instantiate(_rule_map[rule_name], with_terms, _theory, term) is term
+        except Exception:
+            valid = False
+        results.append(valid)
+    return results
@@ -2,10 +2,16 @@
 
 from maxixe.ast import Proof, Rule, BlockRule, BlockRuleCase, Hyp, Subst, Block, BlockCase, Step
 from maxixe.terms import Term, Var, Substor
-from maxixe.scanner import Scanner
+from maxixe.scanner import Scanner, declarable
+from maxixe.theory import Theory
+from maxixe.library import LazyMap, import_library, resolve_import
 
 
-# Proof         ::= "given" {Rule | BlockRule} "show" Term "proof" {Step | Block} "qed".
+# Proof         ::= "given" {Import | Operator | Constructor | Rule | BlockRule} "show" Term "proof" {Step | Block} ["..."] "qed".
+# Import        ::= "import" <<string>>.
+# Operator      ::= "operator" <<string>> Atom <<number>> ("left" | "right").
+# Constructor   ::= "constructor" Atom Attributes.
+#                   (The attributes are "associative" and/or "commutative".)
 # Rule          ::= Var Attributes "=" [Hyp {";" Hyp}] "|-" Term.
 # BlockRule     ::= "block" Var ({BlockRuleCase} | Rule [Rule]) "end".
 # BlockRuleCase ::= "case" Rule [Rule] "end".
@@ -14,37 +20,146 @@ from maxixe.scanner import Scanner
 # Block         ::= "block" Var ({BlockCase} | {Step | Block}) "end".
 # BlockCase     ::= "case" {Step | Block} "end".
 # Step          ::= Var "=" Term "by" Var ["with" Term {"," Term}].
-# Term          ::= Var | Atom ["(" Term {"," Term} ")"] ["[" Subst {"," Subst} "]"].
+#                   (With `allow_inference`, the "by" part may be left out.)
+# Term          ::= BasicTerm {<<operator>> BasicTerm}.
+# BasicTerm     ::= Var | Atom ["(" Term {"," Term} ")"] ["[" Subst {"," Subst} "]"].
 # Subst         ::= Term "->" Term.
 # Var           ::= <<A-Z followed by alphanumeric + _>>
 # Atom          ::= <<a-z0-9 followed by alphanumeric + _>>
 
 
 class Parser(object):
-    def __init__(self, text):
-        self.scanner = Scanner(text)
+    """Parses a proof from the given text.  If `hooks` is given, it is a
+    Hooks object (see `maxixe.stats`) which is told when parsing begins and
+    ends, and through which the tokens are read.  `filename` is the name of
+    the file the text is from, which files it imports are found relative to;
+    `start` is the position in the text to start parsing at.  If
+    `allow_gaps` is set, the proof may end with a gap, `...`, in place of
+    the steps still to be found (see `maxixe.search`.)  If `allow_inference`
+    is set, a step may leave out its justification (its `by` and `with`), to
+    be inferred by a Checker created with `infer=True`.
+
+    """
+    # The infix operators accepted in terms without being declared, as
+    # (symbol, constructor, precedence, associativity) tuples.  Operators of
+    # higher precedence bind more tightly; associativity is 'left' or 'right'.
+    OPERATORS = ()
+
+    def __init__(self, text, hooks=None, filename=None, start=0):
+        self.scanner = Scanner(text, start)
+        self.hooks = hooks
+        if hooks is not None:
+            self.scanner.tokens = hooks.tokens(self.scanner.tokens)
+        self.filename = filename
+        self.operators = {}
+        for operator in self.OPERATORS:
+            self.declare_operator(*operator)
+        self.theory = Theory()
         self.current_block = None
-        self.rule_map = {}
-        self.block_rule_map = {}
+        self.checker = None
+        self.allow_gaps = False
+        self.allow_inference = False
+        self.imports = []
+        self.imported = []
+        self.rule_map = LazyMap()
+        self.block_rule_map = LazyMap()
         self.step_map = {}
 
-    def proof(self):
+    def proof(self, checker=None):
+        """Parses the proof.  If a Checker is given, each part of the proof
+        is checked as soon as it has been parsed, so that an invalid proof is
+        rejected at its first error, without parsing the rest of it.
+
+        """
+        self.checker = checker
+        if self.hooks is not None:
+            self.hooks.begin_phase('parse')
         rules = []
         self.scanner.expect('given')
         while not self.scanner.on('show'):
-            if self.scanner.on('block'):
+            if self.scanner.on('import'):
+                self.import_()
+            elif self.scanner.on('operator'):
+                self.operator()
+            elif self.scanner.on('constructor'):
+                self.constructor()
+            elif self.scanner.on('block'):
                 rules.append(self.block_rule())
             else:
                 rules.append(self.rule())
         self.scanner.expect('show')
         goal = self.term()
+        proof = Proof(
+            imports=self.imports, rules=rules, goal=goal, block=None,
+            rule_map=self.rule_map, block_rule_map=self.block_rule_map, step_map=self.step_map,
+            theory=self.theory
+        )
+        if self.checker is not None:
+            self.checker.begin_proof(proof)
         self.scanner.expect('proof')
-        block = self.block(0)
+        proof.block = self.block(0)
         self.scanner.expect('qed')
-        return Proof(
-            rules=rules, goal=goal, block=block,
-            rule_map=self.rule_map, block_rule_map=self.block_rule_map, step_map=self.step_map
-        )
+        if self.checker is not None:
+            self.checker.end_proof()
+        if self.hooks is not None:
+            self.hooks.end_phase('parse')
+        return proof
+
+    def import_(self):
+        self.scanner.expect('import')
+        self.scanner.check_type('string')
+        filename = resolve_import(self.scanner.token[1:-1], self.filename)
+        self.scanner.scan()
+        self.imports.append(filename)
+        import_library(filename, self.__class__, self.rule_map, self.block_rule_map, self.imported)
+
+    def operator(self):
+        self.scanner.expect('operator')
+        self.scanner.check_type('string')
+        symbol = self.scanner.token[1:-1]
+        if not declarable(symbol):
+            raise SyntaxError("'%s' cannot be declared as an operator (near '%s', %s)" %
+                              (symbol, self.scanner.near_text(), self.scanner.location()))
+        self.scanner.scan()
+        self.scanner.check_type('atom')
+        constructor = self.scanner.token
+        self.scanner.scan()
+        if not (self.scanner.on_type('atom') and self.scanner.token.isdigit()):
+            raise SyntaxError("Expected precedence, but found '%s' (near '%s', %s)" %
+                              (self.scanner.token, self.scanner.near_text(), self.scanner.location()))
+        precedence = int(self.scanner.token)
+        self.scanner.scan()
+        if not self.scanner.on('left', 'right'):
+            raise SyntaxError("Expected 'left' or 'right', but found '%s' (near '%s', %s)" %
+                              (self.scanner.token, self.scanner.near_text(), self.scanner.location()))
+        # declared before the last token of the declaration is consumed, so
+        # that the symbol is recognized in every token after the declaration
+        operator = (symbol, constructor, precedence, self.scanner.token)
+        self.declare_operator(*operator)
+        self.scanner.scan()
+        return operator
+
+    def declare_operator(self, symbol, constructor, precedence, associativity):
+        right = associativity == 'right'
+        if symbol in self.operators:
+            raise ValueError("'%s' has already been declared as an operator" % symbol)
+        for (other_precedence, other_constructor, other_right) in self.operators.values():
+            if other_precedence == precedence and other_right != right:
+                raise ValueError("operators of the same precedence must have the same associativity")
+        self.operators[symbol] = (precedence, constructor, right)
+        self.scanner.symbols.declare(symbol)
+
+    def constructor(self):
+        self.scanner.expect('constructor')
+        self.scanner.check_type('atom')
+        constructor = self.scanner.token
+        self.scanner.scan()
+        attributes = self.attributes()
+        for attribute in attributes:
+            if attribute not in ('associative', 'commutative'):
+                raise SyntaxError("Expected 'associative' or 'commutative', but found '%s' (near '%s', %s)" %
+                                  (attribute, self.scanner.near_text(), self.scanner.location()))
+        self.theory.declare(constructor, 'associative' in attributes, 'commutative' in attributes)
 
     def rule(self):
         hypotheses = []
@@ -101,42 +216,83 @@ class Parser(object):
         return attributes
 
     def block(self, level):
-        cases = []
+        """Parses a block (at level 0, the steps of the proof itself) and the
+        blocks nested in it.  Rather than recursing into nested blocks, an
+        explicit stack is kept of the blocks being parsed, each with the
+        enclosing block, the case being parsed, and whether the cases are
+        marked with `case`, so that blocks may be nested to any depth.
+
+        """
+        stack = [self.open_block(level)]
+        while True:
+            frame = stack[-1]
+            (block, prev_block, case, cased) = frame
+            if not self.scanner.on('end', 'qed'):
+                if self.scanner.consume('block'):
+                    stack.append(self.open_block(block.level + 1))
+                elif self.scanner.on('...'):
+                    self.gap(block.level)
+                else:
+                    case.steps.append(self.step())
+                continue
+            if self.checker is not None:
+                self.checker.end_case(case)
+            block.cases.append(case)
+            if cased:
+                self.scanner.expect('end')
+                if self.scanner.consume('case'):
+                    frame[2] = self.open_case()
+                    continue
+            if self.checker is not None:
+                self.checker.end_block(block)
+            self.current_block = prev_block
+            stack.pop()
+            if not stack:
+                return block
+            stack[-1][2].steps.append(block)
+            self.scanner.expect('end')
+
+    def open_block(self, level):
         name = None if level == 0 else self.var()
         prev_block = self.current_block
-        block = Block(name=name, cases=cases, level=level)
+        block = Block(name=name, cases=[], level=level)
         self.current_block = block
-        if self.scanner.on('case'):
-            while self.scanner.on('case'):
-                self.scanner.expect('case')
-                cases.append(self.block_case(level))
-                self.scanner.expect('end')
-        else:
-            cases.append(self.block_case(level))
-        self.current_block = prev_block
-        return block
-
-    def block_case(self, level):
-        steps = []
-        while not self.scanner.on('end', 'qed'):
-            if self.scanner.consume('block'):
-                steps.append(self.block(level + 1))
-                self.scanner.expect('end')
-            else:
-                steps.append(self.step())
-        return BlockCase(steps=steps)
+        if self.checker is not None:
+            self.checker.begin_block(block)
+        cased = self.scanner.consume('case')
+        return [block, prev_block, self.open_case(), cased]
+
+    def open_case(self):
+        case = BlockCase(steps=[])
+        if self.checker is not None:
+            self.checker.begin_case(case)
+        return case
+
+    def gap(self, level):
+        if not self.allow_gaps:
+            raise SyntaxError("A gap ('...') is only allowed when searching for steps (near '%s', %s)" %
+                              (self.scanner.near_text(), self.scanner.location()))
+        if level != 0:
+            raise SyntaxError("A gap ('...') may only come at the end of a proof (near '%s', %s)" %
+                              (self.scanner.near_text(), self.scanner.location()))
+        self.scanner.expect('...')
+        if not self.scanner.on('qed'):
+            raise SyntaxError("A gap ('...') may only come at the end of a proof (near '%s', %s)" %
+                              (self.scanner.near_text(), self.scanner.location()))
 
     def step(self):
         var = self.var()
         self.scanner.expect('=')
         term = self.term()
-        self.scanner.expect('by')
-        by = self.var()
+        by = None
         with_ = []
-        if self.scanner.consume('with'):
-            with_.append(self.term())
-            while self.scanner.consume(','):
+        if not self.allow_inference or self.scanner.on('by'):
+            self.scanner.expect('by')
+            by = self.var()
+            if self.scanner.consume('with'):
                 with_.append(self.term())
+                while self.scanner.consume(','):
+                    with_.append(self.term())
         step = Step(var=var, term=term, by=by, with_=with_)
         if var.name in self.rule_map:
             raise ValueError("name has already been used for a rule of inference")
@@ -152,25 +308,103 @@ class Parser(object):
                     (var.name, with_var.name)
                 )
         self.step_map[var.name] = (step, self.current_block)
+        if self.checker is not None:
+            self.checker.check_step(step)
         return step
 
     def term(self):
-        return self.basic_term()
+        """Parses a term.  Terms may be nested to any depth: rather than
+        recursing into subterms, an explicit stack is kept of the terms which
+        are still being parsed, as frames which are either
 
-    def basic_term(self):
-        if self.scanner.on_type('variable'):
-            return self.var()
-        self.scanner.check_type('atom')
-        constructor = self.scanner.token
+        *   ['(', constructor, subterms], for the subterms of a term, or
+        *   ['[', term, substs, lhs], for the substitutions on a term, where
+            `lhs` is the left-hand side of the one being parsed, if any;
+
+        each with the operands and operators of the infix expression (see
+        OPERATORS) that the term is part of.
+
+        """
+        stack = []
+        operands = []
+        operators = []
+        while True:
+            # an operand
+            if self.scanner.on_type('variable'):
+                term = Var(self.scanner.token)
+                self.scanner.scan()
+            else:
+                self.scanner.check_type('atom')
+                constructor = self.scanner.token
+                self.scanner.scan()
+                if self.scanner.consume('('):
+                    stack.append((['(', constructor, []], operands, operators))
+                    (operands, operators) = ([], [])
+                    continue
+                term = Term(constructor)
+
+            # the operand is complete; finish whatever it completes, up to
+            # the point where another operand is needed
+            while True:
+                if term is not None:
+                    if self.scanner.consume('['):
+                        stack.append((['[', term, [], None], operands, operators))
+                        (operands, operators) = ([], [])
+                        break
+                    operands.append(term)
+                if self.infix(operands, operators):
+                    break
+                term = reduce_infix(operands, operators)
+                if not stack:
+                    # terms are kept in the normal form of the constructors
+                    # declared so far (see `maxixe.theory`)
+                    return self.theory.normalize(term) if self.theory else term
+                (frame, operands, operators) = stack.pop()
+                if frame[0] == '(':
+                    frame[2].append(term)
+                    if self.scanner.consume(','):
+                        stack.append((frame, operands, operators))
+                        (operands, operators) = ([], [])
+                        break
+                    self.scanner.expect(')')
+                    term = Term(frame[1], subterms=frame[2])
+                elif frame[3] is None:
+                    self.scanner.expect('->')
+                    frame[3] = term
+                    stack.append((frame, operands, operators))
+                    (operands, operators) = ([], [])
+                    break
+                else:
+                    frame[2].append((frame[3], term))
+                    frame[3] = None
+                    if self.scanner.consume(','):
+                        stack.append((frame, operands, operators))
+                        (operands, operators) = ([], [])
+                        break
+                    self.scanner.expect(']')
+                    # a term with substitutions cannot have more of them
+                    operands.append(Substor(frame[1], frame[2]))
+                    term = None
+
+    def infix(self, operands, operators):
+        """If the next token is an infix operator, consumes it, and adds it to
+        the operators of the expression being parsed, and returns True.  The
+        operators before it which bind more tightly than it (or as tightly,
+        if it is left-associative) are first combined with their operands,
+        so the operators waiting to be combined always bind more loosely the
+        further down they are; so however many precedence levels there are,
+        each operator is handled in constant time.
+
+        """
+        operator = self.operators.get(self.scanner.token)
+        if operator is None:
+            return False
         self.scanner.scan()
-        subterms = []
-        if self.scanner.consume('('):
-            subterms.append(self.term())
-            while self.scanner.consume(','):
-                subterms.append(self.term())
-            self.scanner.expect(')')
-        term = Term(constructor, subterms=subterms)
-        return self.substs(term)
+        (precedence, constructor, right) = operator
+        while operators and (operators[-1][0] > precedence or (operators[-1][0] == precedence and not right)):
+            combine(operands, operators)
+        operators.append(operator)
+        return True
 
     def var(self):
         self.scanner.check_type('variable')
@@ -198,26 +432,22 @@ class Parser(object):
         return (lhs, rhs)
 
 
-# Term          ::= Term0 {"∨" Term0}.
-# Term0         ::= Term1 {"∧" Term1}.
-# Term1         ::= BasicTerm.
+def combine(operands, operators):
+    (precedence, constructor, right) = operators.pop()
+    rhs = operands.pop()
+    lhs = operands.pop()
+    operands.append(Term(constructor, [lhs, rhs]))
 
 
-class SugaredParser(Parser):
+def reduce_infix(operands, operators):
+    """Returns the term for a complete infix expression."""
+    while operators:
+        combine(operands, operators)
+    return operands[0]
 
-    def term(self):
-        term_a = self.term0()
-        while self.scanner.consume(u'∨'):
-            term_b = self.term0()
-            term_a = Term('or', [term_a, term_b])
-        return term_a
-
-    def term0(self):
-        term_a = self.term1()
-        while self.scanner.consume(u'∧'):
-            term_b = self.term1()
-            term_a = Term('and', [term_a, term_b])
-        return term_a
-
-    def term1(self):
-        return self.basic_term()
+
+class SugaredParser(Parser):
+    OPERATORS = (
+        (u'∨', 'or', 10, 'left'),
+        (u'∧', 'and', 20, 'left'),
+    )
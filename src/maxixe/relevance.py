@@ -0,0 +1,111 @@
+# encoding: UTF-8
+
+from maxixe.ast import Block, Step
+from maxixe.terms import Var
+
+
+class Relevance(object):
+    """Finds which steps of a proof the goal depends on, and which steps
+    could be left out of it.
+
+    A step is reachable if the final step of the proof cites it (through
+    `with`), or a reachable step does.  The steps of a block can only be
+    cited from outside it through the final steps of its cases, and those
+    depend on the block's structure, so when a step in a block is reachable,
+    the final and initial steps of all of the block's cases are reachable
+    too, as is the block it is in.  When the proof ends with a block, the
+    block is reachable.
+
+    `reachable` is the set of reachable steps, `dead` lists the others, and
+    `duplicates` lists (step, earlier step) pairs where the step has the same
+    term as an earlier step which it could have cited instead, all in the
+    order in which they appear in the proof.
+
+    """
+    def __init__(self, proof):
+        self.proof = proof
+        self.steps = []
+        self.parents = {}
+        self.duplicates = []
+        self.walk()
+        self.reachable = set()
+        self.reach()
+        self.dead = [step for step in self.steps if step not in self.reachable]
+
+    def walk(self):
+        """Lists the steps of the proof in order, notes which block each
+        block is in, and finds the duplicate steps.  A step can cite the
+        steps before it in its own case and in the cases it is in, and the
+        final steps of the cases of the blocks before it in those cases (but
+        not the steps of the other cases of its own block), so the terms of
+        those steps are kept in a stack of dicts, one for each case that is
+        open.
+
+        """
+        scopes = [{}]
+        stack = [[self.proof.block, 0, None]]
+        while stack:
+            entry = stack[-1]
+            (block, case_num, step_num) = entry
+            if case_num == len(block.cases):
+                stack.pop()
+                if block is not self.proof.block:
+                    for case in block.cases:
+                        if case.steps and isinstance(case.steps[-1], Step):
+                            scopes[-1].setdefault(case.steps[-1].term, case.steps[-1])
+                continue
+            steps = block.cases[case_num].steps
+            if step_num is None:
+                if block is not self.proof.block:
+                    scopes.append({})
+                entry[2] = 0
+            elif step_num == len(steps):
+                if block is not self.proof.block:
+                    scopes.pop()
+                entry[1] += 1
+                entry[2] = None
+            else:
+                item = steps[step_num]
+                entry[2] += 1
+                if isinstance(item, Block):
+                    self.parents[item] = block
+                    stack.append([item, 0, None])
+                    continue
+                self.steps.append(item)
+                for scope in scopes:
+                    earlier = scope.get(item.term)
+                    if earlier is not None:
+                        self.duplicates.append((item, earlier))
+                        break
+                scopes[-1].setdefault(item.term, item)
+
+    def reach(self):
+        step_map = self.proof.step_map
+        reached_blocks = set()
+        pending = []
+        steps = self.proof.block.cases[0].steps
+        if steps:
+            pending.append(steps[-1])
+        while pending:
+            item = pending.pop()
+            if isinstance(item, Block):
+                if item in reached_blocks:
+                    continue
+                reached_blocks.add(item)
+                for case in item.cases:
+                    if case.steps:
+                        pending.append(case.steps[0])
+                        pending.append(case.steps[-1])
+                parent = self.parents.get(item)
+                if parent is not None and parent is not self.proof.block:
+                    pending.append(parent)
+                continue
+            if item in self.reachable:
+                continue
+            self.reachable.add(item)
+            (step, block) = step_map[item.var.name]
+            if block is not self.proof.block:
+                pending.append(block)
+            for with_ in item.with_ or ():
+                if isinstance(with_, Var) and with_.name in step_map:
+                    pending.append(step_map[with_.name][0])
@@ -0,0 +1,39 @@
+# encoding: UTF-8
+
+from maxixe.search import format_steps
+
+
+# What `bin/maxixe` writes on standard output once it has checked a proof, or
+# searched for steps to finish one.  The in-process test runner
+# (`maxixe.falderal`) writes the same, by calling the same functions.
+
+
+def check_report(checker):
+    """Returns the lines to write once the checker has checked a proof
+    without finding an error in it: the steps whose justifications were
+    inferred (if any were), the dead and duplicate steps (if the checker was
+    goal-directed and found any), and then `ok`.
+
+    """
+    lines = []
+    if checker.inferred:
+        lines.append(format_steps([
+            (step.var.name, step.term, step.by.name, [str(w) for w in step.with_]) for step in checker.inferred
+        ]))
+    if checker.relevance is not None:
+        if checker.relevance.dead:
+            lines.append("dead steps: %s" % ', '.join([step.var.name for step in checker.relevance.dead]))
+        if checker.relevance.duplicates:
+            lines.append("duplicate steps: %s" % ', '.join([
+                "%s (same term as %s)" % (step.var.name, earlier.var.name)
+                for (step, earlier) in checker.relevance.duplicates
+            ]))
+    lines.append('ok')
+    return lines
+
+
+def search_report(steps):
+    """Returns the lines to write once a search has found the given steps."""
+    if not steps:
+        return []
+    return [format_steps(steps)]
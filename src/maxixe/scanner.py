@@ -3,54 +3,205 @@
 import re
 
 
+TOKEN_PATTERN = r'''
+    (?P<whitespace>[ \t\n\r]+)
+   |(?P<comment>//[^\n\r]*[\n\r])%s
+   |(?P<operator>=|;|\|-|,|\(|\)|\{|\}|\[|\]|->|\.\.\.)
+   |(?P<variable>[A-Z][a-zA-Z0-9_]*)
+   |(?P<atom>[a-z0-9][a-zA-Z0-9_]*)
+   |(?P<string>"[^"\n\r]*")
+   |(?P<unknown>.)
+'''
+
+TOKEN_RE = re.compile(TOKEN_PATTERN % '', flags=re.VERBOSE | re.DOTALL)
+
+# The tokens of type `operator` above, which declared symbols must not begin.
+PUNCTUATION = ('=', ';', '|-', ',', '(', ')', '{', '}', '[', ']', '->', '...')
+
+STRING_TYPES = (str, type(u''))
+
+TOKEN_TYPES = {
+    'operator': 'operator',
+    'variable': 'variable',
+    'atom': 'atom',
+    'string': 'string',
+    'symbol': 'symbol',
+    'unknown': 'unknown character',
+}
+
+
+class Symbols(object):
+    """The symbols (such as infix operators) declared by a proof, which are
+    scanned as single tokens of type `symbol`, even if they consist of more
+    than one character.  `regex` is the regular expression for tokens,
+    which is replaced whenever a symbol is declared; a tokenizer given a
+    Symbols object uses the new one from the next token on.
+
+    """
+    def __init__(self):
+        self.symbols = set()
+        self.regex = TOKEN_RE
+
+    def declare(self, symbol):
+        if not declarable(symbol):
+            raise ValueError("'%s' cannot be declared as a symbol" % symbol)
+        self.symbols.add(symbol)
+        self.regex = re.compile(TOKEN_PATTERN % ('\n   |(?P<symbol>%s)' % trie_pattern(self.symbols)),
+                                flags=re.VERBOSE | re.DOTALL)
+
+
+def trie_pattern(symbols):
+    """Returns a regular expression which matches the longest of the symbols
+    which the text begins with.  The alternatives are nested by the
+    characters the symbols begin with, so that matching a symbol takes about
+    as long however many symbols there are, instead of trying each of them.
+
+    """
+    trie = {}
+    for symbol in symbols:
+        node = trie
+        for c in symbol:
+            node = node.setdefault(c, {})
+        node[''] = {}
+
+    def pattern(node):
+        alternatives = []
+        for c in sorted(node):
+            if c:
+                alternatives.append(re.escape(c) + pattern(node[c]))
+        if not alternatives:
+            return ''
+        # the longer symbols are tried first, so that they take precedence
+        # over the shorter symbols which they begin with
+        if '' in node:
+            alternatives.append('')
+        if len(alternatives) == 1:
+            return alternatives[0]
+        return '(?:%s)' % '|'.join(alternatives)
+
+    return pattern(trie)
+
+
+def declarable(symbol):
+    """Returns whether the symbol can be declared: it must not be empty,
+    contain whitespace or quotes, begin like a variable, atom or comment, or
+    be one of the punctuation tokens of Maxixe's own syntax, or the start of
+    one.  (Declared symbols are scanned before punctuation, so `|` would be
+    scanned as a symbol at the start of every `|-`.)
+
+    """
+    if not symbol or symbol[0].isalnum() or symbol[0] == '_' or symbol.startswith('//'):
+        return False
+    for c in symbol:
+        if c.isspace() or c == '"':
+            return False
+    for punctuation in PUNCTUATION:
+        if punctuation.startswith(symbol):
+            return False
+    return True
+
+
+def tokenize(text, start=0, symbols=None):
+    """Lazily yields a (type, token, end, line, column, source) tuple for each
+    significant token in the text, skipping whitespace and comments.  `end`
+    is the position in `source` just past the token; `line` and `column`
+    (both 1-based) are where the token starts.  The final tuple is always an
+    EOF token.  If `start` is given, tokenizing starts at that position in
+    the text.  If `symbols` is given, it is a Symbols object, and symbols
+    declared in it are scanned as such from the token after the one being
+    yielded when they were declared.
+
+    """
+    line = text.count('\n', 0, start) + 1
+    line_start = text.rfind('\n', 0, start) + 1
+    regex = TOKEN_RE if symbols is None else symbols.regex
+    while True:
+        for match in regex.finditer(text, start):
+            type = match.lastgroup
+            token = match.group()
+            if type == 'whitespace' or type == 'comment':
+                newlines = token.count('\n')
+                if newlines:
+                    line += newlines
+                    line_start = match.start() + token.rindex('\n') + 1
+                continue
+            yield (TOKEN_TYPES[type], token, match.end(), line, match.start() - line_start + 1, text)
+            if symbols is not None and symbols.regex is not regex:
+                break
+        else:
+            break
+        regex = symbols.regex
+        start = match.end()
+    yield ('EOF', None, len(text), line, len(text) - line_start + 1, text)
+
+
+def tokenize_lines(lines, symbols=None):
+    """Like `tokenize`, but reads the text from an iterable of lines (such as
+    an open file) as tokens are requested, so that the whole text never needs
+    to be held in memory.  No token spans a line break, so each line can be
+    tokenized on its own.  `end` is relative to the line the token is on,
+    which is its `source`.
+
+    """
+    line = 0
+    text = ''
+    regex = TOKEN_RE if symbols is None else symbols.regex
+    for text in lines:
+        line += 1
+        start = 0
+        while True:
+            for match in regex.finditer(text, start):
+                type = match.lastgroup
+                if type == 'whitespace' or type == 'comment':
+                    continue
+                yield (TOKEN_TYPES[type], match.group(), match.end(), line, match.start() + 1, text)
+                if symbols is not None and symbols.regex is not regex:
+                    break
+            else:
+                break
+            regex = symbols.regex
+            start = match.end()
+    yield ('EOF', None, len(text), max(line, 1), len(text) + 1, text)
+
+
 class Scanner(object):
-    def __init__(self, text):
-        self.text = text
+    """Scans the given text, which may be either a string or an iterable of
+    lines (such as an open file.)  A string may be scanned starting at a
+    given position.  Symbols declared with `symbols.declare` are scanned as
+    such from the token after the current one.
+
+    """
+    def __init__(self, text, start=0):
+        self.symbols = Symbols()
+        self.source = ''
         self.token = None
         self.type = None
         self.pos = 0
+        self.line = 1
+        self.column = 1
+        if isinstance(text, STRING_TYPES):
+            self.tokens = tokenize(text, start, self.symbols)
+        else:
+            self.tokens = tokenize_lines(text, self.symbols)
         self.scan()
 
     def near_text(self, length=10):
-        return self.text[self.pos:self.pos+length]
+        return self.source[self.pos:self.pos+length]
 
-    def scan_pattern(self, pattern, type, token_group=1, rest_group=2):
-        pattern = r'(' + pattern + r')'
-        regexp = re.compile(pattern, flags=re.DOTALL)
-        match = regexp.match(self.text, pos=self.pos)
-        if not match:
-            return False
-        else:
-            self.type = type
-            self.token = match.group(token_group)
-            self.pos += len(self.token)
-            return True
+    def location(self):
+        return "line %s, column %s" % (self.line, self.column)
 
     def scan(self):
-        self.scan_pattern(r'[ \t\n\r]*', 'whitespace')
-        while self.scan_pattern(r'\/\/.*?[\n\r]', 'comment'):
-            self.scan_pattern(r'[ \t\n\r]*', 'whitespace')
-        if self.pos >= len(self.text):
-            self.token = None
-            self.type = 'EOF'
-            return
-        if self.scan_pattern(r'\=|\;|\|-|\,|\(|\)|\{|\}|\[|\]|\-\>', 'operator'):
+        if self.type == 'EOF':
             return
-        if self.scan_pattern(r'[A-Z][a-zA-Z0-9_]*', 'variable'):
-            return
-        if self.scan_pattern(r'[a-z0-9][a-zA-Z0-9_]*', 'atom'):
-            return
-        if self.scan_pattern(r'.', 'unknown character'):
-            return
-        else:
-            raise AssertionError("this should never happen, self.text=(%s), self.pos=(%s)" % (self.text, self.pos))
+        (self.type, self.token, self.pos, self.line, self.column, self.source) = next(self.tokens)
 
     def expect(self, token):
         if self.token == token:
             self.scan()
         else:
-            raise SyntaxError("Expected '%s', but found '%s' (near '%s')" %
-                              (token, self.token, self.near_text()))
+            raise SyntaxError("Expected '%s', but found '%s' (near '%s', %s)" %
+                              (token, self.token, self.near_text(), self.location()))
 
     def on(self, *tokens):
         return self.token in tokens
@@ -60,8 +211,8 @@ class Scanner(object):
 
     def check_type(self, type):
         if not self.type == type:
-            raise SyntaxError("Expected %s, but found %s ('%s') (near '%s')" %
-                              (type, self.type, self.token, self.near_text()))
+            raise SyntaxError("Expected %s, but found %s ('%s') (near '%s', %s)" %
+                              (type, self.type, self.token, self.near_text(), self.location()))
 
     def consume(self, token):
         if self.token == token:
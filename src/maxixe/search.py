@@ -0,0 +1,294 @@
+# encoding: UTF-8
+
+import time
+
+from maxixe.ast import Block, Rule, Step
+from maxixe.checker import Checker, instantiate
+from maxixe.index import DiscriminationTree
+from maxixe.inference import all_names
+from maxixe.terms import Term, Var, has_substs, partial_subst
+
+
+class SearchFailed(ValueError):
+    pass
+
+
+class OutOfBudget(Exception):
+    pass
+
+
+class Search(object):
+    """Searches for steps which derive the goal of a proof from its rules
+    and from the steps it already has.  The proof may end with a gap, `...`,
+    which marks where the steps are to go; they always go at the end of the
+    proof.
+
+    The search works backward from the goal, trying each rule whose
+    conclusion could match it and looking for the terms its hypotheses then
+    need, either among the terms already derived or by searching backward
+    from them in turn, to a depth which is increased one step at a time (so
+    that shorter derivations are found first.)  When that fails, a round of
+    forward search derives every term which can be derived in one step from
+    the terms derived so far, and the backward search is tried again.  Rules
+    are found through discrimination trees of their conclusions and of their
+    hypotheses, and derived terms through one of the derived terms, so that
+    neither search need try every rule or every term.
+
+    Rules with hypotheses that take terms or atoms as arguments are only used
+    in backward search, when those arguments are determined by the term being
+    searched for.  Rules with `local` or `unique` hypotheses, or with
+    substitutions in their hypotheses, are not used, nor are block rules.
+
+    """
+    def __init__(self, proof, depth=5, timeout=10.0, max_terms=20000):
+        self.proof = proof
+        self.depth = depth
+        self.timeout = timeout
+        self.max_terms = max_terms
+        self.deadline = None
+        self.facts = {}
+        self.fact_index = DiscriminationTree()
+        self.new_facts = []
+        self.conclusion_index = DiscriminationTree()
+        self.hypothesis_index = DiscriminationTree()
+        self.failed = set()
+        self.in_progress = set()
+        self.add_steps()
+        for rule in self.usable_rules():
+            self.index_rule(rule)
+
+    def usable_rules(self):
+        """Returns the rules of the proof, including any it imports, in the
+        order they are given, leaving out the rules of block rules.
+
+        """
+        rule_map = self.proof.rule_map
+        block_rule_map = self.proof.block_rule_map
+        inner = set()
+        for name in sorted(all_names(block_rule_map)):
+            for case in block_rule_map[name].cases:
+                for rule in (case.initial, case.final):
+                    if rule is not None:
+                        inner.add(rule.var.name)
+        names = [rule.var.name for rule in self.proof.rules if isinstance(rule, Rule)]
+        names += sorted(set(all_names(rule_map)) - set(names) - inner)
+        return [rule_map[name] for name in names]
+
+    def index_rule(self, rule):
+        for hypothesis in rule.hypotheses:
+            if hypothesis.has_attribute('local') or hypothesis.has_attribute('unique'):
+                return
+            if has_substs(hypothesis.term):
+                return
+        if not rule.hypotheses:
+            if rule.conclusion.is_ground():
+                self.add_fact(rule.conclusion, (rule, []))
+            return
+        if isinstance(rule.conclusion, (Term, Var)) and not has_substs(rule.conclusion):
+            self.conclusion_index.add(rule.conclusion, rule)
+        if not [h for h in rule.hypotheses if is_free(h)]:
+            for (i, hypothesis) in enumerate(rule.hypotheses):
+                self.hypothesis_index.add(hypothesis.term, (rule, i))
+
+    def add_steps(self):
+        """Adds the terms of the steps the proof already has (and which can
+        be referred to at the end of it) as derived terms.
+
+        """
+        steps = self.proof.block.cases[0].steps
+        checker = Checker(self.proof)
+        checker.begin_proof(self.proof)
+        if steps:
+            checker.check_block(self.proof.block)
+        for item in steps:
+            if isinstance(item, Block):
+                for case in item.cases:
+                    if case.steps and isinstance(case.steps[-1], Step):
+                        self.add_step(case.steps[-1])
+            else:
+                self.add_step(item)
+
+    def add_step(self, step):
+        if step.term not in self.facts:
+            self.add_fact(step.term, step.var.name)
+
+    def add_fact(self, term, justification):
+        """Records that the term has been derived, with the given
+        justification: either the name of an existing step, or the rule and
+        argument terms of a new step.
+
+        """
+        if term in self.facts:
+            return
+        if len(self.facts) >= self.max_terms:
+            raise OutOfBudget()
+        self.facts[term] = justification
+        self.fact_index.add(term, term)
+        self.new_facts.append(term)
+
+    def check_budget(self):
+        if time.time() > self.deadline:
+            raise OutOfBudget()
+
+    def search(self):
+        """Returns the steps which derive the goal, as (name, term, rule,
+        arguments) tuples, or raises SearchFailed.
+
+        """
+        goal = self.proof.goal
+        self.deadline = time.time() + self.timeout
+        try:
+            for round in range(self.depth + 1):
+                self.failed = set()
+                for depth in range(1, self.depth + 1):
+                    if self.prove(goal, depth):
+                        return self.steps(goal)
+                if round < self.depth:
+                    self.saturate()
+        except OutOfBudget:
+            pass
+        raise SearchFailed("no steps deriving '%s' found within depth %s" % (goal, self.depth))
+
+    def prove(self, goal, depth):
+        """Tries to derive the ground term by searching backward from it,
+        to the given depth.  Returns True if it has been derived.
+
+        """
+        if goal in self.facts:
+            return True
+        if depth == 0 or (goal, depth) in self.failed or goal in self.in_progress:
+            return False
+        self.check_budget()
+        self.in_progress.add(goal)
+        try:
+            for rule in self.conclusion_index.unifiable(goal):
+                unifier = {}
+                try:
+                    rule.conclusion.match(goal, unifier)
+                except ValueError:
+                    continue
+                for unifier in self.solve(rule.hypotheses, 0, unifier, depth):
+                    if self.derive(rule, unifier) is goal:
+                        return True
+        finally:
+            self.in_progress.discard(goal)
+        self.failed.add((goal, depth))
+        return False
+
+    def solve(self, hypotheses, i, unifier, depth):
+        """Yields each unifier, extending the given one, under which all of
+        the hypotheses from the i'th onward are satisfied: either by derived
+        terms, or (if `depth` is not None) by terms which can be derived by
+        searching backward to that depth.
+
+        """
+        if i == len(hypotheses):
+            yield unifier
+            return
+        hypothesis = hypotheses[i]
+        pattern = partial_subst(hypothesis.term, unifier)
+        if is_free(hypothesis):
+            if pattern.is_ground() and (pattern.is_atom() or not hypothesis.has_attribute('atom')):
+                for result in self.solve(hypotheses, i + 1, unifier, depth):
+                    yield result
+            return
+        if pattern.is_ground():
+            if pattern in self.facts or (depth is not None and self.prove(pattern, depth - 1)):
+                for result in self.solve(hypotheses, i + 1, unifier, depth):
+                    yield result
+            return
+        for fact in self.fact_index.unifiable(pattern):
+            extended = dict(unifier)
+            try:
+                pattern.match(fact, extended)
+            except ValueError:
+                continue
+            for result in self.solve(hypotheses, i + 1, extended, depth):
+                yield result
+
+    def derive(self, rule, unifier):
+        """Instantiates the rule with the arguments the unifier gives its
+        hypotheses, records the instance as derived, and returns it (or None
+        if the rule cannot be instantiated.)
+
+        """
+        with_terms = [hypothesis.term.subst(unifier) for hypothesis in rule.hypotheses]
+        try:
+            instance = instantiate(rule, with_terms)
+            theory = self.proof.theory
+            if theory:
+                # the instance the unifier gives, as it is in the theory
+                with_terms = [theory.normalize(with_term) for with_term in with_terms]
+                instance = instantiate(rule, with_terms, theory, theory.normalize(instance))
+        except (ValueError, KeyError):
+            return None
+        self.add_fact(instance, (rule, with_terms))
+        return instance
+
+    def saturate(self):
+        """Derives every term which can be derived in one step using at least
+        one of the terms derived since the last time this was done.
+
+        """
+        frontier = self.new_facts
+        self.new_facts = []
+        for fact in frontier:
+            for (rule, i) in self.hypothesis_index.unifiable(fact):
+                self.check_budget()
+                unifier = {}
+                try:
+                    rule.hypotheses[i].term.match(fact, unifier)
+                except ValueError:
+                    continue
+                others = rule.hypotheses[:i] + rule.hypotheses[i + 1:]
+                for unifier in self.solve(others, 0, unifier, None):
+                    self.derive(rule, unifier)
+
+    def steps(self, goal):
+        """Returns the new steps needed to derive the goal, each after the
+        steps it refers to.
+
+        """
+        used = set(self.proof.step_map) | set(all_names(self.proof.rule_map))
+        names = {}
+        steps = []
+        counter = [0]
+
+        def name(term):
+            justification = self.facts[term]
+            if not isinstance(justification, tuple):
+                return justification
+            if term in names:
+                return names[term]
+            (rule, with_terms) = justification
+            arguments = []
+            for (hypothesis, with_term) in zip(rule.hypotheses, with_terms):
+                if is_free(hypothesis):
+                    arguments.append(str(with_term))
+                else:
+                    arguments.append(name(with_term))
+            while True:
+                counter[0] += 1
+                step_name = 'S%d' % counter[0]
+                if step_name not in used:
+                    break
+            names[term] = step_name
+            steps.append((step_name, term, rule.var.name, arguments))
+            return step_name
+
+        name(goal)
+        return steps
+
+
+def format_steps(steps):
+    lines = []
+    for (name, term, rule_name, arguments) in steps:
+        line = "    %s = %s by %s" % (name, term, rule_name)
+        if arguments:
+            line += " with %s" % ', '.join(arguments)
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def is_free(hypothesis):
+    return hypothesis.has_attribute('term') or hypothesis.has_attribute('atom')
@@ -0,0 +1,279 @@
+# encoding: UTF-8
+
+from collections import OrderedDict
+import io
+import json
+import os
+import signal
+import sys
+import threading
+import time
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+from maxixe.binary import load_proof
+from maxixe.budget import Budget, BudgetExceeded
+from maxixe.cache import VerificationCache
+from maxixe.checker import Checker
+from maxixe.parser import Parser, SugaredParser
+from maxixe.stats import Hooks
+
+
+# A Server checks proofs on request, staying resident between requests so
+# that it need not start up again for each one, and so that what it has
+# already done is still there to be used: libraries stay parsed, and each
+# document has a verification cache in memory, so that checking it again
+# only verifies the steps which have changed.  The last proof checked for
+# each document is kept, which also keeps its terms interned.  After each
+# check, a document's cache is pruned to the steps that check used, and
+# only the `documents` most recently checked documents are kept.  If the Server
+# is given an InstanceCache, it is shared by the checks of all documents.  If
+# it is given `limits`, each check is made within a Budget with those limits
+# (see `maxixe.budget`), so that no one proof can tie up the server.
+#
+# Requests and responses are lines of JSON.  A request is an object with
+#
+# *   `file`: the name of a proof file to check, or
+# *   `text`: the text of a proof to check, and optionally `file`, the name
+#     of the file the text is from (which imports are found relative to);
+# *   `document` (optional): what the proof is, for the purposes of caching
+#     and cancellation.  It defaults to `file`;
+# *   `sugar` (optional): true to accept infix operators in terms;
+# *   `id` (optional): which is copied into the response.
+#
+# or an object with `cancel`, the document whose check should be cancelled.
+# A request which is not an object, which has none of `file`, `text` and
+# `cancel`, or in which any of these (or `document`) is not a string, is
+# answered with an error response.
+#
+# Requests are handled concurrently, each in a thread of its own.  Starting
+# to check a document cancels any check of that document which is still
+# running, as its outcome no longer matters.  The response to a check is an
+# object with `id`, `document`, `status` (`ok`, `error` or `cancelled`),
+# `error_class` and `message` if the status is `error`, `progress` if the
+# error is that the budget was exceeded, and `time`.
+
+
+class Cancelled(Exception):
+    pass
+
+
+class Cancellation(Hooks):
+    """Hooks which stop parsing or checking, by raising Cancelled, as soon
+    as possible after `cancel` is called.
+
+    """
+    def __init__(self):
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def tokens(self, tokens):
+        for token in tokens:
+            if self.cancelled:
+                raise Cancelled()
+            yield token
+
+    def begin_step(self, step):
+        if self.cancelled:
+            raise Cancelled()
+
+
+def invalid(request):
+    """Returns the error response to the request, if it is not a valid
+    request, or None if it is.
+
+    """
+    if not isinstance(request, dict):
+        message = "request must be a JSON object"
+    else:
+        message = None
+        for key in ('cancel', 'document', 'file', 'text'):
+            if key in request and not isinstance(request[key], (type(u''), str)):
+                message = "'%s' of request must be a string" % key
+                break
+        if message is None and not any([key in request for key in ('cancel', 'file', 'text')]):
+            message = "request must give the 'file' or 'text' of a proof to check, or a document to 'cancel'"
+    if message is None:
+        return None
+    response = {'status': 'error', 'error_class': 'ValueError', 'message': message}
+    if isinstance(request, dict):
+        response['id'] = request.get('id')
+    return response
+
+
+class Server(object):
+    def __init__(self, instances=None, limits=None, documents=100):
+        self.instances = instances
+        self.limits = limits
+        self.documents = documents
+        self.lock = threading.Lock()
+        self.running = {}
+        self.caches = OrderedDict()
+        self.proofs = {}
+
+    def handle(self, request):
+        """Handles a request, and returns the response to it (or None if the
+        request needs no response.)
+
+        """
+        error = invalid(request)
+        if error is not None:
+            return error
+        if 'cancel' in request:
+            self.cancel(request['cancel'])
+            return None
+        return self.check(request, self.begin(request))
+
+    def document(self, request):
+        return request.get('document', request.get('file'))
+
+    def cancel(self, document):
+        with self.lock:
+            cancellation = self.running.get(document)
+        if cancellation is not None:
+            cancellation.cancel()
+
+    def begin(self, request):
+        """Notes that the document in the request is about to be checked,
+        cancelling any check of it which is still running, and returns the
+        Cancellation for the new check.
+
+        """
+        document = self.document(request)
+        cancellation = Cancellation()
+        with self.lock:
+            previous = self.running.get(document)
+            if previous is not None:
+                previous.cancel()
+            self.running[document] = cancellation
+        return cancellation
+
+    def check(self, request, cancellation):
+        filename = request.get('file')
+        document = self.document(request)
+        parser_cls = SugaredParser if request.get('sugar') else Parser
+        response = {'id': request.get('id'), 'document': document}
+        started = time.time()
+        with self.lock:
+            cache = self.caches.pop(document, None) or VerificationCache()
+            # the most recently checked document is last, and the least
+            # recently checked are forgotten first
+            self.caches[document] = cache
+            while len(self.caches) > self.documents:
+                (forgotten, _) = self.caches.popitem(last=False)
+                self.proofs.pop(forgotten, None)
+
+        hooks = cancellation
+        if self.limits:
+            hooks = Budget(hooks=cancellation, **self.limits)
+        complete = False
+        try:
+            if 'text' in request:
+                proof = parser_cls(request['text'], hooks=hooks, filename=filename).proof()
+            else:
+                proof = load_proof(filename, parser_cls, hooks=hooks)
+            Checker(proof, cache=cache, hooks=hooks, instances=self.instances).check()
+            complete = True
+            response['status'] = 'ok'
+        except Cancelled:
+            response['status'] = 'cancelled'
+        except Exception as e:
+            response['status'] = 'error'
+            response['error_class'] = e.__class__.__name__
+            message = str(e)
+            if not isinstance(message, type(u'')):
+                message = message.decode('utf-8', 'replace')
+            response['message'] = message
+            if isinstance(e, BudgetExceeded):
+                response['progress'] = e.progress
+        finally:
+            with self.lock:
+                # a check which has been superseded by a later one leaves
+                # the cache and the proof to that one
+                if self.running.get(document) is cancellation:
+                    del self.running[document]
+                    if response.get('status') != 'cancelled':
+                        cache.prune(complete=complete)
+                    if complete and document in self.caches:
+                        self.proofs[document] = proof
+
+        response['time'] = round(time.time() - started, 6)
+        return response
+
+    def serve(self, infile, outfile):
+        """Reads requests from `infile`, one per line, and writes the
+        responses to `outfile`, until the end of `infile`.
+
+        """
+        lock = threading.Lock()
+        threads = []
+
+        def write(response):
+            with lock:
+                outfile.write(json.dumps(response, sort_keys=True) + '\n')
+                outfile.flush()
+
+        def respond(request, cancellation):
+            write(self.check(request, cancellation))
+
+        for line in iter(infile.readline, ''):
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                write({'status': 'error', 'error_class': e.__class__.__name__, 'message': str(e)})
+                continue
+            error = invalid(request)
+            if error is not None:
+                write(error)
+                continue
+            if 'cancel' in request:
+                self.cancel(request['cancel'])
+                continue
+            # The check is begun here, rather than in its thread, so that the
+            # checks of a document are begun in the order they were requested.
+            thread = threading.Thread(target=respond, args=(request, self.begin(request)))
+            thread.daemon = True
+            thread.start()
+            threads = [t for t in threads if t.is_alive()] + [thread]
+        for thread in threads:
+            thread.join()
+
+
+def serve_stdio(server):
+    server.serve(sys.stdin, sys.stdout)
+
+
+def serve_socket(server, path):
+    """Accepts connections on a Unix socket at the given path, serving the
+    requests on each connection in the same way as `Server.serve`.
+
+    """
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            infile = self.rfile
+            outfile = self.wfile
+            if str is not bytes:
+                infile = io.TextIOWrapper(infile, encoding='utf-8')
+                outfile = io.TextIOWrapper(outfile, encoding='utf-8', write_through=True)
+            server.serve(infile, outfile)
+
+    if os.path.exists(path):
+        os.remove(path)
+    # so that the socket is removed when the server is terminated
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    listener = socketserver.ThreadingUnixStreamServer(path, Handler)
+    listener.daemon_threads = True
+    try:
+        listener.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.server_close()
+        os.remove(path)
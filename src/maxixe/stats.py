@@ -0,0 +1,201 @@
+# encoding: UTF-8
+
+import heapq
+import json
+import time
+
+from maxixe.checker import instantiate, unify
+from maxixe.terms import Term, Substor
+
+
+clock = getattr(time, 'perf_counter', time.time)
+
+
+class Hooks(object):
+    """The hooks through which a Parser and a Checker report what they are
+    doing.  Both take an optional `hooks` object, and when it is not given,
+    they make no calls at all, so the hooks cost nothing unless they are
+    used.  This class does nothing but the work itself; subclasses override
+    the methods they are interested in.
+
+    """
+    def tokens(self, tokens):
+        """Given the scanner's iterator of tokens, returns the iterator the
+        scanner should use instead.
+
+        """
+        return tokens
+
+    def begin_phase(self, name):
+        pass
+
+    def end_phase(self, name):
+        pass
+
+    def begin_step(self, step):
+        pass
+
+    def end_step(self, step):
+        pass
+
+    def instantiate(self, step, rule, with_terms, theory=None):
+        return instantiate(rule, with_terms, theory, step.term)
+
+
+class Stats(Hooks):
+    """Collects statistics on where the time goes while a proof is parsed
+    and checked: the time spent in each phase (scanning, parsing, and
+    checking, each exclusive of the others, even when they are interleaved
+    as they are with a streaming Parser), the number of times each rule is
+    used and the total time spent instantiating it, a histogram of the sizes
+    of the steps' terms, and the slowest steps.
+
+    If `trace` is given, it is a file to which a line of JSON is written for
+    each step checked, giving its unifier and instance.
+
+    """
+    def __init__(self, slowest=10, trace=None):
+        self.phase_times = {}
+        self.phases = []
+        self.rule_uses = {}
+        self.rule_times = {}
+        self.sizes = {}
+        self.histogram = {}
+        self.slowest = slowest
+        self.slowest_steps = []
+        self.trace = trace
+
+    def account(self, name, elapsed):
+        """Adds the time to the named phase, and removes it from the phase it
+        happened within.
+
+        """
+        self.phase_times[name] = self.phase_times.get(name, 0.0) + elapsed
+        if self.phases:
+            self.phases[-1][2] += elapsed
+
+    def tokens(self, tokens):
+        while True:
+            started = clock()
+            try:
+                token = next(tokens)
+            except StopIteration:
+                return
+            self.account('scan', clock() - started)
+            yield token
+
+    def begin_phase(self, name):
+        self.phases.append([name, clock(), 0.0])
+
+    def end_phase(self, name):
+        self.pop_phase()
+
+    def pop_phase(self):
+        """Ends the innermost phase, accounting for the time spent in it
+        (apart from the time spent in the phases within it) and returning
+        the total time spent in it.
+
+        """
+        (name, started, within) = self.phases.pop()
+        elapsed = clock() - started
+        self.account(name, elapsed - within)
+        if self.phases:
+            self.phases[-1][2] += within
+        return elapsed
+
+    def begin_step(self, step):
+        self.begin_phase('check')
+
+    def end_step(self, step):
+        elapsed = self.pop_phase()
+        size = term_size(step.term, self.sizes)
+        bucket = 1
+        while bucket < size:
+            bucket *= 2
+        self.histogram[bucket] = self.histogram.get(bucket, 0) + 1
+        entry = (elapsed, step.var.name)
+        if len(self.slowest_steps) < self.slowest:
+            heapq.heappush(self.slowest_steps, entry)
+        elif entry > self.slowest_steps[0]:
+            heapq.heapreplace(self.slowest_steps, entry)
+
+    def instantiate(self, step, rule, with_terms, theory=None):
+        name = rule.var.name
+        started = clock()
+        try:
+            instance = instantiate(rule, with_terms, theory, step.term)
+        except ValueError as e:
+            self.record(name, clock() - started)
+            if self.trace is not None:
+                self.write_trace(step, rule, with_terms, theory, error=e)
+            raise
+        self.record(name, clock() - started)
+        if self.trace is not None:
+            self.write_trace(step, rule, with_terms, theory, instance=instance)
+        return instance
+
+    def record(self, name, elapsed):
+        self.rule_uses[name] = self.rule_uses.get(name, 0) + 1
+        self.rule_times[name] = self.rule_times.get(name, 0.0) + elapsed
+
+    def write_trace(self, step, rule, with_terms, theory=None, instance=None, error=None):
+        event = {
+            'step': step.var.name,
+            'rule': rule.var.name,
+            'with': [str(t) for t in with_terms],
+        }
+        if error is None:
+            event['unifier'] = dict((k, str(v)) for (k, v) in unify(rule, with_terms, theory, step.term).items())
+            event['instance'] = str(instance)
+        else:
+            event['error'] = str(error)
+        self.trace.write(json.dumps(event, sort_keys=True) + '\n')
+
+    def report(self, out):
+        while self.phases:
+            self.pop_phase()
+        out.write("phase times:\n")
+        for name in ('load', 'scan', 'parse', 'check'):
+            if name in self.phase_times:
+                out.write("  %-8s %10.6fs\n" % (name, self.phase_times[name]))
+        if self.rule_uses:
+            instantiating = sum(self.rule_times.values())
+            out.write("  (of checking, %.6fs was instantiating rules)\n" % instantiating)
+            out.write("rules (uses, total instantiation time):\n")
+            for name in sorted(self.rule_uses, key=lambda n: (-self.rule_times[n], n)):
+                out.write("  %-20s %8d %10.6fs\n" % (name, self.rule_uses[name], self.rule_times[name]))
+        if self.histogram:
+            out.write("term sizes (steps with terms of at most this size):\n")
+            for bucket in sorted(self.histogram):
+                out.write("  %8d %8d\n" % (bucket, self.histogram[bucket]))
+        if self.slowest_steps:
+            out.write("slowest steps:\n")
+            for (elapsed, name) in sorted(self.slowest_steps, reverse=True):
+                out.write("  %-20s %10.6fs\n" % (name, elapsed))
+
+
+def term_size(term, sizes):
+    """Returns the number of nodes in the term, counted as a tree.  Terms
+    are shared, so sizes are remembered in `sizes`.
+
+    """
+    stack = [term]
+    while stack:
+        node = stack[-1]
+        if node in sizes:
+            stack.pop()
+            continue
+        if isinstance(node, Term):
+            children = node.subterms
+        elif isinstance(node, Substor):
+            children = (node.subterm,) + tuple([t for pair in node.substs for t in pair])
+        else:
+            children = ()
+        pending = [child for child in children if child not in sizes]
+        if pending:
+            stack.extend(pending)
+            continue
+        stack.pop()
+        size = 1 if isinstance(node, Term) or not children else 0
+        sizes[node] = size + sum([sizes[child] for child in children])
+    return sizes[term]
@@ -1,95 +1,198 @@
 # encoding: UTF-8
 
+import hashlib
+import threading
+import weakref
+
+
+# All terms are hash-consed: constructing a term which is structurally equal
+# to a term that already exists returns that existing object.  So equality
+# of terms is identity, hashes are computed once at construction, and shared
+# subterms are stored once.  The table holds terms weakly, so terms which are
+# no longer used by anything are released.
+#
+# Terms may be nested very deeply (machine-generated proofs have terms
+# hundreds of thousands of levels deep), so nothing here recurses on the
+# structure of a term: each traversal keeps an explicit stack instead.
+
+_terms = weakref.WeakValueDictionary()
+_terms_lock = threading.Lock()
+
+# Rebuilding terms (substituting into them, and resolving substitutions in
+# them) is where the work of checking a step can grow out of all proportion
+# to the size of the proof.  So if a thread has a meter (see `set_meter` and
+# `maxixe.budget`), it is charged for the terms that are rebuilt, every
+# METER_INTERVAL of them, and may stop the work by raising an exception.
+
+_meters = threading.local()
+
+METER_INTERVAL = 1024
+
+
+def term_count():
+    """Returns the number of distinct terms which currently exist."""
+    return len(_terms)
+
+
+def set_meter(meter):
+    """Sets the meter of the current thread (an object with a `charge`
+    method, which is given the number of terms rebuilt since it was last
+    called), or removes it, if it is None.  Returns the previous meter.
+
+    """
+    previous = getattr(_meters, 'meter', None)
+    _meters.meter = meter
+    return previous
+
+
+def get_meter():
+    """Returns the meter of the current thread, or None if it has none."""
+    return getattr(_meters, 'meter', None)
+
+
+def _intern(cls, key, init):
+    term = _terms.get(key)
+    if term is None:
+        with _terms_lock:
+            term = _terms.get(key)
+            if term is None:
+                term = object.__new__(cls)
+                init(term)
+                _terms[key] = term
+    return term
+
 
 class Term(object):
-    def __init__(self, constructor, subterms=None):
-        if subterms is None:
-            subterms = []
-        self.constructor = constructor
-        self.subterms = subterms
+    __slots__ = ('constructor', 'subterms', '_hash', '_ground', '_atoms', '__weakref__')
+
+    def __new__(cls, constructor, subterms=None):
+        subterms = tuple(subterms) if subterms else ()
+
+        def init(term):
+            term.constructor = constructor
+            term.subterms = subterms
+            term._hash = hash((constructor, subterms))
+            term._ground = all(subterm.is_ground() for subterm in subterms)
+            term._atoms = None
+
+        return _intern(cls, (cls, constructor, subterms), init)
+
+    def __reduce__(self):
+        # pickled as a flat table of its distinct subterms, as pickling the
+        # nested terms directly would recurse as deeply as they are nested
+        if not self.subterms:
+            return (self.__class__, (self.constructor,))
+        return (_unflatten, (_flatten(self),))
 
     def __str__(self):
-        if len(self.subterms) == 0:
-            return self.constructor
-        return "%s(%s)" % (self.constructor, ', '.join([str(s) for s in self.subterms]))
+        return _render(self, _str_parts)
 
     def __repr__(self):
-        if self.subterms:
-            return "%s(%r, subterms=%r)" % (
-                self.__class__.__name__, self.constructor, self.subterms
-            )
-        else:
-            return "%s(%r)" % (
-                self.__class__.__name__, self.constructor
-            )
-
-    def __eq__(self, other):
-        if not isinstance(other, Term):
-            return False
-        if self.constructor != other.constructor:
-            return False
-        if len(self.subterms) != len(other.subterms):
-            return False
-        for (st1, st2) in zip(self.subterms, other.subterms):
-            if st1 != st2:
-                return False
-        return True
-
-    def __ne__(self, other):
-        return not self.__eq__(other)
+        return _render(self, _repr_parts)
 
     def __hash__(self):
-        return hash(str(self))
+        return self._hash
 
     def is_atom(self):
         return len(self.subterms) == 0
 
-    def is_ground(term):
-        for subterm in term.subterms:
-            if not subterm.is_ground():
-                return False
-        return True
+    def is_ground(self):
+        return self._ground
 
     def contains(self, other):
-        if self == other:
-            return True
-        for st in self.subterms:
-            if st.contains(other):
+        seen = set()
+        stack = [self]
+        while stack:
+            term = stack.pop()
+            if term is other:
                 return True
+            if term.__class__ is Term and term.subterms and term not in seen:
+                seen.add(term)
+                stack.extend(term.subterms)
         return False
 
     def replace(self, old, new):
-        if self == old:
-            return new
-        else:
-            return Term(self.constructor, subterms=[subterm.replace(old, new) for subterm in self.subterms])
+        def leaf(term):
+            if term is old:
+                return new
+            return None if term.__class__ is Term else term
+        return rewrite(self, leaf)
 
     def match(self, term, unifier):
-        if self.constructor != term.constructor:
-            raise ValueError("`%s` != `%s`" % (self.constructor, term.constructor))
-        if len(self.subterms) != len(term.subterms):
-            raise ValueError("`%s` != `%s`" % (len(self.subterms), len(term.subterms)))
-        for (subpat, subterm) in zip(self.subterms, term.subterms):
-            subpat.match(subterm, unifier)
+        # the pairs are matched in the same order as by a recursive,
+        # left-to-right traversal, so that a mismatch is reported at the same
+        # place, and variables are bound in the same order
+        stack = [(self, term)]
+        while stack:
+            (pattern, term) = stack.pop()
+            if pattern.__class__ is not Term:
+                pattern.match(term, unifier)
+                continue
+            if pattern is term and pattern._ground:
+                continue
+            if pattern.constructor != term.constructor:
+                raise ValueError("`%s` != `%s`" % (pattern.constructor, term.constructor))
+            if len(pattern.subterms) != len(term.subterms):
+                raise ValueError("`%s` != `%s`" % (len(pattern.subterms), len(term.subterms)))
+            stack.extend(reversed(list(zip(pattern.subterms, term.subterms))))
 
     def subst(self, unifier):
-        return Term(self.constructor, subterms=[subterm.subst(unifier) for subterm in self.subterms])
+        def leaf(term):
+            if term.__class__ is Term:
+                return term if term._ground else None
+            return term.subst(unifier)
+        return rewrite(self, leaf)
 
     def resolve_substs(self, unifier):
-        return Term(self.constructor, subterms=[subterm.resolve_substs(unifier) for subterm in self.subterms])
+        def leaf(term):
+            if term.__class__ is Term:
+                return None if term.subterms else term
+            return term.resolve_substs(unifier)
+        return rewrite(self, leaf)
 
     def collect_atoms(self, atoms):
-        if self.is_atom():
-            atoms.add(self)
-        else:
-            for subterm in self.subterms:
-                subterm.collect_atoms(atoms)
+        atoms.update(self.atoms())
+
+    def atoms(self):
+        """Returns a tuple of the distinct atoms in this term, in the order
+        in which they first occur.  This is computed once, visiting each
+        distinct subterm once, and kept on the term.
+
+        """
+        atoms = self._atoms
+        if atoms is None:
+            atoms = []
+            seen = set()
+            stack = [self]
+            while stack:
+                term = stack.pop()
+                if term in seen:
+                    continue
+                seen.add(term)
+                if term.__class__ is Term:
+                    if term.subterms:
+                        stack.extend(reversed(term.subterms))
+                    else:
+                        atoms.append(term)
+            atoms = tuple(atoms)
+            self._atoms = atoms
+        return atoms
 
 
 class Var(object):
-    def __init__(self, name):
+    __slots__ = ('name', '__weakref__')
+
+    def __new__(cls, name):
         assert name[0].isupper()
-        self.name = name
+
+        def init(var):
+            var.name = name
+
+        # a Var is nothing but its name, so the name alone serves as its key
+        return _intern(cls, name, init)
+
+    def __reduce__(self):
+        return (self.__class__, (self.name,))
 
     def __str__(self):
         return self.name
@@ -97,11 +200,6 @@ class Var(object):
     def __repr__(self):
         return "%s(%r)" % (self.__class__.__name__, self.name)
 
-    def __eq__(self, other):
-        if not isinstance(other, Var):
-            return False
-        return self.name == other.name
-
     def __hash__(self):
         return hash(self.name)
 
@@ -113,7 +211,9 @@ class Var(object):
 
     def match(self, term, unifier):
         if self.name in unifier:
-            unifier[self.name].match(term, unifier)
+            bound = unifier[self.name]
+            if bound is not term:
+                bound.match(term, unifier)
         else:
             unifier[self.name] = term
 
@@ -126,27 +226,45 @@ class Var(object):
     def collect_atoms(self, atoms):
         pass
 
+    def atoms(self):
+        return ()
+
 
 class Substor(object):
-    def __init__(self, subterm, substs):
-        self.subterm = subterm
-        self.substs = substs  # list of pairs of terms
+    __slots__ = ('subterm', 'substs', '_hash', '__weakref__')
+
+    def __new__(cls, subterm, substs):
+        substs = tuple(tuple(pair) for pair in substs)  # pairs of terms
+
+        def init(substor):
+            substor.subterm = subterm
+            substor.substs = substs
+            substor._hash = hash((subterm, substs))
+
+        return _intern(cls, (cls, subterm, substs), init)
+
+    def __reduce__(self):
+        return (self.__class__, (self.subterm, list(self.substs)))
 
     def __str__(self):
         substs_str = ", ".join(["%s -> %s" % (k, v) for k, v in self.substs])
         return "%s[%s]" % (self.subterm, substs_str)
 
     def __repr__(self):
-        return "%s(%r, %r)" % (self.__class__.__name__, self.subterm, self.substs)
+        return "%s(%r, %r)" % (self.__class__.__name__, self.subterm, list(self.substs))
+
+    def __hash__(self):
+        return self._hash
 
     def resolve_substs(self, unifier):
         instance = self.subterm
         for lhs, rhs in self.substs:
             lhs = lhs.subst(unifier)
             rhs = rhs.subst(unifier)
-            if instance.contains(rhs):
+            try:
+                instance = replace_unless_occurs(instance, lhs, rhs)
+            except Occurs:
                 raise ValueError("'%s' already occurs in '%s'" % (rhs, instance))
-            instance = instance.replace(lhs, rhs)
         return instance
 
     def is_ground(self):
@@ -154,3 +272,230 @@ class Substor(object):
 
     def subst(self, unifier):
         return Substor(self.subterm.subst(unifier), self.substs)
+
+
+def rewrite(term, leaf, build=Term):
+    """Rebuilds the term from the bottom up.  `leaf` is called on each
+    distinct subterm, from the top down; if it returns something other than
+    None, that replaces the subterm, and otherwise the subterm (which must be
+    a Term) is rebuilt from its rewritten subterms, by calling `build` with
+    its constructor and the list of them.  A subterm whose subterms are all
+    unchanged is returned as it is, rather than rebuilt.
+
+    """
+    # Subterms are remembered by id (the term keeps them all alive until
+    # this returns), which is much quicker than hashing them.  A term is
+    # rebuilt when the 1-tuple holding it comes off the stack, by which time
+    # all of its subterms have been.
+    meter = getattr(_meters, 'meter', None)
+    rebuilt = 0
+    done = {}
+    stack = [term]
+    while stack:
+        node = stack.pop()
+        if node.__class__ is tuple:
+            node = node[0]
+            subterms = [done[id(subterm)] for subterm in node.subterms]
+            result = node
+            for (subterm, rewritten) in zip(node.subterms, subterms):
+                if subterm is not rewritten:
+                    result = build(node.constructor, subterms)
+                    break
+            done[id(node)] = result
+            if meter is not None:
+                rebuilt += 1
+                if rebuilt == METER_INTERVAL:
+                    meter.charge(rebuilt)
+                    rebuilt = 0
+            continue
+        if id(node) in done:
+            continue
+        result = leaf(node)
+        if result is not None:
+            done[id(node)] = result
+            continue
+        stack.append((node,))
+        stack.extend(reversed(node.subterms))
+    if rebuilt:
+        meter.charge(rebuilt)
+    return done[id(term)]
+
+
+def partial_subst(term, unifier):
+    """Like `term.subst(unifier)`, but leaves variables which are not bound
+    by the unifier in place.
+
+    """
+    def leaf(term):
+        if term.__class__ is Var:
+            return unifier.get(term.name, term)
+        if term.__class__ is not Term or term._ground:
+            return term
+        return None
+    return rewrite(term, leaf)
+
+
+def has_substs(term):
+    """Returns True if the term has any substitutions (Substors) in it.
+    (A Substor may be ground, so ground terms are searched too.)
+
+    """
+    stack = [term]
+    seen = set()
+    while stack:
+        term = stack.pop()
+        if term.__class__ is Substor:
+            return True
+        if term.__class__ is Term and term.subterms and term not in seen:
+            seen.add(term)
+            stack.extend(term.subterms)
+    return False
+
+
+def digest(term, digests):
+    """Returns a digest (a SHA-1 hash) of the structure of the term, which
+    is the same in every process.  `digests` is a dict in which the digests
+    of the term and its subterms are remembered.
+
+    """
+    result = digests.get(term)
+    if result is not None:
+        return result
+    # digests are made from the digests of the subterms, which are made
+    # first, using an explicit stack so that deep terms can be digested
+    stack = [term]
+    while stack:
+        term = stack[-1]
+        if term in digests:
+            stack.pop()
+            continue
+        if isinstance(term, Term):
+            children = term.subterms
+        elif isinstance(term, Var):
+            children = ()
+        else:
+            assert isinstance(term, Substor)
+            children = (term.subterm,) + tuple([t for pair in term.substs for t in pair])
+        pending = [child for child in children if child not in digests]
+        if pending:
+            stack.extend(pending)
+            continue
+        stack.pop()
+        h = hashlib.sha1()
+        if isinstance(term, Term):
+            h.update(('T%s(' % term.constructor).encode('utf-8'))
+        elif isinstance(term, Var):
+            h.update(('V%s' % term.name).encode('utf-8'))
+        else:
+            h.update(b'S')
+        for child in children:
+            h.update(digests[child])
+        digests[term] = h.digest()
+    return digests[term]
+
+
+def _str_parts(term):
+    if term.__class__ is not Term:
+        return [str(term)]
+    if not term.subterms:
+        return [term.constructor]
+    parts = [term.constructor + '(']
+    for subterm in term.subterms:
+        parts.append(subterm)
+        parts.append(', ')
+    parts[-1] = ')'
+    return parts
+
+
+def _repr_parts(term):
+    if term.__class__ is not Term:
+        return [repr(term)]
+    if not term.subterms:
+        return ["%s(%r)" % (term.__class__.__name__, term.constructor)]
+    parts = ["%s(%r, subterms=[" % (term.__class__.__name__, term.constructor)]
+    for subterm in term.subterms:
+        parts.append(subterm)
+        parts.append(', ')
+    parts[-1] = '])'
+    return parts
+
+
+def _render(term, parts_of):
+    """Returns the text of the term.  `parts_of` gives the parts of the text
+    of a term: strings, and subterms whose text goes in their place.
+
+    """
+    out = []
+    stack = [term]
+    while stack:
+        part = stack.pop()
+        if isinstance(part, (Term, Var, Substor)):
+            stack.extend(reversed(parts_of(part)))
+        else:
+            out.append(part)
+    return ''.join(out)
+
+
+def _flatten(term):
+    """Returns a list describing the distinct subterms of the term, each
+    after its own subterms: a subterm is a (constructor, indices) pair, where
+    `indices` are the positions of its subterms in the list, or anything
+    else (a Var or Substor) as it is.
+
+    """
+    index = {}
+    table = []
+    stack = [term]
+    while stack:
+        node = stack[-1]
+        if node in index:
+            stack.pop()
+            continue
+        if node.__class__ is Term:
+            pending = [subterm for subterm in node.subterms if subterm not in index]
+            if pending:
+                stack.extend(pending)
+                continue
+            entry = (node.constructor, tuple([index[subterm] for subterm in node.subterms]))
+        else:
+            entry = node
+        stack.pop()
+        index[node] = len(table)
+        table.append(entry)
+    return table
+
+
+def _unflatten(table):
+    terms = []
+    for entry in table:
+        if entry.__class__ is tuple:
+            entry = Term(entry[0], [terms[i] for i in entry[1]])
+        terms.append(entry)
+    return terms[-1]
+
+
+class Occurs(Exception):
+    pass
+
+
+def replace_unless_occurs(term, old, new):
+    """Returns the term with every occurrence of `old` replaced by `new`,
+    or raises Occurs if `new` already occurs in the term.  This is the same
+    as checking `term.contains(new)` and then calling `term.replace(old,
+    new)`, but it is done in a single traversal, visiting each distinct
+    subterm once (terms are shared) and returning unchanged subterms as they
+    are, rather than rebuilding them.
+
+    """
+    def leaf(term):
+        if term is new:
+            raise Occurs()
+        if term is old:
+            if old.contains(new):
+                raise Occurs()
+            return new
+        if term.__class__ is not Term or not term.subterms:
+            return term
+        return None
+
+    return rewrite(term, leaf)
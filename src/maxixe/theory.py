@@ -0,0 +1,478 @@
+# encoding: UTF-8
+
+from maxixe.checker import ProofStructureError, ReasoningError
+from maxixe.terms import Term, Var, Substor, METER_INTERVAL, digest, get_meter, has_substs, rewrite
+
+
+# A Theory is the set of constructors which a proof has declared to be
+# associative, commutative, or both (see "Constructors" in doc/Maxixe.md.)
+# Terms are kept in a normal form in which such terms are equal exactly when
+# they are the same term (terms being hash-consed, equality is identity):
+#
+# *   the subterms of a term with an associative constructor which have the
+#     same constructor are replaced by their own subterms, so that
+#     `and(a, and(b, c))` and `and(and(a, b), c)` are both `and(a, b, c)`;
+# *   the subterms of a term with a commutative constructor are sorted, so
+#     that `and(b, a)` is `and(a, b)`.
+#
+# Subterms are sorted by their constructor, then by the number of their
+# subterms, then by a digest of their structure, which is the same in every
+# process, so that the normal form of a term is too (a proof may be
+# compiled in one process and checked in another, or checked across several.)
+#
+# A hypothesis matches a term if some unifier makes them equal in the
+# theory, and there may be more than one: `and(P, Q)` matches `and(a, b, c)`
+# with P bound to `a` and Q to `and(b, c)`, or to `b` and `and(a, c)`, and so
+# on.  So when a step is checked, the rule's conclusion is matched against
+# the step's term before its hypotheses are matched against its arguments;
+# this binds most of the variables, usually leaving only one way to match
+# each hypothesis, however many subterms the terms have.
+#
+# When it cannot (the conclusion of a rule such as `and(P, Q) |- P[X -> Y]`
+# has substitutions in it), every way of matching the hypotheses is tried
+# until one gives the step's term, and there are exponentially many ways to
+# match `and(P, Q)` against a wide term.  So the ways tried are charged to
+# the thread's meter, if it has one (see `maxixe.budget`), as if each were
+# a term node rebuilt, so that a budget of term nodes limits them too.
+
+
+class Theory(object):
+    def __init__(self):
+        self.constructors = {}
+        self.signature = ()
+        self.digests = {}
+        self.normal = {}
+        self.rules = {}
+        self.applicable = {}
+
+    def __len__(self):
+        return len(self.constructors)
+
+    def __getstate__(self):
+        return {'constructors': self.constructors}
+
+    def __setstate__(self, state):
+        self.__init__()
+        for (constructor, (associative, commutative)) in state['constructors'].items():
+            self.declare(constructor, associative, commutative)
+
+    def declare(self, constructor, associative=False, commutative=False):
+        if constructor in self.constructors:
+            raise ValueError("'%s' has already been declared as a constructor" % constructor)
+        if not (associative or commutative):
+            raise ValueError("'%s' must be declared associative, commutative, or both" % constructor)
+        self.constructors[constructor] = (associative, commutative)
+        self.signature = tuple(sorted(self.constructors.items()))
+
+    def order(self, term):
+        if term.__class__ is Term:
+            if not term.subterms:
+                return (term.constructor, 0, b'')
+            return (term.constructor, len(term.subterms), digest(term, self.digests))
+        return (u'', 0, digest(term, self.digests))
+
+    def make(self, constructor, subterms):
+        """Returns the normal form of the term with the given constructor
+        and (normal) subterms.
+
+        """
+        kind = self.constructors.get(constructor)
+        if kind is None:
+            return Term(constructor, subterms)
+        (associative, commutative) = kind
+        if associative:
+            flattened = []
+            for subterm in subterms:
+                if subterm.__class__ is Term and subterm.constructor == constructor and subterm.subterms:
+                    flattened.extend(subterm.subterms)
+                else:
+                    flattened.append(subterm)
+            subterms = flattened
+        if commutative:
+            subterms = sorted(subterms, key=self.order)
+        return Term(constructor, subterms)
+
+    def normalize(self, term):
+        """Returns the normal form of the term, which may contain variables
+        and substitutions.  The normal forms of terms are remembered.
+
+        """
+        result = self.normal.get(term)
+        if result is not None:
+            return result
+        stack = [term]
+        while stack:
+            node = stack[-1]
+            if node in self.normal:
+                stack.pop()
+                continue
+            if node.__class__ is Term:
+                children = node.subterms
+            elif node.__class__ is Substor:
+                children = (node.subterm,) + tuple([t for pair in node.substs for t in pair])
+            else:
+                children = ()
+            pending = [child for child in children if child not in self.normal]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            if node.__class__ is Term:
+                result = node
+                if node.subterms:
+                    result = self.make(node.constructor, [self.normal[child] for child in node.subterms])
+            elif node.__class__ is Substor:
+                result = Substor(self.normal[node.subterm], [
+                    (self.normal[lhs], self.normal[rhs]) for (lhs, rhs) in node.substs
+                ])
+            else:
+                result = node
+            self.normal[node] = result
+        return self.normal[term]
+
+    def applies_to(self, rule):
+        """Returns True if any of the declared constructors occurs in the
+        rule, or its conclusion has substitutions in it.  If neither is so,
+        its hypotheses can only match a term in the ways they would if no
+        constructors had been declared, and its instances are made only of
+        subterms of the (normal) terms they match, so are already in normal
+        form; so it can be instantiated as usual.  But a substitution can
+        put a term in a place where it is not in normal form, such as `z`
+        in place of `a` in `and(a, b)`.
+
+        """
+        applies = self.applicable.get(rule)
+        if applies is None:
+            terms = [hypothesis.term for hypothesis in rule.hypotheses] + [rule.conclusion]
+            applies = has_substs(rule.conclusion) or not constructors_of(terms).isdisjoint(self.constructors)
+            self.applicable[rule] = applies
+        return applies
+
+    def rule(self, rule):
+        """Returns the normal forms of the terms of the rule's hypotheses and
+        of its conclusion, and whether the conclusion can be matched against
+        the term of a step which uses the rule (which it can unless it has
+        substitutions in it, or variables which are not in any hypothesis.)
+
+        """
+        normal = self.rules.get(rule)
+        if normal is None:
+            hypotheses = [self.normalize(hypothesis.term) for hypothesis in rule.hypotheses]
+            conclusion = self.normalize(rule.conclusion)
+            variables = set()
+            for hypothesis in hypotheses:
+                variables.update(variables_of(hypothesis))
+            direct = not has_substs(conclusion) and variables_of(conclusion) <= variables
+            normal = (hypotheses, conclusion, direct)
+            self.rules[rule] = normal
+        return normal
+
+    def unify(self, rule, with_terms, term=None):
+        """Returns a unifier which, in this theory, makes the hypotheses of
+        the rule equal to the given terms, and the instance of the rule's
+        conclusion that it gives, as a pair.  If `term` is given, a unifier
+        whose instance is `term` is returned if there is one; otherwise, the
+        first unifier found is.
+
+        """
+        (hypotheses, conclusion, direct) = self.rule(rule)
+        pairs = list(zip(hypotheses, with_terms))
+        if term is not None and direct:
+            # if this finds nothing, the step does not follow, and the
+            # instance the hypotheses give is found to report it
+            for unifier in self.matches(self.arrange([(conclusion, term)] + pairs), {}):
+                return (unifier, self.instance(conclusion, unifier))
+            term = None
+        first = None
+        for unifier in self.matches(self.arrange(pairs), {}):
+            instance = self.instance(conclusion, unifier)
+            if term is None or instance is term:
+                return (unifier, instance)
+            if first is None:
+                first = (unifier, instance)
+        if first is not None:
+            return first
+        for (n, (hypothesis, with_term)) in enumerate(zip(rule.hypotheses, with_terms)):
+            for unifier in self.matches(pairs[:n + 1], {}):
+                break
+            else:
+                raise ReasoningError("could not match '%s' with '%s'" % (hypothesis.term, with_term))
+
+    def arrange(self, pairs):
+        """Returns the pairs with those which can only be matched in one
+        way first, so that they bind what variables they can before there
+        is any choice to be made.
+
+        """
+        chosen = []
+        rest = []
+        for (pattern, term) in pairs:
+            if pattern.__class__ is Term and not pattern._ground and pattern.constructor in self.constructors:
+                rest.append((pattern, term))
+            else:
+                chosen.append((pattern, term))
+        return chosen + rest
+
+    def instantiate(self, rule, with_terms, term=None):
+        return self.unify(rule, with_terms, term)[1]
+
+    def instance(self, conclusion, unifier):
+        def leaf(term):
+            if term.__class__ is Term:
+                return term if term._ground else None
+            return term.subst(unifier)
+
+        instance = rewrite(conclusion, leaf, self.make)
+        if not instance.is_ground():
+            raise ProofStructureError("Not all variables replaced during rule instantiation")
+        if instance.__class__ is Term and instance._ground:
+            return instance
+        return self.normalize(instance.resolve_substs(unifier))
+
+    def matches(self, pairs, unifier):
+        """Yields each unifier, extending the given one, which in this theory
+        makes each pattern in the list of (pattern, term) pairs equal to its
+        term.  The terms must be in normal form.
+
+        Rather than recursing, the matcher keeps the pairs still to be
+        matched in a linked list of (pair, rest) cells, which the different
+        ways of going on from a point share, and a stack of the points where
+        there is more than one way to go on, each with an iterator over the
+        lists of pairs which each of those ways must match first.
+
+        Each way tried is charged to the thread's meter, if it has one, every
+        METER_INTERVAL ways.
+
+        """
+        meter = get_meter()
+        tried = 0
+        choices = [(iter([pairs]), None, unifier)]
+        while choices:
+            (ways, pending, unifier) = choices[-1]
+            way = next(ways, None)
+            if way is None:
+                choices.pop()
+                continue
+            if meter is not None:
+                tried += 1
+                if tried == METER_INTERVAL:
+                    meter.charge(tried)
+                    tried = 0
+            for pair in reversed(way):
+                pending = (pair, pending)
+            while pending is not None:
+                ((pattern, term), pending) = pending
+                if pattern.__class__ is Var:
+                    bound = unifier.get(pattern.name)
+                    if bound is None:
+                        unifier = dict(unifier)
+                        unifier[pattern.name] = term
+                    elif bound is not term:
+                        break
+                    continue
+                if pattern.__class__ is not Term or term.__class__ is not Term:
+                    break
+                if pattern._ground:
+                    if pattern is not term:
+                        break
+                    continue
+                if pattern.constructor != term.constructor:
+                    break
+                kind = self.constructors.get(pattern.constructor)
+                if kind is None:
+                    if len(pattern.subterms) != len(term.subterms):
+                        break
+                    for pair in reversed(list(zip(pattern.subterms, term.subterms))):
+                        pending = (pair, pending)
+                    continue
+                if kind[1]:
+                    ways = self.multiset_ways(pattern, term, unifier, kind[0])
+                else:
+                    ways = self.sequence_ways(pattern, term, unifier)
+                choices.append((ways, pending, unifier))
+                break
+            else:
+                yield unifier
+        if tried:
+            meter.charge(tried)
+
+    def group(self, constructor, subterms):
+        """Returns the term, in normal form, that the given subterms (which
+        are in order) make under the given associative constructor: the
+        subterm itself, if there is only one.
+
+        """
+        if len(subterms) == 1:
+            return subterms[0]
+        return Term(constructor, subterms)
+
+    def sequence_ways(self, pattern, term, unifier):
+        """Yields the ways to match a pattern with an associative, but not
+        commutative, constructor against a term with the same constructor:
+        the first subterm of the pattern, if it is a variable, matches each
+        run of subterms at the start of the term in turn, and otherwise
+        matches the first subterm of the term; the rest of the pattern then
+        matches the rest of the term.
+
+        """
+        constructor = pattern.constructor
+        (first, rest) = (pattern.subterms[0], pattern.subterms[1:])
+        subterms = term.subterms
+        if not rest:
+            yield [(first, self.group(constructor, subterms))]
+            return
+        longest = len(subterms) - len(rest)
+        if first.__class__ is not Var:
+            longest = min(longest, 1)
+        elif first.name in unifier:
+            bound = unifier[first.name]
+            if bound.__class__ is Term and bound.constructor == constructor and bound.subterms:
+                longest = min(longest, len(bound.subterms))
+        for length in range(1, longest + 1):
+            yield [
+                (first, self.group(constructor, subterms[:length])),
+                (self.group(constructor, rest), self.group(constructor, subterms[length:])),
+            ]
+
+    def multiset_ways(self, pattern, term, unifier, associative):
+        """Yields the ways to match a pattern with a commutative constructor
+        against a term with the same constructor.  The ground subterms of the
+        pattern, and the variables which are already bound, must each be
+        found among the subterms of the term, and are taken out.  Then one of
+        the subterms left in the pattern (one which is not a variable, if
+        there is one) matches each of the subterms left in the term which
+        could match it in turn (or, if it is a variable and the constructor
+        is associative, each group of them), and the rest of the pattern then
+        matches the rest of the term.
+
+        """
+        constructor = pattern.constructor
+        left = {}
+        for subterm in term.subterms:
+            left[subterm] = left.get(subterm, 0) + 1
+        rest = []
+        for subpattern in pattern.subterms:
+            if subpattern.__class__ is Var and subpattern.name in unifier:
+                bound = unifier[subpattern.name]
+                if associative and bound.__class__ is Term and bound.constructor == constructor and bound.subterms:
+                    taken = bound.subterms
+                else:
+                    taken = (bound,)
+            elif subpattern.__class__ is Term and subpattern._ground:
+                taken = (subpattern,)
+            else:
+                rest.append(subpattern)
+                continue
+            for subterm in taken:
+                count = left.get(subterm, 0)
+                if count == 0:
+                    return
+                left[subterm] = count - 1
+        # the subterms left, in order, as (subterm, count) pairs
+        left = [(subterm, left[subterm]) for subterm in unique(term.subterms) if left[subterm]]
+        size = sum([count for (subterm, count) in left])
+        if not rest:
+            if size == 0:
+                yield []
+            return
+        if size < len(rest) or (size > len(rest) and not associative):
+            return
+        first = rest[0]
+        for subpattern in rest:
+            if subpattern.__class__ is not Var:
+                first = subpattern
+                break
+        rest = list(rest)
+        rest.remove(first)
+
+        def remainder(taken):
+            subterms = []
+            for (subterm, count) in left:
+                subterms.extend([subterm] * (count - taken.get(subterm, 0)))
+            return (self.group(constructor, rest) if rest else None, subterms)
+
+        if first.__class__ is not Var or not associative:
+            for (subterm, count) in left:
+                if first.__class__ is Term and (subterm.__class__ is not Term or subterm.constructor != first.constructor):
+                    continue
+                (rest_pattern, subterms) = remainder({subterm: 1})
+                way = [(first, subterm)]
+                if rest_pattern is not None:
+                    way.append((rest_pattern, self.group(constructor, subterms)))
+                yield way
+            return
+
+        if not rest:
+            yield [(first, self.group(constructor, [s for (subterm, count) in left for s in [subterm] * count]))]
+            return
+        # each non-empty group of the subterms left which leaves enough for
+        # the rest of the pattern, by the number of each subterm it takes
+        counts = [0] * len(left)
+        while True:
+            i = 0
+            while i < len(left) and counts[i] == left[i][1]:
+                counts[i] = 0
+                i += 1
+            if i == len(left):
+                return
+            counts[i] += 1
+            taken = sum(counts)
+            if size - taken < len(rest):
+                continue
+            group = []
+            for ((subterm, count), n) in zip(left, counts):
+                group.extend([subterm] * n)
+            (rest_pattern, subterms) = remainder(dict([(left[j][0], counts[j]) for j in range(len(left))]))
+            yield [(first, self.group(constructor, group)), (rest_pattern, self.group(constructor, subterms))]
+
+
+def unique(terms):
+    seen = set()
+    result = []
+    for term in terms:
+        if term not in seen:
+            seen.add(term)
+            result.append(term)
+    return result
+
+
+def constructors_of(terms):
+    constructors = set()
+    stack = list(terms)
+    seen = set()
+    while stack:
+        term = stack.pop()
+        if term in seen:
+            continue
+        seen.add(term)
+        if term.__class__ is Term:
+            constructors.add(term.constructor)
+            stack.extend(term.subterms)
+        elif term.__class__ is Substor:
+            stack.append(term.subterm)
+            for (lhs, rhs) in term.substs:
+                stack.append(lhs)
+                stack.append(rhs)
+    return constructors
+
+
+def variables_of(term):
+    variables = set()
+    stack = [term]
+    seen = set()
+    while stack:
+        term = stack.pop()
+        if term in seen:
+            continue
+        seen.add(term)
+        if term.__class__ is Var:
+            variables.add(term.name)
+        elif term.__class__ is Term:
+            if not term._ground:
+                stack.extend(term.subterms)
+        else:
+            stack.append(term.subterm)
+            for (lhs, rhs) in term.substs:
+                stack.append(lhs)
+                stack.append(rhs)
+    return variables
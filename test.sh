@@ -1,5 +1,9 @@
 #!/bin/sh
 
+# By default, the tests are run in-process by src/maxixe/falderal.py, once
+# under each version of Python found.  With --falderal, they are run by
+# falderal instead, which starts bin/maxixe anew for each test.
+
 APPLIANCES=""
 MISSING=""
 
@@ -20,4 +24,11 @@ if [ "x${MISSING}" = "x23" ]; then
     exit 1
 fi
 
-falderal $APPLIANCES doc/Maxixe.md doc/Examples.md || exit 1
+if [ "x$1" = "x--falderal" ]; then
+    falderal $APPLIANCES doc/Maxixe.md doc/Examples.md doc/Usage.md || exit 1
+else
+    for APPLIANCE in $APPLIANCES; do
+        PYTHON=`basename $APPLIANCE .md | sed -e 's/maxixe\.py/python/'`
+        PYTHONPATH=src $PYTHON -m maxixe.falderal $APPLIANCE doc/Maxixe.md doc/Examples.md doc/Usage.md || exit 1
+    done
+fi